@@ -1,141 +1,327 @@
 import streamlit as st
-import pickle
+import html
 import re
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-import nltk
-import os
-import ssl
+import threading
 import time
-import random
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from prediction_cache import PredictionCache
+
+# pandas, scikit-learn, pyarrow and nltk take about a second to import, so
+# they and the modules that pull them in (inference, dataset_cache, the
+# indexes) are imported inside the functions that use them. The page renders
+# straight away; the model loads in the background and the dataset only
+# when a view needs it.
+
+class BackgroundLoader:
+    """Load named resources in a background thread, each at most once.
+
+    prefetch() starts a load without waiting and get() waits for it. Loads
+    run one at a time in submission order, so the dataset cache is built
+    before the indexes that read it. A failed load is retried on the next get().
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="resource-loader")
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def prefetch(self, name, load):
+        with self._lock:
+            future = self._futures.get(name)
+            if future is None:
+                future = self._futures[name] = self._executor.submit(load)
+        return future
+
+    def ready(self, name):
+        future = self._futures.get(name)
+        return future is not None and future.done() and future.exception() is None
+
+    def get(self, name, load):
+        future = self.prefetch(name, load)
+        try:
+            return future.result()
+        except Exception:
+            with self._lock:
+                if self._futures.get(name) is future:
+                    del self._futures[name]
+            raise
+
+# One loader per server process, shared by every session
+@st.cache_resource
+def load_background_loader():
+    return BackgroundLoader()
+
+def _load_model_handle():
+    import inference
+    import preprocessing
+    handle = inference.ModelHandle()
+    # Importing nltk for the stemmer takes most of a second; do it here, not on the first prediction
+    preprocessing.stem("warm")
+    metrics.set_gauge_once("model_ready_seconds", time.time() - metrics.REGISTRY.started)
+    return handle
+
+# Columns the search and user views need
+DATASET_VIEW_COLUMNS = ('target', 'user', 'text')
+
+def _load_dataset():
+    import dataset_cache
+    return dataset_cache.load_dataset(DATASET_VIEW_COLUMNS)
+
+def _load_search_index():
+    import search_index
+    return search_index.load_or_build()
+
+def _load_user_index():
+    import user_index
+    return user_index.load_or_build()
+
+# name -> (loader, description shown while it loads)
+DATASET_RESOURCES = {
+    "dataset": (_load_dataset, "dataset"),
+    "search_index": (_load_search_index, "search index"),
+    "user_index": (_load_user_index, "user index"),
+}
+
+# Start loading the dataset and the given indexes without waiting for them
+def prefetch_dataset_resources(names):
+    loader = load_background_loader()
+    for name in ("dataset",) + tuple(names):
+        loader.prefetch(name, DATASET_RESOURCES[name][0])
+
+# Wait for the dataset and the given indexes, with progress while they load.
+# Returns {name: resource or None if it failed to load}.
+def load_dataset_resources(names):
+    loader = load_background_loader()
+    names = ("dataset",) + tuple(names)
+    prefetch_dataset_resources(names[1:])
+    resources = {}
+    status = None
+    if not all(loader.ready(name) for name in names):
+        status = st.status("Loading the dataset...", expanded=False)
+    for name in names:
+        load, description = DATASET_RESOURCES[name]
+        if status is not None:
+            status.update(label=f"Loading the {description}...")
+        try:
+            resources[name] = loader.get(name, load)
+        except Exception as e:
+            st.error(f"Error loading {description}: {e}")
+            resources[name] = None
+    if status is not None:
+        status.update(label="Dataset ready", state="complete")
+    return resources
 
 # Custom stopwords handling to avoid downloading each time
 @st.cache_resource
 def load_stopwords():
+    import preprocessing
     try:
-        # Try to import stopwords directly
-        from nltk.corpus import stopwords
-        stop_words = stopwords.words('english')
-    except (ImportError, LookupError):
-        # If stopwords aren't available, download them with SSL workaround
-        try:
-            try:
-                _create_unverified_https_context = ssl._create_unverified_context
-            except AttributeError:
-                pass
-            else:
-                ssl._create_default_https_context = _create_unverified_https_context
-            
-            # Create NLTK data directory if it doesn't exist
-            nltk_data_dir = os.path.expanduser('~/nltk_data')
-            if not os.path.exists(nltk_data_dir):
-                os.makedirs(nltk_data_dir)
-                
-            nltk.download('stopwords')
-            from nltk.corpus import stopwords
-            stop_words = stopwords.words('english')
-        except Exception as e:
-            st.error(f"Error loading stopwords: {e}")
-            # Fallback to a basic list of common stopwords if download fails
-            stop_words = ['a', 'about', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 
-                         'has', 'he', 'in', 'is', 'it', 'its', 'of', 'on', 'that', 'the', 'to', 
-                         'was', 'were', 'will', 'with']
+        stop_words = preprocessing.load_stopwords()
+    except Exception as e:
+        st.error(f"Error loading stopwords: {e}")
+        # Fallback to a basic list of common stopwords if download fails
+        stop_words = preprocessing.BASIC_STOPWORDS
     return stop_words
 
-# Load model and vectorizer once
-@st.cache_resource
+# Load model and vectorizer once; the handle hot-swaps them when the files change
+def load_model_handle():
+    return load_background_loader().get("model", _load_model_handle)
+
 def load_model_and_vectorizer():
     try:
-        with open('model.pkl', 'rb') as model_file:
-            model = pickle.load(model_file)
-        with open('vectorizer.pkl', 'rb') as vectorizer_file:
-            vectorizer = pickle.load(vectorizer_file)
-        return model, vectorizer
+        if load_background_loader().ready("model"):
+            loaded = load_model_handle().get()
+        else:
+            with st.spinner("Loading the model..."):
+                loaded = load_model_handle().get()
+        return loaded.model, loaded.vectorizer, loaded.version
     except Exception as e:
         st.error(f"Error loading model or vectorizer: {e}")
         st.error("Make sure model.pkl and vectorizer.pkl files exist in the current directory.")
-        return None, None
+        return None, None, None
+
+# Disk-backed tier keeps predictions across Streamlit restarts
+PREDICTION_CACHE_DB = "prediction_cache.sqlite"
 
-# Load a sample of the dataset
-@st.cache_data
-def load_dataset_sample():
+@st.cache_resource
+def load_prediction_cache():
     try:
-        # Load a sample of the dataset (first 5000 rows)
-        dataset = pd.read_csv("training.1600000.processed.noemoticon.csv", 
-                             encoding='ISO-8859-1', 
-                             header=None, 
-                             nrows=1600000)  # Increased to get more users
-        
-        # Add column names
-        dataset.columns = ['target', 'id', 'date', 'flag', 'user', 'text']
-        
-        # Convert target: 0 = negative, 4 = positive
-        dataset['target'] = dataset['target'].map({0: "Negative", 4: "Positive"})
-        
-        return dataset
+        return PredictionCache(disk_path=PREDICTION_CACHE_DB)
+    except Exception as e:
+        st.warning(f"Prediction cache on disk unavailable, using memory only: {e}")
+        return PredictionCache()
+
+# Convert dataset rows to list of dictionaries, a column at a time.
+# "sentiment" starts as the dataset label; scoring replaces it and keeps the label.
+def _tweets_from_rows(rows):
+    labels = rows['target'].astype(str).tolist()
+    return [
+        {"text": text, "sentiment": label, "label": label, "user": user}
+        for text, label, user in zip(rows['text'].astype(str).tolist(), labels, rows['user'].astype(str).tolist())
+    ]
+
+# Sorted row ids of the tweets matching a search, from the index or by scanning
+def find_matching_rows(dataset, query, index=None):
+    import numpy as np
+
+    if index is not None:
+        return np.asarray(index.search(query, dataset['text']))
+    with metrics.timed("search_scan"):
+        return np.flatnonzero(dataset['text'].str.lower().str.contains(query.lower(), regex=False).to_numpy(dtype=bool))
+
+# Sorted row ids of a user's tweets: exact match first, then partial match
+def find_user_rows(dataset, username, index=None):
+    import numpy as np
+
+    if index is not None:
+        key_ids = index.match(username)
+        return np.asarray(index.rows_for(key_ids)) if len(key_ids) else np.empty(0, dtype=np.int64)
+    users = dataset['user'].str.lower()
+    with metrics.timed("user_scan"):
+        rows = np.flatnonzero((users == username.lower()).to_numpy(dtype=bool))
+        if len(rows) == 0:
+            rows = np.flatnonzero(users.str.contains(username.lower(), regex=False).to_numpy(dtype=bool))
+    return rows
+
+# Precomputed model scores of the whole dataset (written by score_corpus.py).
+# The ttl picks up a re-run of the job without restarting the app.
+@st.cache_resource(ttl=60)
+def load_corpus_scores():
+    import score_corpus
+    try:
+        return score_corpus.CorpusScores.load()
     except Exception as e:
-        st.error(f"Error loading dataset: {e}")
+        st.warning(f"Precomputed corpus scores unavailable: {e}")
         return None
 
-# Search for tweets in the dataset based on keywords
-def search_dataset_tweets(dataset, query, limit=5):
-    if dataset is None:
-        return []
-    
-    # Convert query to lowercase for case-insensitive matching
-    query = query.lower()
-    
-    # Filter dataset to find tweets containing the query
-    matching_tweets = dataset[dataset['text'].str.lower().str.contains(query)]
-    
-    # Get a sample of matching tweets
-    if len(matching_tweets) > limit:
-        matching_tweets = matching_tweets.sample(limit)
-    
-    # Convert to list of dictionaries
-    result = []
-    for _, row in matching_tweets.iterrows():
-        result.append({
-            "text": row['text'],
-            "sentiment": row['target'],
-            "user": row['user']
-        })
-    
-    return result
+# Show how often the model agrees with the dataset labels on a set of tweets
+def display_corpus_agreement(agreement, description):
+    if not agreement["tweets"]:
+        return
+    st.caption(f"Model agrees with the dataset label on {agreement['agreement']:.0%} of {description} "
+               f"(mean positive probability {agreement['mean_score']:.2f})")
 
-# Get tweets from a specific user
-def get_tweets_from_user(dataset, username, limit=5):
-    if dataset is None:
-        return []
-    
-    # Convert username to lowercase for case-insensitive matching
-    username_lower = username.lower()
-    
-    # Try exact match first
-    user_tweets = dataset[dataset['user'].str.lower() == username_lower]
-    
-    # If no exact match, try partial match
-    if len(user_tweets) == 0:
-        user_tweets = dataset[dataset['user'].str.lower().str.contains(username_lower)]
-    
-    # If still no matches, return empty
-    if len(user_tweets) == 0:
-        return []
-    
-    # Get a sample if we have more than the limit
-    if len(user_tweets) > limit:
-        user_tweets = user_tweets.sample(limit)
-    
-    # Convert to list of dictionaries
-    result = []
-    for _, row in user_tweets.iterrows():
-        result.append({
-            "text": row['text'],
-            "sentiment": row['target'],
-            "user": row['user']
-        })
-    
-    return result
+# Corpus dashboard: agreement, daily trends and per-token views from the precomputed rollups
+def display_corpus_dashboard(corpus_scores, tweet_index, stop_words, model_version):
+    if corpus_scores is None:
+        st.info("No precomputed scores yet. Run `python score_corpus.py` to score the whole dataset once.")
+        return
+    import pandas as pd
+
+    summary = corpus_scores.summary
+    if model_version is not None and summary["model_version"] != model_version:
+        st.warning(f"Scores were computed with model {summary['model_version']}, the app uses {model_version}. "
+                   "Re-run score_corpus.py to refresh them.")
+
+    columns = st.columns(3)
+    columns[0].metric("Tweets scored", f"{summary['tweets']:,}")
+    columns[1].metric("Model-label agreement", f"{summary['agreement']:.1%}")
+    columns[2].metric("Mean positive probability", f"{summary['mean_score']:.2f}")
+    st.dataframe(pd.DataFrame(
+        [[summary["true_negative"], summary["false_positive"]], [summary["false_negative"], summary["true_positive"]]],
+        index=["Labelled negative", "Labelled positive"], columns=["Predicted negative", "Predicted positive"],
+    ))
+
+    daily = corpus_scores.daily()
+    if len(daily):
+        st.subheader("Positive share per day")
+        st.line_chart(daily, x="day", y=["label positive", "model positive"])
+
+    if tweet_index is not None:
+        topic = st.text_input("Look up a word across the corpus")
+        if topic:
+            result = corpus_scores.for_token(topic.strip(), tweet_index)
+            if result is None:
+                st.warning(f"'{topic}' does not appear in the dataset")
+            else:
+                st.write(f"**{result['token']}** appears in {result['tweets']:,} tweets: "
+                         f"{result['predicted_positive_ratio']:.0%} predicted positive, "
+                         f"{result['label_positive_ratio']:.0%} labelled positive")
+        st.subheader("Most frequent words")
+        st.dataframe(pd.DataFrame(corpus_scores.top_tokens(tweet_index, 25, stop_words)), hide_index=True)
+
+# One live stream per server process, shared by every browser session
+@st.cache_resource
+def load_stream_holder():
+    return {"pipeline": None, "source": None}
+
+STREAM_SOURCES = ["Replay dataset", "Follow file", "Local socket"]
+
+def start_stream(holder, source, stop_words, cache, rate, path=None, port=9999):
+    import dataset_cache
+    import streaming
+
+    if holder["pipeline"] is not None:
+        holder["pipeline"].stop()
+    if source == "Replay dataset":
+        factory = lambda stop: streaming.replay_csv(dataset_cache.DATASET_CSV, rate, loop=True, stop=stop)
+    elif source == "Follow file":
+        factory = lambda stop: streaming.tail_file(path, stop=stop)
+    else:
+        factory = lambda stop: streaming.read_socket(port=port, stop=stop)
+    holder["pipeline"] = streaming.StreamPipeline(factory, load_model_handle().get, stop_words, cache=cache).start()
+    holder["source"] = source
+
+# Live stream view: controls plus a panel that polls the window aggregates
+def display_live_stream(stop_words, cache):
+    import streaming
+
+    holder = load_stream_holder()
+    source = st.selectbox("Stream source", STREAM_SOURCES)
+    rate = path = port = None
+    if source == "Replay dataset":
+        rate = st.slider("Tweets per second", 1, 2000, int(streaming.DEFAULT_RATE))
+    elif source == "Follow file":
+        path = st.text_input("File to follow (JSON lines with \"text\" and \"user\", or plain text)")
+    else:
+        port = st.number_input("Port on 127.0.0.1", 1024, 65535, 9999)
+
+    start_column, stop_column = st.columns(2)
+    if start_column.button("Start stream"):
+        if source == "Follow file" and not path:
+            st.warning("Please enter a file to follow.")
+        else:
+            start_stream(holder, source, stop_words, cache, rate=rate, path=path, port=port)
+    if stop_column.button("Stop stream") and holder["pipeline"] is not None:
+        holder["pipeline"].stop()
+
+    display_stream_aggregates(holder)
+
+@st.fragment(run_every=2)
+def display_stream_aggregates(holder):
+    pipeline = holder["pipeline"]
+    if pipeline is None:
+        st.info("Start a stream to see live sentiment.")
+        return
+    import pandas as pd
+
+    status = pipeline.status()
+    if status["error"]:
+        st.error(f"Stream error: {status['error']}")
+    ratio = status["positive_ratio"]
+    columns = st.columns(4)
+    columns[0].metric("Source", holder["source"] + ("" if status["running"] else " (stopped)"))
+    columns[1].metric(f"Tweets in last {status['window_minutes']} min", status["tweets_in_window"])
+    columns[2].metric("Positive", f"{ratio:.0%}" if ratio is not None else "-")
+    columns[3].metric("Dropped", status["dropped"])
+
+    per_minute = pipeline.window.per_minute()
+    if per_minute:
+        chart = pd.DataFrame(per_minute, columns=["minute", "positive", "tweets"])
+        chart["minute"] = pd.to_datetime(chart["minute"], unit="s")
+        chart["positive ratio"] = chart["positive"] / chart["tweets"]
+        st.line_chart(chart, x="minute", y="positive ratio")
+
+    users_column, keywords_column = st.columns(2)
+    for column, kind, title in ((users_column, "user", "Top users"), (keywords_column, "keyword", "Top keywords")):
+        top = pipeline.window.top(kind, 10)
+        column.markdown(f"**{title}**")
+        if top:
+            column.dataframe(pd.DataFrame(top)[["key", "tweets", "positive_ratio"]], hide_index=True)
+
+    display_sentiment_cards(list(pipeline.recent)[:5])
 
 # Dictionary of well-known users with pre-saved tweets
 KNOWN_USERS = {
@@ -229,20 +415,6 @@ KNOWN_USERS = {
     ]
 }
 
-# Define sentiment prediction function
-def predict_sentiment(text, model, vectorizer, stop_words):
-    # Preprocess text
-    cleaned_text = re.sub('[^a-zA-Z]', ' ', text)
-    cleaned_text = cleaned_text.lower()
-    cleaned_text = cleaned_text.split()
-    cleaned_text = [word for word in cleaned_text if word not in stop_words]
-    cleaned_text = ' '.join(cleaned_text)
-    
-    # Transform and predict
-    text_vector = vectorizer.transform([cleaned_text])
-    sentiment = model.predict(text_vector)
-    return "Negative" if sentiment == 0 else "Positive"
-
 # Sample tweets for testing when API fails
 SAMPLE_TWEETS = [
     {
@@ -280,6 +452,79 @@ def get_user_sample_tweets(username):
         }
     ]
 
+# Tweets with the live model's sentiment and probability, or None without a model.
+# With explain set, each tweet also carries the terms behind its prediction.
+def score_for_display(tweets, stop_words, cache, explain=False):
+    import inference
+
+    start = time.perf_counter()
+    model, vectorizer, model_version = load_model_and_vectorizer()
+    if model is None or vectorizer is None:
+        return None
+    if explain:
+        try:
+            return inference.explain_tweets(tweets, model, vectorizer, stop_words)
+        except ValueError as e:
+            st.warning(f"Explanations are not available: {e}")
+    scored = inference.score_tweets(tweets, model, vectorizer, stop_words, cache=cache, model_version=model_version)
+    # Includes waiting for the model when it is still loading in the background
+    metrics.set_gauge_once("first_prediction_seconds", time.perf_counter() - start)
+    return scored
+
+# Score tweets with the live model and show a card for each.
+# With explain set, cards highlight the words behind each prediction.
+def display_scored_tweets(tweets, stop_words, cache, explain=False):
+    scored = score_for_display(tweets, stop_words, cache, explain)
+    if scored is not None:
+        display_sentiment_cards(scored, stop_words)
+
+# Scored dataset tweets as one compact table
+def display_scored_table(tweets, stop_words, cache):
+    import pandas as pd
+
+    scored = score_for_display(tweets, stop_words, cache)
+    if scored is not None:
+        with metrics.timed("render"):
+            st.dataframe(pd.DataFrame({
+                "user": [tweet["user"] for tweet in scored],
+                "text": [tweet["text"] for tweet in scored],
+                "label": [tweet["label"] for tweet in scored],
+                "predicted": [tweet["sentiment"] for tweet in scored],
+                "probability": [tweet["probability"] for tweet in scored],
+            }), hide_index=True, width="stretch")
+
+PAGE_SIZES = [10, 25, 50, 100]
+
+# Page through sorted dataset rows. Each page keeps the cursor it started from in
+# session state, so reruns show the same page and every page costs the same.
+def display_result_pages(key, dataset, rows, stop_words, cache, explain=False):
+    import search_index
+
+    cursors = st.session_state.setdefault(f"{key}_cursors", [-1])
+    page_size_column, view_column = st.columns(2)
+    page_size = page_size_column.selectbox("Tweets per page", PAGE_SIZES, key=f"{key}_page_size",
+                                           on_change=first_result_page, args=(key,))
+    view = view_column.radio("Show as", ["Cards", "Table"], horizontal=True, key=f"{key}_view")
+    page, start, next_cursor = search_index.page_rows(rows, cursors[-1], page_size)
+    st.caption(f"Tweets {start + 1}-{start + len(page)} of {len(rows)}")
+    tweets = _tweets_from_rows(dataset.iloc[page])
+    if view == "Table":
+        display_scored_table(tweets, stop_words, cache)
+    else:
+        display_scored_tweets(tweets, stop_words, cache, explain)
+    previous_column, next_column = st.columns(2)
+    previous_column.button("Previous page", key=f"{key}_previous", disabled=len(cursors) == 1, on_click=cursors.pop)
+    next_column.button("Next page", key=f"{key}_next", disabled=next_cursor is None,
+                       on_click=cursors.append, args=(next_cursor,))
+
+# Remember a result set for paging, starting from its first page
+def start_result_pages(key, **result):
+    st.session_state[key] = result
+    first_result_page(key)
+
+def first_result_page(key):
+    st.session_state[f"{key}_cursors"] = [-1]
+
 # Main app logic
 def main():
     st.set_page_config(
@@ -336,14 +581,11 @@ def main():
     </style>
     """, unsafe_allow_html=True)
     
-    # Load resources
+    # Start loading the model in the background; views wait for it only when they predict
+    loader = load_background_loader()
+    loader.prefetch("model", _load_model_handle)
     stop_words = load_stopwords()
-    model, vectorizer = load_model_and_vectorizer()
-    dataset = load_dataset_sample()
-    
-    if model is None or vectorizer is None:
-        st.error("Failed to load model or vectorizer. Application cannot continue.")
-        return
+    cache = load_prediction_cache()
     
     # Create sidebar
     st.sidebar.title("About")
@@ -359,12 +601,14 @@ def main():
     st.sidebar.markdown("""
     1. Enter text or a Twitter username
     2. The app cleans the text by removing 
-       punctuation and stopwords
+       punctuation and stopwords and
+       stemming each word
     3. A machine learning model analyzes 
        the text
     4. Results show whether the sentiment is 
        positive or negative
     """)
+    explain = st.sidebar.toggle("Explain predictions", help="Highlight the words that pushed each prediction positive or negative")
     
     # Main content
     st.markdown("# Real Time Sentimental Analysis of X Using ML")
@@ -372,7 +616,7 @@ def main():
     
     # Options
     st.subheader("Choose an option")
-    option = st.radio("Select option", ["Input text", "Get tweets from user", "Sample tweets", "Search dataset"], horizontal=True, label_visibility="collapsed")
+    option = st.radio("Select option", ["Input text", "Get tweets from user", "Sample tweets", "Search dataset", "Live stream", "Corpus dashboard"], horizontal=True, label_visibility="collapsed")
     
     if option == "Input text":
         text_input = st.text_area("Enter text to analyze", height=100)
@@ -380,34 +624,41 @@ def main():
             if not text_input:
                 st.warning("Please enter some text to analyze.")
             else:
-                sentiment = predict_sentiment(text_input, model, vectorizer, stop_words)
-                display_sentiment_card(text_input, sentiment)
+                display_scored_tweets([{"text": text_input}], stop_words, cache, explain)
                 
     elif option == "Get tweets from user":
+        prefetch_dataset_resources(["user_index"])
         username = st.text_input("Enter Twitter username (without @)")
         if st.button("Fetch Tweets"):
+            # A new fetch replaces the pages of the previous one
+            st.session_state.pop("user_results", None)
             if not username:
                 st.warning("Please enter a Twitter username.")
             else:
                 with st.spinner("Fetching tweets..."):
-                    st.subheader(f"Tweets from @{username}")
-                    
                     # First, check if it's a well-known user
                     if username.lower() in KNOWN_USERS:
+                        st.subheader(f"Tweets from @{username}")
                         st.success(f"Found tweets from @{username}!")
-                        for tweet in KNOWN_USERS[username.lower()]:
-                            display_sentiment_card(tweet["text"], tweet["sentiment"])
+                        display_scored_tweets(KNOWN_USERS[username.lower()], stop_words, cache, explain)
                     else:
+                        resources = load_dataset_resources(["user_index"])
+                        dataset, users_index = resources["dataset"], resources["user_index"]
+
                         # Try to find real tweets from this user in our dataset
-                        real_tweets = get_tweets_from_user(dataset, username)
-                        
-                        if real_tweets:
-                            # Display found tweets
-                            st.success(f"Found {len(real_tweets)} tweets from user '{username}' in our dataset!")
-                            
-                            for tweet in real_tweets:
-                                display_sentiment_card(tweet["text"], tweet["sentiment"])
+                        rows = find_user_rows(dataset, username, users_index) if dataset is not None else []
+                        if len(rows):
+                            # Rollups over all of the user's tweets are computed once, not on every page
+                            stats = user_scores = None
+                            if users_index is not None:
+                                key_ids = users_index.match(username)
+                                stats = users_index.stats(key_ids)
+                                corpus_scores = load_corpus_scores()
+                                if corpus_scores is not None:
+                                    user_scores = corpus_scores.for_users(key_ids, users_index)
+                            start_result_pages("user_results", username=username, rows=rows, stats=stats, user_scores=user_scores)
                         else:
+                            st.subheader(f"Tweets from @{username}")
                             # Error message similar to the one in the screenshot
                             st.error("""Error fetching tweets: Cannot choose from an empty sequence. 
                             Nitter API is currently unavailable.""")
@@ -417,66 +668,170 @@ def main():
                             
                             # Show sample tweets for that user
                             user_samples = get_user_sample_tweets(username)
-                            for tweet in user_samples:
-                                display_sentiment_card(tweet["text"], tweet["sentiment"])
+                            display_scored_tweets(user_samples, stop_words, cache, explain)
+
+        # Dataset results stay in the session so their pages survive reruns
+        results = st.session_state.get("user_results")
+        if results is not None:
+            dataset = load_dataset_resources(["user_index"])["dataset"]
+            username, rows, stats, user_scores = results["username"], results["rows"], results["stats"], results["user_scores"]
+            st.subheader(f"Tweets from @{username}")
+            st.success(f"Found {len(rows)} tweets from user '{username}' in our dataset!")
+            if stats is not None:
+                st.caption(f"{stats['tweets']} tweets from {stats['users']} matching user(s) in the dataset, "
+                           f"{stats['positive_ratio']:.0%} labelled positive")
+            if user_scores is not None:
+                st.caption(f"{user_scores['predicted_positive_ratio']:.0%} predicted positive by the model")
+            display_result_pages("user_results", dataset, rows, stop_words, cache, explain)
     
     elif option == "Sample tweets":
         if st.button("Analyze Samples"):
-            for tweet in SAMPLE_TWEETS:
-                display_sentiment_card(tweet["text"], tweet["sentiment"])
+            display_scored_tweets(SAMPLE_TWEETS, stop_words, cache, explain)
     
     elif option == "Search dataset":
-        if dataset is None:
-            st.error("Dataset could not be loaded. Make sure the training.1600000.processed.noemoticon.csv file exists.")
-        else:
-            search_query = st.text_input("Enter keywords to search for tweets")
-            search_button = st.button("Search")
-            
-            if search_button:
-                if not search_query:
-                    st.warning("Please enter keywords to search for.")
+        prefetch_dataset_resources(["search_index"])
+        search_query = st.text_input("Enter keywords to search for tweets", help="All words must match. Use OR between words for alternatives and \"quotes\" for exact phrases.")
+        search_button = st.button("Search")
+        
+        if search_button:
+            # A new search replaces the pages of the previous one
+            st.session_state.pop("search_results", None)
+            if not search_query:
+                st.warning("Please enter keywords to search for.")
+            else:
+                resources = load_dataset_resources(["search_index"])
+                dataset, tweet_index = resources["dataset"], resources["search_index"]
+                if dataset is None:
+                    st.error("Dataset could not be loaded. Make sure the training.1600000.processed.noemoticon.csv file exists.")
                 else:
                     with st.spinner("Searching tweets..."):
-                        matching_tweets = search_dataset_tweets(dataset, search_query)
-                        
-                        if matching_tweets:
-                            st.subheader(f"Found {len(matching_tweets)} tweets matching '{search_query}'")
-                            for tweet in matching_tweets:
-                                display_sentiment_card(tweet["text"], tweet["sentiment"])
-                        else:
-                            st.warning(f"No tweets found containing '{search_query}'")
-                            st.info("Try using different keywords or check out the sample tweets.")
-
-    # Show count of tweets loaded
-    if dataset is not None:
-        st.sidebar.info(f"Dataset loaded: {len(dataset)} tweets")
-
-def display_sentiment_card(text, sentiment):
-    """Display sentiment card similar to the screenshot"""
-    if sentiment == "Positive":
-        st.markdown(f"""
-        <div style="background-color: #28a745; padding: 15px; border-radius: 8px; margin: 15px 0;">
-            <div style="display: flex; justify-content: space-between; align-items: center;">
-                <h3 style="color: white; margin: 0;">Positive Sentiment</h3>
-                <div style="background-color: rgba(255,255,255,0.2); padding: 4px 8px; border-radius: 4px;">
-                    <span style="color: white; font-weight: bold;">Positive</span>
-                </div>
-            </div>
-            <p style="color: white; margin-top: 10px;">{text}</p>
-        </div>
-        """, unsafe_allow_html=True)
+                        rows = find_matching_rows(dataset, search_query, tweet_index)
+                    if len(rows):
+                        # Computed once per search; reading every match again would make each page cost O(matches)
+                        corpus_scores = load_corpus_scores()
+                        agreement = corpus_scores.agreement_for_rows(rows, dataset['target']) if corpus_scores is not None else None
+                        start_result_pages("search_results", query=search_query, rows=rows, agreement=agreement)
+                    else:
+                        st.warning(f"No tweets found containing '{search_query}'")
+                        st.info("Try using different keywords or check out the sample tweets.")
+
+        # Results stay in the session so their pages survive reruns
+        results = st.session_state.get("search_results")
+        if results is not None:
+            dataset = load_dataset_resources(["search_index"])["dataset"]
+            rows = results["rows"]
+            st.subheader(f"Found {len(rows)} tweets matching '{results['query']}'")
+            if results["agreement"] is not None:
+                display_corpus_agreement(results["agreement"], f"all {len(rows)} matching tweets")
+            display_result_pages("search_results", dataset, rows, stop_words, cache, explain)
+
+    elif option == "Live stream":
+        display_live_stream(stop_words, cache)
+
+    elif option == "Corpus dashboard":
+        resources = load_dataset_resources(["search_index"])
+        corpus_scores = load_corpus_scores() if resources["dataset"] is not None else None
+        model_version = load_model_and_vectorizer()[2]
+        display_corpus_dashboard(corpus_scores, resources["search_index"], stop_words, model_version)
+
+    # Show count of tweets loaded, without waiting for the dataset
+    if loader.ready("dataset"):
+        st.sidebar.info(f"Dataset loaded: {len(loader.get('dataset', _load_dataset))} tweets")
+
+    with st.sidebar.expander("Prediction cache"):
+        stats = cache.stats()
+        st.write(f"Hit rate: {stats['hit_rate']:.0%} ({stats['hits']} memory, {stats['disk_hits']} disk, {stats['misses']} misses)")
+        st.write(f"Entries: {stats['entries']}, evictions: {stats['evictions']}")
+        st.write(f"Model version: {stats['model_version']}")
+
+    display_performance_panel()
+
+# Stage timings, counters and the runtime-togglable sampling profiler
+def display_performance_panel():
+    import pandas as pd
+
+    with st.sidebar.expander("Performance"):
+        state = metrics.snapshot()
+        if state["timers"]:
+            st.dataframe(pd.DataFrame([
+                {"stage": name, "calls": timer["count"], "mean ms": timer["mean"] * 1000,
+                 "max ms": timer["max"] * 1000, "total s": timer["total"]}
+                for name, timer in sorted(state["timers"].items())
+            ]), hide_index=True)
+        else:
+            st.write("No timings recorded yet.")
+        for name, value in sorted(state["counters"].items()):
+            st.write(f"{name}: {value}")
+        st.download_button("Download metrics", metrics.render_prometheus(), file_name="metrics.txt", mime="text/plain")
+
+        profiler = metrics.PROFILER
+        if st.toggle("Sampling profiler", value=profiler.running):
+            profiler.start()
+        else:
+            profiler.stop()
+        if profiler.samples:
+            st.write(f"{profiler.samples} samples")
+            st.dataframe(pd.DataFrame(profiler.top(10), columns=["function", "samples", "share"]), hide_index=True)
+            st.download_button("Download stacks", profiler.collapsed(), file_name="profile.folded", mime="text/plain")
+
+# Word backgrounds for terms that pushed the prediction up or down
+HIGHLIGHT_COLORS = {"positive": "#155724", "negative": "#721c24"}
+
+# The tweet as HTML with every word that contributed to the prediction highlighted.
+# Words are cleaned like the model input so "Loving" matches the stemmed term "love".
+def highlight_contributions(text, explanation, stop_words):
+    import preprocessing
+
+    weights = {}
+    for term, contribution in explanation["positive"] + explanation["negative"]:
+        # Word n-grams highlight each of their words
+        for word in term.split():
+            weights[word] = weights.get(word, 0.0) + contribution
+    parts = []
+    for chunk in re.split(r'(\s+)', text):
+        weight = sum(weights.get(word, 0.0) for word in preprocessing.clean_text(chunk, stop_words).split())
+        if weight:
+            color = HIGHLIGHT_COLORS["positive" if weight > 0 else "negative"]
+            parts.append(f'<span style="background-color: {color}; border-radius: 3px; padding: 0 2px;" '
+                         f'title="{weight:+.3f}">{html.escape(chunk)}</span>')
+        else:
+            parts.append(html.escape(chunk))
+    return ''.join(parts)
+
+def _explanation_footer(explanation):
+    def terms(pairs):
+        return ', '.join(f"{html.escape(term)} ({contribution:+.2f})" for term, contribution in pairs) or "none"
+    return (f'<p style="color: white; font-size: 0.85em; margin: 8px 0 0;">'
+            f'Pushed positive: {terms(explanation["positive"])}<br>Pushed negative: {terms(explanation["negative"])}</p>')
+
+CARD_COLORS = {"Positive": "#28a745", "Negative": "#dc3545"}
+
+# HTML of one sentiment card. Kept free of indentation so several cards can share one markdown block.
+def sentiment_card_html(text, sentiment, explanation=None, stop_words=frozenset()):
+    footer = ""
+    if explanation is not None:
+        text = highlight_contributions(text, explanation, stop_words)
+        footer = _explanation_footer(explanation)
     else:
-        st.markdown(f"""
-        <div style="background-color: #dc3545; padding: 15px; border-radius: 8px; margin: 15px 0;">
-            <div style="display: flex; justify-content: space-between; align-items: center;">
-                <h3 style="color: white; margin: 0;">Negative Sentiment</h3>
-                <div style="background-color: rgba(255,255,255,0.2); padding: 4px 8px; border-radius: 4px;">
-                    <span style="color: white; font-weight: bold;">Negative</span>
-                </div>
-            </div>
-            <p style="color: white; margin-top: 10px;">{text}</p>
-        </div>
-        """, unsafe_allow_html=True)
+        # Cards share one markdown block, so unescaped text would break every card after it
+        text = html.escape(text)
+    label = "Positive" if sentiment == "Positive" else "Negative"
+    return (
+        f'<div style="background-color: {CARD_COLORS[label]}; padding: 15px; border-radius: 8px; margin: 15px 0;">'
+        f'<div style="display: flex; justify-content: space-between; align-items: center;">'
+        f'<h3 style="color: white; margin: 0;">{label} Sentiment</h3>'
+        f'<div style="background-color: rgba(255,255,255,0.2); padding: 4px 8px; border-radius: 4px;">'
+        f'<span style="color: white; font-weight: bold;">{label}</span></div></div>'
+        f'<p style="color: white; margin-top: 10px;">{text}</p>{footer}</div>'
+    )
+
+# Many cards in a single markdown element, so a page of results is one render
+@metrics.timed("render")
+def display_sentiment_cards(tweets, stop_words=frozenset()):
+    st.markdown(''.join(
+        sentiment_card_html(tweet["text"], tweet["sentiment"], tweet if "positive" in tweet else None, stop_words)
+        for tweet in tweets
+    ), unsafe_allow_html=True)
 
 if __name__ == "__main__":
     main()
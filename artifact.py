@@ -0,0 +1,302 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+# Compact, memory-mappable model artifact.
+#
+# A trained TfidfVectorizer + binary linear model is stored as flat numpy
+# arrays instead of pickles:
+#   vocab.npy          sorted fixed-width utf-8 terms
+#   vocab_columns.npy  feature column of each sorted term
+#   idf.npy            idf weight per feature column
+#   coef.npy           model coefficient per feature column
+#   intercept.npy      model intercept
+#   manifest.json      format version, vectorizer settings, classes and checksums
+#
+# Arrays are opened with np.load(mmap_mode='r'), so loading takes
+# milliseconds and every process on the host shares the same page-cache pages.
+#
+# Each export goes to its own version directory; the CURRENT file names the
+# live one and is replaced atomically, so readers switch versions in one step.
+
+ARTIFACT_DIR = "model_artifact"
+POINTER_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+FORMAT_VERSION = 1
+ARRAY_NAMES = ("vocab", "vocab_columns", "idf", "coef", "intercept")
+KEEP_VERSIONS = 3
+
+# TfidfVectorizer settings the artifact reproduces; anything else is refused
+_SUPPORTED_DEFAULTS = {
+    "analyzer": "word",
+    "input": "content",
+    "preprocessor": None,
+    "tokenizer": None,
+    "stop_words": None,
+    "strip_accents": None,
+    "use_idf": True,
+}
+
+# Split a document into terms the way TfidfVectorizer's word analyzer does
+def make_analyzer(settings):
+    lowercase = settings["lowercase"]
+    token_re = re.compile(settings["token_pattern"])
+    min_n, max_n = settings["ngram_range"]
+
+    def analyze(doc):
+        tokens = token_re.findall(doc.lower() if lowercase else doc)
+        if max_n == 1:
+            return tokens
+        terms = list(tokens) if min_n == 1 else []
+        for n in range(max(min_n, 2), max_n + 1):
+            terms.extend(' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return terms
+    return analyze
+
+class ArtifactVectorizer:
+    """Drop-in for the fitted TfidfVectorizer's transform(), backed by flat arrays."""
+
+    def __init__(self, vocab, vocab_columns, idf, settings):
+        self.vocab = vocab
+        self.vocab_columns = vocab_columns
+        self.idf = idf
+        self.settings = settings
+        self.analyze = make_analyzer(settings)
+        self.norm = settings["norm"]
+        self.sublinear_tf = settings["sublinear_tf"]
+        self.binary = settings["binary"]
+
+    @property
+    def n_features(self):
+        return len(self.idf)
+
+    # Vocabulary column of each term, -1 for unknown terms
+    def lookup(self, terms):
+        if not terms:
+            return np.empty(0, dtype=np.int64)
+        encoded = np.array([term.encode('utf-8') for term in terms], dtype=bytes)
+        positions = np.searchsorted(self.vocab, encoded)
+        positions[positions == len(self.vocab)] = 0
+        hit = self.vocab[positions] == encoded
+        columns = np.full(len(terms), -1, dtype=np.int64)
+        columns[hit] = self.vocab_columns[positions[hit]]
+        return columns
+
+    def transform(self, docs):
+        terms = []
+        lengths = []
+        for doc in docs:
+            doc_terms = self.analyze(doc)
+            terms.extend(doc_terms)
+            lengths.append(len(doc_terms))
+        columns = self.lookup(terms)
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        known = columns >= 0
+        matrix = sp.csr_matrix(
+            (np.ones(int(known.sum())), (rows[known], columns[known])),
+            shape=(len(lengths), self.n_features),
+        )
+        matrix.sum_duplicates()
+        if self.binary:
+            matrix.data[:] = 1.0
+        if self.sublinear_tf:
+            np.log(matrix.data, out=matrix.data)
+            matrix.data += 1.0
+        matrix.data *= self.idf[matrix.indices]
+        if self.norm is not None:
+            _normalize_rows(matrix, self.norm)
+        return matrix
+
+def _normalize_rows(matrix, norm):
+    if norm == 'l2':
+        squares = matrix.multiply(matrix).sum(axis=1).A1
+        lengths = np.sqrt(squares)
+    else:
+        lengths = abs(matrix).sum(axis=1).A1
+    lengths[lengths == 0] = 1.0
+    matrix.data /= np.repeat(lengths, np.diff(matrix.indptr))
+
+class ArtifactModel:
+    """Binary linear classifier with the predict/predict_proba API of the sklearn model."""
+
+    def __init__(self, coef, intercept, classes):
+        self.coef = coef
+        self.intercept = float(intercept[0])
+        self.classes_ = np.asarray(classes)
+
+    def decision_function(self, features):
+        return features @ self.coef + self.intercept
+
+    def predict_proba(self, features):
+        positive = 1.0 / (1.0 + np.exp(-self.decision_function(features)))
+        return np.column_stack([1.0 - positive, positive])
+
+    def predict(self, features):
+        return self.classes_[(self.decision_function(features) > 0).astype(np.int64)]
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as array_file:
+        for block in iter(lambda: array_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _file_fingerprint(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def vectorizer_settings(vectorizer):
+    # Only needed when exporting; loading an artifact does not import sklearn
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    if not isinstance(vectorizer, TfidfVectorizer):
+        raise ValueError(f"Only TfidfVectorizer can be exported as an artifact, not {type(vectorizer).__name__}")
+    params = vectorizer.get_params()
+    for name, expected in _SUPPORTED_DEFAULTS.items():
+        if params[name] != expected:
+            raise ValueError(f"Unsupported TfidfVectorizer setting {name}={params[name]!r}")
+    return {
+        "lowercase": params["lowercase"],
+        "token_pattern": params["token_pattern"],
+        "ngram_range": list(params["ngram_range"]),
+        "norm": params["norm"],
+        "sublinear_tf": params["sublinear_tf"],
+        "binary": params["binary"],
+    }
+
+def export_artifact(model, vectorizer, directory=ARTIFACT_DIR, sources=None):
+    """Write model and vectorizer as a new artifact version and make it current.
+
+    sources optionally maps names to the pickle files the pair was loaded
+    from; their fingerprints are recorded so stale artifacts can be detected.
+    """
+    settings = vectorizer_settings(vectorizer)
+    coef = np.asarray(getattr(model, "coef_", None), dtype=np.float64)
+    classes = [int(c) for c in getattr(model, "classes_", [])]
+    if coef.ndim != 2 or coef.shape[0] != 1 or len(classes) != 2:
+        raise ValueError("Only binary linear models with coef_ and classes_ can be exported")
+
+    terms = sorted(vectorizer.vocabulary_.items())
+    arrays = {
+        "vocab": np.array([term.encode('utf-8') for term, _ in terms], dtype=bytes),
+        "vocab_columns": np.array([column for _, column in terms], dtype=np.int32),
+        "idf": np.asarray(vectorizer.idf_, dtype=np.float64),
+        "coef": coef[0],
+        "intercept": np.asarray(model.intercept_, dtype=np.float64).reshape(1),
+    }
+    # Sorting the utf-8 bytes keeps searchsorted valid for non-ascii terms
+    order = np.argsort(arrays["vocab"], kind='stable')
+    arrays["vocab"] = arrays["vocab"][order]
+    arrays["vocab_columns"] = arrays["vocab_columns"][order]
+
+    now_ns = time.time_ns()
+    # Names sort in creation order, which pruning relies on
+    version = time.strftime("%Y%m%dT%H%M%S", time.localtime(now_ns // 10 ** 9)) + f"-{now_ns % 10 ** 9:09d}"
+    version_dir = os.path.join(directory, version)
+    os.makedirs(version_dir)
+    files = {}
+    for name, array in arrays.items():
+        path = os.path.join(version_dir, f"{name}.npy")
+        np.save(path, array)
+        files[name] = {"sha256": _sha256(path), "size": os.path.getsize(path)}
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "version": version,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "model_type": type(model).__name__,
+        "classes": classes,
+        "vectorizer": settings,
+        "files": files,
+        "sources": {name: _file_fingerprint(path) for name, path in (sources or {}).items()},
+    }
+    with open(os.path.join(version_dir, MANIFEST_FILE), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+    pointer = os.path.join(directory, POINTER_FILE)
+    with open(pointer + '.tmp', 'w') as pointer_file:
+        pointer_file.write(version)
+    os.replace(pointer + '.tmp', pointer)
+    _prune_versions(directory, version)
+    return version
+
+def _prune_versions(directory, current, keep=KEEP_VERSIONS):
+    versions = sorted(
+        name for name in os.listdir(directory)
+        if os.path.isfile(os.path.join(directory, name, MANIFEST_FILE))
+    )
+    for name in versions[:-keep]:
+        if name != current:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+def has_artifact(directory=ARTIFACT_DIR):
+    return os.path.isfile(os.path.join(directory, POINTER_FILE))
+
+def current_version(directory=ARTIFACT_DIR):
+    with open(os.path.join(directory, POINTER_FILE)) as pointer_file:
+        return pointer_file.read().strip()
+
+def read_manifest(directory=ARTIFACT_DIR, version=None):
+    version = version or current_version(directory)
+    with open(os.path.join(directory, version, MANIFEST_FILE)) as manifest_file:
+        return json.load(manifest_file)
+
+# True when the artifact was exported from pickles that have since changed
+def is_stale(sources, directory=ARTIFACT_DIR):
+    recorded = read_manifest(directory).get("sources", {})
+    for name, path in sources.items():
+        if name in recorded and os.path.exists(path) and _file_fingerprint(path) != recorded[name]:
+            return True
+    return False
+
+def load_artifact(directory=ARTIFACT_DIR, version=None, verify=False):
+    """Memory-map an artifact version (the current one by default).
+
+    Returns (model, vectorizer, manifest). verify=True checks every array's
+    sha256 against the manifest before using it.
+    """
+    version = version or current_version(directory)
+    manifest = read_manifest(directory, version)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format {manifest.get('format_version')!r}")
+    arrays = {}
+    for name in ARRAY_NAMES:
+        path = os.path.join(directory, version, f"{name}.npy")
+        if verify and _sha256(path) != manifest["files"][name]["sha256"]:
+            raise ValueError(f"Checksum mismatch for {path}")
+        arrays[name] = np.load(path, mmap_mode='r')
+    vectorizer = ArtifactVectorizer(arrays["vocab"], arrays["vocab_columns"], arrays["idf"], manifest["vectorizer"])
+    model = ArtifactModel(arrays["coef"], arrays["intercept"], manifest["classes"])
+    return model, vectorizer, manifest
+
+def main():
+    import inference
+
+    parser = argparse.ArgumentParser(description="Export or verify the memory-mappable model artifact.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Convert model.pkl/vectorizer.pkl into a new artifact version")
+    export_parser.add_argument("--model", default=inference.MODEL_PATH)
+    export_parser.add_argument("--vectorizer", default=inference.VECTORIZER_PATH)
+    export_parser.add_argument("--dir", default=ARTIFACT_DIR)
+    verify_parser = subparsers.add_parser("verify", help="Check the current artifact's checksums")
+    verify_parser.add_argument("--dir", default=ARTIFACT_DIR)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        model, vectorizer = inference.load_pickles(args.model, args.vectorizer)
+        version = export_artifact(model, vectorizer, args.dir, {"model": args.model, "vectorizer": args.vectorizer})
+        print(f"Exported artifact version {version} to {args.dir}")
+    else:
+        start = time.perf_counter()
+        _, vectorizer, manifest = load_artifact(args.dir, verify=True)
+        print(f"Artifact {manifest['version']} OK: {len(vectorizer.vocab)} terms, "
+              f"verified in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
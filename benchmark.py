@@ -0,0 +1,387 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+
+# Offline benchmark harness for the hot paths of the app.
+#
+# A synthetic Sentiment140-format corpus is generated for each size, so no
+# network access or real dataset is needed. Every benchmark runs in a fresh
+# process, which makes its peak RSS meaningful. Results are written as JSON
+# and can be compared against a saved baseline to flag regressions:
+#
+#   python benchmark.py --sizes 1k,100k --output bench.json
+#   python benchmark.py --sizes 1k,100k --baseline bench.json
+
+DEFAULT_SIZES = "1k,100k,1.6M"
+DEFAULT_WORKDIR = "bench_data"
+DEFAULT_TOLERANCE = 0.2
+SEED = 0
+
+# Rows used to fit the synthetic model; fitting is setup, not measured
+MODEL_TRAINING_ROWS = 50000
+
+# Single-text calls timed for latency percentiles
+LATENCY_CALLS = 500
+
+_POSITIVE_WORDS = ["love", "great", "happy", "awesome", "good", "fun", "amazing", "best", "thanks", "excited"]
+_NEGATIVE_WORDS = ["hate", "bad", "sad", "awful", "terrible", "worst", "sick", "tired", "angry", "missed"]
+_SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "ta", "vo", "shi", "pe", "da", "xo", "bu", "fa", "gi", "ze", "wu"]
+
+def parse_size(text):
+    text = text.strip().lower()
+    multiplier = 1
+    if text.endswith('k'):
+        multiplier, text = 1000, text[:-1]
+    elif text.endswith('m'):
+        multiplier, text = 1000000, text[:-1]
+    return int(float(text) * multiplier)
+
+def _synthetic_vocabulary(rng, size=20000):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(_SYLLABLES, size=rng.integers(2, 6))))
+    common = ["the", "i", "to", "a", "my", "and", "is", "in", "it", "for", "you", "of", "on", "me", "so", "but"]
+    return common + sorted(words - set(common))
+
+# Write a deterministic Sentiment140-format CSV with Zipfian word frequencies
+def generate_corpus(path, rows, seed=SEED):
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(_synthetic_vocabulary(rng), dtype=object)
+    weights = 1.0 / np.arange(1, len(vocabulary) + 1)
+    weights /= weights.sum()
+    users = np.array([f"user_{i}" for i in range(max(10, rows // 4))], dtype=object)
+
+    with open(path, 'w', encoding='ISO-8859-1', newline='') as csv_file:
+        writer = csv.writer(csv_file, quoting=csv.QUOTE_ALL)
+        for start in range(0, rows, 100000):
+            count = min(100000, rows - start)
+            lengths = rng.integers(5, 20, size=count)
+            words = vocabulary[rng.choice(len(vocabulary), size=int(lengths.sum()), p=weights)]
+            positive = rng.random(count) < 0.5
+            sentiment_words = np.where(positive, rng.choice(_POSITIVE_WORDS, size=count), rng.choice(_NEGATIVE_WORDS, size=count))
+            user_ids = users[rng.zipf(1.5, size=count) % len(users)]
+            offsets = np.concatenate([[0], np.cumsum(lengths)])
+            for i in range(count):
+                text = ' '.join(words[offsets[i]:offsets[i + 1]]) + f" {sentiment_words[i]}!"
+                writer.writerow([4 if positive[i] else 0, 1467810369 + start + i,
+                                 "Mon Apr 06 22:19:45 PDT 2009", "NO_QUERY", user_ids[i], text])
+
+def _paths(workdir, rows):
+    directory = os.path.join(workdir, f"rows_{rows}")
+    return {
+        "dir": directory,
+        "csv": os.path.join(directory, "tweets.csv"),
+        "cache": os.path.join(directory, "dataset_cache", "tweets.arrow"),
+        "index_dir": os.path.join(directory, "dataset_cache"),
+        "model": os.path.join(directory, "model.pkl"),
+        "vectorizer": os.path.join(directory, "vectorizer.pkl"),
+    }
+
+def _stop_words():
+    import preprocessing
+    try:
+        return preprocessing.load_stopwords(download=False)
+    except LookupError:
+        return preprocessing.BASIC_STOPWORDS
+
+# Generate the corpus and fit the synthetic model for one size (reused across runs)
+def prepare(workdir, rows):
+    paths = _paths(workdir, rows)
+    os.makedirs(paths["dir"], exist_ok=True)
+    if not os.path.exists(paths["csv"]):
+        generate_corpus(paths["csv"], rows)
+    if not os.path.exists(paths["model"]):
+        import pandas as pd
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+
+        import preprocessing
+        from train import save_pickle
+
+        sample = pd.read_csv(paths["csv"], encoding='ISO-8859-1', header=None, nrows=MODEL_TRAINING_ROWS)
+        cleaned = preprocessing.clean_texts(sample[5].astype(str), _stop_words())
+        vectorizer = TfidfVectorizer()
+        model = LogisticRegression(max_iter=200).fit(vectorizer.fit_transform(cleaned), (sample[0] == 4).astype(int))
+        save_pickle(model, paths["model"])
+        save_pickle(vectorizer, paths["vectorizer"])
+    return paths
+
+def _summary(latencies, items_per_call=1):
+    latencies = np.sort(np.asarray(latencies, dtype=np.float64))
+    total = float(latencies.sum())
+    return {
+        "calls": int(len(latencies)),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "throughput_per_s": len(latencies) * items_per_call / total if total else 0.0,
+    }
+
+def _time_calls(fn, args_list):
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def _load_texts(paths):
+    import dataset_cache
+    return dataset_cache.load_dataset(['text'], paths["csv"], paths["cache"])['text'].astype(object).tolist()
+
+def bench_dataset_load(paths, rows, repeat):
+    import dataset_cache
+    start = time.perf_counter()
+    dataset_cache.build_cache(paths["csv"], paths["cache"])
+    build_seconds = time.perf_counter() - start
+    latencies = _time_calls(lambda: dataset_cache.load_dataset(['target', 'user', 'text'], paths["csv"], paths["cache"]), [()] * repeat)
+    result = _summary(latencies, rows)
+    result["build_s"] = build_seconds
+    return result
+
+def bench_preprocessing(paths, rows, repeat):
+    import preprocessing
+    texts = _load_texts(paths)
+    stop_words = _stop_words()
+    latencies = []
+    for _ in range(repeat):
+        preprocessing.stem.cache_clear()
+        latencies.extend(_time_calls(preprocessing.clean_texts, [(texts, stop_words)]))
+    return _summary(latencies, len(texts))
+
+def bench_vectorization(paths, rows, repeat):
+    import inference
+    import preprocessing
+    _, vectorizer = inference.load_pickles(paths["model"], paths["vectorizer"])
+    cleaned = preprocessing.clean_texts(_load_texts(paths), _stop_words())
+    chunks = [(cleaned[i:i + inference.DEFAULT_CHUNK_SIZE],) for i in range(0, len(cleaned), inference.DEFAULT_CHUNK_SIZE)]
+    latencies = []
+    for _ in range(repeat):
+        latencies.extend(_time_calls(vectorizer.transform, chunks))
+    result = _summary(latencies)
+    result["throughput_per_s"] = len(cleaned) * repeat / sum(latencies)
+    return result
+
+def bench_inference(paths, rows, repeat):
+    import inference
+    model, vectorizer = inference.load_pickles(paths["model"], paths["vectorizer"])
+    stop_words = _stop_words()
+    texts = _load_texts(paths)
+    single = [(texts[i % len(texts)], model, vectorizer, stop_words) for i in range(LATENCY_CALLS)]
+    result = _summary(_time_calls(inference.predict_sentiment, single))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        inference.predict_sentiment_batch(texts, model, vectorizer, stop_words)
+    result["batch_throughput_per_s"] = len(texts) * repeat / (time.perf_counter() - start)
+    # The sklearn transform/predict_proba path the fast path replaces, for comparison
+    inference.FAST_PATH = False
+    result["sklearn_p50_ms"] = float(np.median(_time_calls(inference.predict_sentiment, single)) * 1000)
+    inference.FAST_PATH = True
+    return result
+
+def _query_words(paths, count=200):
+    rng = np.random.default_rng(SEED)
+    words = ' '.join(_load_texts(paths)[:1000]).replace('!', '').split()
+    return [str(word) for word in rng.choice(words, size=count)]
+
+def bench_search(paths, rows, repeat):
+    import dataset_cache
+    import search_index
+    start = time.perf_counter()
+    index = search_index.load_or_build(paths["index_dir"], paths["csv"], paths["cache"])
+    build_seconds = time.perf_counter() - start
+    texts = dataset_cache.load_dataset(['text'], paths["csv"], paths["cache"])['text']
+    queries = _query_words(paths)
+    latencies = []
+    for _ in range(repeat):
+        latencies.extend(_time_calls(
+            lambda query: search_index.page_rows(index.search(query, texts), -1, 5),
+            [(query,) for query in queries],
+        ))
+    result = _summary(latencies)
+    result["build_s"] = build_seconds
+    # The full scan the index replaced, for comparison
+    scan = _time_calls(lambda query: texts[texts.str.lower().str.contains(query, regex=False)], [(query,) for query in queries[:3]])
+    result["scan_p50_ms"] = float(np.median(scan) * 1000)
+    return result
+
+def bench_user_lookup(paths, rows, repeat):
+    import dataset_cache
+    import user_index
+    start = time.perf_counter()
+    index = user_index.load_or_build(paths["index_dir"], paths["csv"], paths["cache"])
+    build_seconds = time.perf_counter() - start
+    users = dataset_cache.load_dataset(['user'], paths["csv"], paths["cache"])['user']
+    rng = np.random.default_rng(SEED)
+    names = [str(users.iloc[i]) for i in rng.integers(0, len(users), size=100)]
+    partial = [name[2:-1] for name in names]
+    latencies = []
+    for _ in range(repeat):
+        latencies.extend(_time_calls(lambda name: index.rows_for(index.match(name)), [(name,) for name in names + partial]))
+    result = _summary(latencies)
+    result["build_s"] = build_seconds
+    return result
+
+# Run in a fresh interpreter: import the app, then load stopwords and the model and predict once
+_COLD_START_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+import inference, preprocessing
+stop_words = preprocessing.load_stopwords(download=False)
+loaded = inference.load_model(sys.argv[1], sys.argv[2], sys.argv[3])
+ready = time.perf_counter()
+inference.predict_sentiment("what a great day", loaded.model, loaded.vectorizer, stop_words)
+done = time.perf_counter()
+print(json.dumps({"import": imported - start, "load": ready - imported, "predict": done - ready, "total": done - start}))
+"""
+
+def _cold_start(paths, artifact_dir, repeat):
+    import subprocess
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", _COLD_START_SCRIPT, paths["model"], paths["vectorizer"], artifact_dir],
+                                env=env, check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return runs
+
+# Time to first prediction of a new app process, from the pickles and from the artifact
+def bench_cold_start(paths, rows, repeat):
+    import artifact
+    import inference
+    artifact_dir = os.path.join(paths["dir"], "artifact")
+    if not artifact.has_artifact(artifact_dir):
+        model, vectorizer = inference.load_pickles(paths["model"], paths["vectorizer"])
+        artifact.export_artifact(model, vectorizer, artifact_dir)
+    runs = _cold_start(paths, '', repeat)
+    result = _summary([run["total"] for run in runs])
+    result["import_ms"] = float(np.median([run["import"] for run in runs]) * 1000)
+    result["load_ms"] = float(np.median([run["load"] for run in runs]) * 1000)
+    # The first prediction includes importing nltk for the stemmer
+    result["first_predict_ms"] = float(np.median([run["predict"] for run in runs]) * 1000)
+    artifact_runs = _cold_start(paths, artifact_dir, repeat)
+    result["artifact_p50_ms"] = float(np.median([run["total"] for run in artifact_runs]) * 1000)
+    result["artifact_load_ms"] = float(np.median([run["load"] for run in artifact_runs]) * 1000)
+    return result
+
+BENCHMARKS = {
+    "dataset_load": bench_dataset_load,
+    "preprocessing": bench_preprocessing,
+    "vectorization": bench_vectorization,
+    "inference": bench_inference,
+    "search": bench_search,
+    "user_lookup": bench_user_lookup,
+    "cold_start": bench_cold_start,
+}
+
+def peak_rss_mb():
+    # VmHWM belongs to this process image; ru_maxrss survives exec on Linux and
+    # would report the parent's peak for spawned children
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def _run_child(name, paths, rows, repeat):
+    result = BENCHMARKS[name](paths, rows, repeat)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+# Run one benchmark in a fresh process so its peak RSS is its own
+def run_benchmark(name, paths, rows, repeat):
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        result = pool.apply(_run_child, (name, paths, rows, repeat))
+    return dict({"bench": name, "rows": rows}, **result)
+
+# Metrics where larger is better; everything else ending in _ms or _s is a duration
+_HIGHER_IS_BETTER = ("throughput_per_s", "batch_throughput_per_s")
+_LOWER_IS_BETTER = ("p50_ms", "p99_ms", "peak_rss_mb", "build_s", "import_ms", "artifact_p50_ms")
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Return human-readable regressions of results against a baseline run."""
+    previous = {(entry["bench"], entry["rows"]): entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results["results"]:
+        old = previous.get((entry["bench"], entry["rows"]))
+        if old is None:
+            continue
+        for metric in _HIGHER_IS_BETTER:
+            if metric in entry and old.get(metric) and entry[metric] < old[metric] * (1 - tolerance):
+                regressions.append(f"{entry['bench']}[{entry['rows']}] {metric}: {old[metric]:.4g} -> {entry[metric]:.4g}")
+        for metric in _LOWER_IS_BETTER:
+            if metric in entry and old.get(metric) and entry[metric] > old[metric] * (1 + tolerance):
+                regressions.append(f"{entry['bench']}[{entry['rows']}] {metric}: {old[metric]:.4g} -> {entry[metric]:.4g}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark preprocessing, vectorization, inference, search and dataset load.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma separated corpus sizes, e.g. 1k,100k,1.6M")
+    parser.add_argument("--bench", default=','.join(BENCHMARKS), help="Comma separated benchmarks to run")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per measurement")
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR, help="Where synthetic corpora and models are kept")
+    parser.add_argument("--output", default="bench_results.json", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Compare against this results JSON and exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed relative slowdown")
+    args = parser.parse_args()
+
+    sizes = [parse_size(size) for size in args.sizes.split(',') if size.strip()]
+    names = [name.strip() for name in args.bench.split(',') if name.strip()]
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    import numpy
+    import sklearn
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": numpy.__version__,
+            "sklearn": sklearn.__version__,
+            "cpus": os.cpu_count(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": args.repeat,
+        },
+        "results": [],
+    }
+    for rows in sizes:
+        print(f"preparing {rows} rows...", flush=True)
+        paths = prepare(args.workdir, rows)
+        for name in names:
+            entry = run_benchmark(name, paths, rows, args.repeat)
+            results["results"].append(entry)
+            print(f"  {name:<14} p50 {entry['p50_ms']:9.3f} ms  p99 {entry['p99_ms']:9.3f} ms  "
+                  f"{entry['throughput_per_s']:12.0f}/s  peak {entry['peak_rss_mb']:7.1f} MB", flush=True)
+
+    with open(args.output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+if __name__ == "__main__":
+    main()
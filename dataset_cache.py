@@ -0,0 +1,149 @@
+import argparse
+import json
+import os
+import time
+
+import pandas as pd
+import pyarrow as pa
+
+import metrics
+
+# Columnar, memory-mapped cache of the Sentiment140 training CSV.
+#
+# Parsing the 1.6M-row CSV takes a long time and leaves hundreds of MB of
+# Python string objects behind. The CSV is converted once to an uncompressed
+# Arrow IPC file; later loads memory-map that file, so only the pages of the
+# columns a view actually touches are read from disk.
+
+DATASET_CSV = "training.1600000.processed.noemoticon.csv"
+CACHE_DIR = "dataset_cache"
+CACHE_FILE = os.path.join(CACHE_DIR, "tweets.arrow")
+CACHE_FORMAT_VERSION = "1"
+
+COLUMNS = ['target', 'id', 'date', 'flag', 'user', 'text']
+
+# Convert target: 0 = negative, 4 = positive
+TARGET_LABELS = {0: "Negative", 4: "Positive"}
+
+# Dates look like "Mon Apr 06 22:19:45 PDT 2009"; the zone is dropped before parsing
+DATE_ZONE_RE = r' [A-Z]{3,4} (?=\d{4}$)'
+DATE_FORMAT = '%a %b %d %H:%M:%S %Y'
+
+SCHEMA = pa.schema([
+    ('target', pa.dictionary(pa.int8(), pa.string())),
+    ('id', pa.int64()),
+    ('date', pa.timestamp('s')),
+    ('flag', pa.dictionary(pa.int32(), pa.string())),
+    ('user', pa.string()),
+    ('text', pa.string()),
+])
+
+# Size and modification time of the source CSV, used to detect a stale cache
+def source_fingerprint(csv_path=DATASET_CSV):
+    stat = os.stat(csv_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+# Read the fingerprint stored in the cache file without loading any data
+def cached_fingerprint(cache_path=CACHE_FILE):
+    with pa.memory_map(cache_path, 'r') as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    if metadata.get(b'format_version') != CACHE_FORMAT_VERSION.encode():
+        return None
+    return json.loads(metadata[b'source'])
+
+# True when the cache is missing or was built from a different CSV
+def is_stale(csv_path=DATASET_CSV, cache_path=CACHE_FILE):
+    if not os.path.exists(cache_path):
+        return True
+    if not os.path.exists(csv_path):
+        # Keep using the cache when the CSV has been removed to save space
+        return False
+    try:
+        return cached_fingerprint(cache_path) != source_fingerprint(csv_path)
+    except (pa.ArrowInvalid, OSError, KeyError, ValueError):
+        return True
+
+def _chunk_to_table(chunk):
+    target_codes = chunk['target'].map({code: i for i, code in enumerate(TARGET_LABELS)})
+    target = pa.DictionaryArray.from_arrays(
+        pa.array(target_codes.to_numpy(dtype='float64'), type=pa.int8(), from_pandas=True),
+        pa.array(list(TARGET_LABELS.values()), type=pa.string()),
+    )
+    dates = pd.to_datetime(
+        chunk['date'].str.replace(DATE_ZONE_RE, ' ', regex=True),
+        format=DATE_FORMAT,
+        errors='coerce',
+    )
+    return pa.Table.from_arrays([
+        target,
+        pa.array(chunk['id'].to_numpy(dtype='int64'), type=pa.int64()),
+        pa.array(dates, type=pa.timestamp('s'), from_pandas=True),
+        pa.array(chunk['flag'].astype(object), type=pa.string(), from_pandas=True).dictionary_encode(),
+        pa.array(chunk['user'].astype(object), type=pa.string(), from_pandas=True),
+        pa.array(chunk['text'].astype(object), type=pa.string(), from_pandas=True),
+    ], schema=SCHEMA)
+
+# One-time conversion of the CSV into the memory-mappable cache file
+@metrics.timed("dataset_build")
+def build_cache(csv_path=DATASET_CSV, cache_path=CACHE_FILE, chunksize=200000):
+    fingerprint = source_fingerprint(csv_path)
+    reader = pd.read_csv(
+        csv_path,
+        encoding='ISO-8859-1',
+        header=None,
+        names=COLUMNS,
+        dtype={'target': 'int64', 'id': 'int64', 'date': str, 'flag': str, 'user': str, 'text': str},
+        keep_default_na=False,
+        chunksize=chunksize,
+    )
+    table = pa.concat_tables(_chunk_to_table(chunk) for chunk in reader).unify_dictionaries()
+    table = table.replace_schema_metadata({
+        'format_version': CACHE_FORMAT_VERSION,
+        'source': json.dumps(fingerprint),
+    })
+
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    tmp_path = cache_path + '.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=chunksize)
+    # Atomic swap so readers never see a half-written cache
+    os.replace(tmp_path, cache_path)
+    return cache_path
+
+# Memory-map the cache and return the requested columns as an Arrow table
+def load_table(columns=None, csv_path=DATASET_CSV, cache_path=CACHE_FILE):
+    if is_stale(csv_path, cache_path):
+        build_cache(csv_path, cache_path)
+    source = pa.memory_map(cache_path, 'r')
+    table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(list(columns))
+    return table
+
+# Load the dataset as a DataFrame whose string columns stay backed by the mapped file
+@metrics.timed("dataset_load")
+def load_dataset(columns=None, csv_path=DATASET_CSV, cache_path=CACHE_FILE):
+    table = load_table(columns, csv_path, cache_path)
+    string_dtype = pd.StringDtype("pyarrow")
+    return table.to_pandas(
+        types_mapper={pa.string(): string_dtype, pa.large_string(): string_dtype}.get,
+        split_blocks=True,
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the training CSV into the memory-mapped dataset cache.")
+    parser.add_argument("--csv", default=DATASET_CSV, help="Path to the source CSV")
+    parser.add_argument("--cache", default=CACHE_FILE, help="Path of the cache file to write")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the cache is up to date")
+    args = parser.parse_args()
+
+    if not args.force and not is_stale(args.csv, args.cache):
+        print(f"Cache {args.cache} is up to date.")
+        return
+    start = time.perf_counter()
+    build_cache(args.csv, args.cache)
+    print(f"Built {args.cache} in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import argparse
+import math
+import threading
+import time
+import weakref
+
+import numpy as np
+
+import artifact
+
+# Direct scoring for tf-idf + binary logistic regression models.
+#
+# For one tweet, sklearn spends most of transform() and predict_proba() on
+# input validation and building a sparse matrix around a few dozen nonzeros.
+# LinearScorer keeps the vocabulary as a dict and the idf weights and
+# coefficients as flat arrays, and computes each text's tf-idf weights,
+# normalization, dot product and sigmoid directly. It applies the same steps
+# as the vectorizer and model in the same order, so labels are identical and
+# probabilities agree to rounding error; check_parity() measures both.
+#
+# explain() reuses the same pass: each nonzero's normalized tf-idf weight
+# times its coefficient is the term's contribution to the decision, so the
+# top positive and negative terms come from arrays already computed.
+#
+# With SHARED_VOCABULARY set (workers.py does), scorers of artifact models
+# look terms up in the artifact's memory-mapped sorted vocabulary instead of
+# building a per-process dict, trading a few microseconds per call for no
+# private memory per worker.
+
+# Largest probability difference check_parity() accepts
+PARITY_TOLERANCE = 1e-9
+
+SHARED_VOCABULARY = False
+
+DEFAULT_TOP_K = 5
+
+class LinearScorer:
+    """Positive-class probabilities of cleaned texts from flat tf-idf and model arrays."""
+
+    def __init__(self, vocabulary, idf, coef, intercept, classes, settings, lookup=None):
+        # Either a term -> column dict or lookup(terms) returning columns, -1 for unknown terms
+        self.vocabulary = vocabulary
+        self.lookup = lookup
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = float(intercept)
+        self.classes = [int(c) for c in classes]
+        self.analyze = artifact.make_analyzer(settings)
+        self.norm = settings["norm"]
+        self.sublinear_tf = settings["sublinear_tf"]
+        self.binary = settings["binary"]
+        # The coefficients score classes[1]; the app reports the probability of class 1
+        self.positive_is_second = self.classes.index(1) == 1
+
+    @classmethod
+    def from_model(cls, model, vectorizer, shared_vocabulary=False):
+        """Build a scorer from a fitted sklearn pair or a loaded artifact pair.
+
+        shared_vocabulary=True keeps an artifact's terms in its mapped arrays.
+        Raises ValueError for vectorizers or models it cannot reproduce.
+        """
+        lookup = None
+        if isinstance(vectorizer, artifact.ArtifactVectorizer):
+            settings = vectorizer.settings
+            if shared_vocabulary:
+                vocabulary, lookup = None, vectorizer.lookup
+            else:
+                vocabulary = dict(zip((term.decode('utf-8') for term in vectorizer.vocab), vectorizer.vocab_columns.tolist()))
+            idf = vectorizer.idf
+        else:
+            settings = artifact.vectorizer_settings(vectorizer)
+            vocabulary = vectorizer.vocabulary_
+            idf = vectorizer.idf_
+        if isinstance(model, artifact.ArtifactModel):
+            coef, intercept = model.coef, model.intercept
+        elif type(model).__name__ == "LogisticRegression":
+            coef = np.asarray(model.coef_)
+            if coef.ndim != 2 or coef.shape[0] != 1:
+                raise ValueError("Only binary logistic regression models are supported")
+            coef, intercept = coef[0], model.intercept_[0]
+        else:
+            raise ValueError(f"No fast path for {type(model).__name__}")
+        if len(model.classes_) != 2 or 1 not in list(model.classes_):
+            raise ValueError("The model must have classes 0 and 1")
+        if len(coef) != len(idf):
+            raise ValueError(f"Model has {len(coef)} coefficients for {len(idf)} features")
+        return cls(vocabulary, idf, coef, intercept, model.classes_, settings, lookup)
+
+    # Feature columns and term counts of every text, grouped by text,
+    # plus the term of each column when with_terms is set
+    def _counts(self, cleaned_texts, with_terms=False):
+        if self.vocabulary is None:
+            return self._looked_up_counts(cleaned_texts, with_terms)
+        vocabulary = self.vocabulary
+        rows = []
+        columns = []
+        counts = []
+        terms = [] if with_terms else None
+        for row, text in enumerate(cleaned_texts):
+            text_counts = {}
+            text_terms = {}
+            for term in self.analyze(text):
+                column = vocabulary.get(term)
+                if column is not None:
+                    text_counts[column] = text_counts.get(column, 0) + 1
+                    if with_terms:
+                        text_terms[column] = term
+            # Sorted like the sparse matrix the vectorizer builds
+            for column in sorted(text_counts):
+                rows.append(row)
+                columns.append(column)
+                counts.append(text_counts[column])
+                if with_terms:
+                    terms.append(text_terms[column])
+        return (np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64),
+                np.array(counts, dtype=np.float64), terms)
+
+    def _looked_up_counts(self, cleaned_texts, with_terms=False):
+        terms = []
+        lengths = []
+        for text in cleaned_texts:
+            text_terms = self.analyze(text)
+            terms.extend(text_terms)
+            lengths.append(len(text_terms))
+        columns = self.lookup(terms)
+        rows = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+        known = np.flatnonzero(columns >= 0)
+        # One key per (text, column), so unique() counts terms and sorts them like _counts
+        keys, first, counts = np.unique(rows[known] * len(self.idf) + columns[known], return_index=True, return_counts=True)
+        key_terms = [terms[i] for i in known[first]] if with_terms else None
+        return keys // len(self.idf), keys % len(self.idf), counts.astype(np.float64), key_terms
+
+    # Each nonzero's share of its text's decision: normalized tf-idf weight times coefficient
+    def _contributions(self, cleaned_texts, with_terms=False):
+        rows, columns, values, terms = self._counts(cleaned_texts, with_terms)
+        size = len(cleaned_texts)
+        if self.binary:
+            values[:] = 1.0
+        if self.sublinear_tf:
+            np.log(values, out=values)
+            values += 1.0
+        values *= self.idf[columns]
+        if self.norm is not None:
+            weights = values * values if self.norm == 'l2' else np.abs(values)
+            # bincount returns integers when no text has a known term
+            lengths = np.bincount(rows, weights=weights, minlength=size).astype(np.float64, copy=False)
+            if self.norm == 'l2':
+                np.sqrt(lengths, out=lengths)
+            lengths[lengths == 0] = 1.0
+            values /= lengths[rows]
+        return rows, values * self.coef[columns], terms
+
+    def decision_function(self, cleaned_texts):
+        rows, contributions, _ = self._contributions(cleaned_texts)
+        return np.bincount(rows, weights=contributions, minlength=len(cleaned_texts)) + self.intercept
+
+    def _probabilities(self, decisions):
+        # exp() of large negative decisions underflows to 0, which is the right limit
+        with np.errstate(over='ignore'):
+            positive = 1.0 / (1.0 + np.exp(-decisions))
+        return positive if self.positive_is_second else 1.0 - positive
+
+    def predict_proba(self, cleaned_texts):
+        """Probability of class 1 for each cleaned text, as a numpy array."""
+        return self._probabilities(self.decision_function(cleaned_texts))
+
+    def explain(self, cleaned_texts, top_k=DEFAULT_TOP_K):
+        """Probabilities of class 1 and the terms that moved each text most.
+
+        Returns (probabilities, explanations); each explanation has
+        "positive" and "negative" lists of (term, contribution) pairs,
+        largest first, where contributions toward class 1 are positive.
+        """
+        rows, contributions, terms = self._contributions(cleaned_texts, with_terms=True)
+        probabilities = self._probabilities(
+            np.bincount(rows, weights=contributions, minlength=len(cleaned_texts)) + self.intercept)
+        if not self.positive_is_second:
+            contributions = -contributions
+        # One sort orders every text's contributions; rows stay grouped
+        order = np.lexsort((contributions, rows))
+        ranked = list(zip([terms[i] for i in order], contributions[order].tolist()))
+        bounds = np.searchsorted(rows, np.arange(len(cleaned_texts) + 1)).tolist()
+        explanations = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            lowest = ranked[start:min(start + top_k, end)]
+            highest = ranked[max(end - top_k, start):end]
+            explanations.append({
+                "positive": [pair for pair in reversed(highest) if pair[1] > 0],
+                "negative": [pair for pair in lowest if pair[1] < 0],
+            })
+        return probabilities, explanations
+
+    def score(self, cleaned_text):
+        decision = self.decision_function([cleaned_text])[0]
+        if decision >= 0:
+            positive = 1.0 / (1.0 + math.exp(-decision))
+        else:
+            positive = math.exp(decision) / (1.0 + math.exp(decision))
+        return positive if self.positive_is_second else 1.0 - positive
+
+# Compiled scorers of the loaded models; entries go away with their model
+_scorers = weakref.WeakKeyDictionary()
+_scorers_lock = threading.Lock()
+
+def scorer_for(model, vectorizer):
+    """The cached LinearScorer of a model/vectorizer pair, or None if it has no fast path."""
+    with _scorers_lock:
+        entry = _scorers.get(model)
+        if entry is not None and entry[0]() is vectorizer:
+            return entry[1]
+        try:
+            scorer = LinearScorer.from_model(model, vectorizer, SHARED_VOCABULARY)
+        except (ValueError, AttributeError, TypeError):
+            scorer = None
+        _scorers[model] = (weakref.ref(vectorizer), scorer)
+        return scorer
+
+def check_parity(model, vectorizer, cleaned_texts, tolerance=PARITY_TOLERANCE):
+    """Compare the fast path against the vectorizer and model on cleaned texts.
+
+    Returns a dict with the largest probability difference, the number of
+    differing labels and whether both are within tolerance.
+    """
+    # Built the way scorer_for() builds it, so workers' shared vocabulary lookups are checked too
+    scorer = LinearScorer.from_model(model, vectorizer, SHARED_VOCABULARY)
+    positive_index = list(model.classes_).index(1)
+    expected = model.predict_proba(vectorizer.transform(cleaned_texts))[:, positive_index]
+    actual = scorer.predict_proba(cleaned_texts)
+    max_difference = float(np.max(np.abs(expected - actual))) if len(cleaned_texts) else 0.0
+    label_mismatches = int(np.sum((expected > 0.5) != (actual > 0.5)))
+    return {
+        "texts": len(cleaned_texts),
+        "max_difference": max_difference,
+        "label_mismatches": label_mismatches,
+        "ok": label_mismatches == 0 and max_difference <= tolerance,
+    }
+
+def _median_ms(fn, texts):
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        fn(text)
+        latencies.append(time.perf_counter() - start)
+    return float(np.median(latencies) * 1000)
+
+def main():
+    import dataset_cache
+    import inference
+    import preprocessing
+
+    parser = argparse.ArgumentParser(description="Check the fast scoring path against sklearn and compare their latency.")
+    parser.add_argument("--model", default=inference.MODEL_PATH, help="Path to model.pkl")
+    parser.add_argument("--vectorizer", default=inference.VECTORIZER_PATH, help="Path to vectorizer.pkl")
+    parser.add_argument("--artifact-dir", default='', help="Check this model artifact instead of the pickles")
+    parser.add_argument("--csv", default=dataset_cache.DATASET_CSV, help="Sentiment140 CSV whose tweets are scored")
+    parser.add_argument("--rows", type=int, default=10000, help="Number of tweets to compare")
+    parser.add_argument("--tolerance", type=float, default=PARITY_TOLERANCE, help="Largest allowed probability difference")
+    args = parser.parse_args()
+
+    loaded = inference.load_model(args.model, args.vectorizer, args.artifact_dir)
+    texts = dataset_cache.load_dataset(['text'], args.csv)['text'].iloc[:args.rows].astype(str).tolist()
+    cleaned = preprocessing.clean_texts(texts, preprocessing.load_stopwords())
+    result = check_parity(loaded.model, loaded.vectorizer, cleaned, args.tolerance)
+    print(f"{result['texts']} texts: max probability difference {result['max_difference']:.3g}, "
+          f"{result['label_mismatches']} label mismatches")
+
+    scorer = LinearScorer.from_model(loaded.model, loaded.vectorizer)
+    positive_index = list(loaded.model.classes_).index(1)
+    sample = cleaned[:1000]
+    sklearn_ms = _median_ms(lambda text: loaded.model.predict_proba(loaded.vectorizer.transform([text]))[:, positive_index], sample)
+    fast_ms = _median_ms(scorer.score, sample)
+    print(f"Single text: sklearn {sklearn_ms:.3f} ms, fast path {fast_ms:.3f} ms ({sklearn_ms / fast_ms:.1f}x)")
+    if not result["ok"]:
+        raise SystemExit("Fast path does not match the model")
+
+if __name__ == "__main__":
+    main()
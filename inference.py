@@ -0,0 +1,249 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import namedtuple
+
+import artifact
+import fast_path
+import metrics
+import preprocessing
+
+# Model loading and batched scoring shared by the Streamlit app, the HTTP
+# service and the offline tools. Nothing here depends on Streamlit.
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = 'model.pkl'
+VECTORIZER_PATH = 'vectorizer.pkl'
+
+# A loaded model/vectorizer pair and a version string that changes with the files
+LoadedModel = namedtuple('LoadedModel', ['model', 'vectorizer', 'version'])
+
+# Load the pickled model and vectorizer written by the training notebook
+def load_pickles(model_path=MODEL_PATH, vectorizer_path=VECTORIZER_PATH):
+    with open(model_path, 'rb') as model_file:
+        model = pickle.load(model_file)
+    with open(vectorizer_path, 'rb') as vectorizer_file:
+        vectorizer = pickle.load(vectorizer_file)
+    return model, vectorizer
+
+def _pickle_version(model_path, vectorizer_path):
+    digest = hashlib.sha1()
+    for path in (model_path, vectorizer_path):
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return "pkl-" + digest.hexdigest()[:12]
+
+# Prefer the memory-mapped artifact; fall back to the pickles when there is none
+# or when the pickles were retrained after the artifact was exported
+@metrics.timed("model_load")
+def load_model(model_path=MODEL_PATH, vectorizer_path=VECTORIZER_PATH, artifact_dir=artifact.ARTIFACT_DIR):
+    if artifact_dir and artifact.has_artifact(artifact_dir):
+        if artifact.is_stale({"model": model_path, "vectorizer": vectorizer_path}, artifact_dir):
+            logger.warning("Artifact in %s is older than %s/%s, loading the pickles", artifact_dir, model_path, vectorizer_path)
+        else:
+            model, vectorizer, manifest = artifact.load_artifact(artifact_dir)
+            return LoadedModel(model, vectorizer, manifest["version"])
+    model, vectorizer = load_pickles(model_path, vectorizer_path)
+    return LoadedModel(model, vectorizer, _pickle_version(model_path, vectorizer_path))
+
+def load_model_and_vectorizer(model_path=MODEL_PATH, vectorizer_path=VECTORIZER_PATH, artifact_dir=artifact.ARTIFACT_DIR):
+    loaded = load_model(model_path, vectorizer_path, artifact_dir)
+    return loaded.model, loaded.vectorizer
+
+class ModelHandle:
+    """The live model, hot-swapped when the artifact pointer or pickles change.
+
+    get() checks the watched files at most every check_interval seconds and
+    replaces the loaded model in a single assignment, so callers always see a
+    consistent model/vectorizer pair. A failed reload keeps the old model.
+    A reload runs in the thread that calls get(); code that must not block,
+    such as an event loop, reads current instead.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, vectorizer_path=VECTORIZER_PATH,
+                 artifact_dir=artifact.ARTIFACT_DIR, check_interval=1.0):
+        self.model_path = model_path
+        self.vectorizer_path = vectorizer_path
+        self.artifact_dir = artifact_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._signature = self._files_signature()
+        self._current = load_model(model_path, vectorizer_path, artifact_dir)
+        self._next_check = time.monotonic() + check_interval
+
+    def _files_signature(self):
+        paths = [self.model_path, self.vectorizer_path]
+        if self.artifact_dir:
+            paths.append(os.path.join(self.artifact_dir, artifact.POINTER_FILE))
+        signature = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    # The loaded model, without checking for a newer one
+    @property
+    def current(self):
+        return self._current
+
+    def get(self):
+        if time.monotonic() >= self._next_check:
+            self.maybe_reload()
+        return self._current
+
+    def maybe_reload(self):
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval
+            signature = self._files_signature()
+            if signature == self._signature:
+                return False
+            try:
+                loaded = load_model(self.model_path, self.vectorizer_path, self.artifact_dir)
+            except Exception:
+                logger.exception("Reloading the model failed, keeping version %s", self._current.version)
+                return False
+            self._signature = signature
+            self._current = loaded
+            logger.info("Switched to model version %s", loaded.version)
+            return True
+
+# Default number of texts vectorized and scored together
+DEFAULT_CHUNK_SIZE = 1000
+
+# Score tf-idf + logistic regression pairs with fast_path instead of transform/predict_proba
+FAST_PATH = True
+
+# Define sentiment prediction function
+def predict_sentiment(text, model, vectorizer, stop_words, cache=None, model_version=None):
+    labels, _ = predict_sentiment_batch([text], model, vectorizer, stop_words, cache=cache, model_version=model_version)
+    return labels[0]
+
+# Score many texts at once: one transform and one predict_proba per chunk
+def predict_sentiment_batch(texts, model, vectorizer, stop_words, chunk_size=DEFAULT_CHUNK_SIZE,
+                            cache=None, model_version=None):
+    """Return (labels, probabilities) for an iterable of texts.
+
+    Probabilities are the model's probability of the positive class.
+    Texts are processed in chunks of ``chunk_size`` so memory stays bounded
+    for large inputs such as a pandas Series of tweets. With a
+    PredictionCache, only texts whose cleaned form was not scored before by
+    ``model_version`` reach the vectorizer and model.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    if cache is not None and model_version is None:
+        raise ValueError("model_version is required when using a prediction cache")
+    labels = []
+    probabilities = []
+    chunk = []
+    for text in texts:
+        chunk.append(text)
+        if len(chunk) == chunk_size:
+            _score_chunk(chunk, model, vectorizer, stop_words, labels, probabilities, cache, model_version)
+            chunk = []
+    if chunk:
+        _score_chunk(chunk, model, vectorizer, stop_words, labels, probabilities, cache, model_version)
+    return labels, probabilities
+
+# (label, probability) pairs of texts already cleaned by preprocessing.clean_texts
+def predict_cleaned(cleaned_texts, model, vectorizer):
+    scorer = fast_path.scorer_for(model, vectorizer) if FAST_PATH else None
+    if scorer is not None:
+        with metrics.timed("fast_score"):
+            positive_probabilities = scorer.predict_proba(cleaned_texts)
+    else:
+        with metrics.timed("transform"):
+            text_vectors = vectorizer.transform(cleaned_texts)
+        positive_index = list(model.classes_).index(1)
+        with metrics.timed("predict"):
+            positive_probabilities = model.predict_proba(text_vectors)[:, positive_index]
+    metrics.inc("predictions", len(cleaned_texts))
+    return [
+        ("Positive" if probability > 0.5 else "Negative", float(probability))
+        for probability in positive_probabilities
+    ]
+
+def _score_chunk(texts, model, vectorizer, stop_words, labels, probabilities, cache=None, model_version=None):
+    with metrics.timed("preprocess"):
+        cleaned_texts = preprocessing.clean_texts(texts, stop_words)
+    if cache is None:
+        results = predict_cleaned(cleaned_texts, model, vectorizer)
+    else:
+        keys = [cache.key(cleaned_text, model_version) for cleaned_text in cleaned_texts]
+        results = cache.get_many(keys, model_version)
+        missing = [i for i, result in enumerate(results) if result is None]
+        metrics.inc("prediction_cache_hits", len(results) - len(missing))
+        metrics.inc("prediction_cache_misses", len(missing))
+        if missing:
+            computed = predict_cleaned([cleaned_texts[i] for i in missing], model, vectorizer)
+            for i, result in zip(missing, computed):
+                results[i] = result
+            cache.put_many([(keys[i], label, probability) for i, (label, probability) in zip(missing, computed)], model_version)
+    for label, probability in results:
+        labels.append(label)
+        probabilities.append(probability)
+
+# Predictions with the terms that pushed them up or down, for tf-idf + logistic regression models
+def explain_batch(texts, model, vectorizer, stop_words, top_k=fast_path.DEFAULT_TOP_K, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Return one dict per text with sentiment, probability and its top terms.
+
+    "positive" and "negative" list (term, contribution) pairs, strongest
+    first; a contribution is the term's tf-idf weight times its coefficient.
+    Terms are cleaned and stemmed like the model's input. The explanation
+    comes from the same pass as the probability, so it costs little extra.
+    Raises ValueError for models the fast path cannot score.
+    """
+    scorer = fast_path.scorer_for(model, vectorizer)
+    if scorer is None:
+        raise ValueError(f"Explanations need a tf-idf + logistic regression model, not {type(model).__name__}")
+    texts = list(texts)
+    results = []
+    for start in range(0, len(texts), chunk_size):
+        with metrics.timed("preprocess"):
+            cleaned_texts = preprocessing.clean_texts(texts[start:start + chunk_size], stop_words)
+        with metrics.timed("explain"):
+            probabilities, explanations = scorer.explain(cleaned_texts, top_k)
+        metrics.inc("explanations", len(cleaned_texts))
+        for probability, explanation in zip(probabilities, explanations):
+            results.append(dict(explanation, sentiment="Positive" if probability > 0.5 else "Negative",
+                                probability=float(probability)))
+    return results
+
+def explain_sentiment(text, model, vectorizer, stop_words, top_k=fast_path.DEFAULT_TOP_K):
+    return explain_batch([text], model, vectorizer, stop_words, top_k)[0]
+
+# Process-pool workers load their own model once, in the pool initializer;
+# with the artifact every worker maps the same page-cache pages
+_worker_state = None
+
+def init_scoring_worker(model_path, vectorizer_path, artifact_dir, stop_words):
+    global _worker_state
+    _worker_state = (load_model(model_path, vectorizer_path, artifact_dir), stop_words)
+
+# Positive-class probabilities of texts, computed in a worker set up by init_scoring_worker
+def score_in_worker(texts):
+    loaded, stop_words = _worker_state
+    _, probabilities = predict_sentiment_batch(texts, loaded.model, loaded.vectorizer, stop_words,
+                                               chunk_size=len(texts) or 1)
+    return probabilities
+
+# Attach model predictions to a list of tweet dictionaries
+def score_tweets(tweets, model, vectorizer, stop_words, cache=None, model_version=None):
+    labels, probabilities = predict_sentiment_batch([tweet["text"] for tweet in tweets], model, vectorizer, stop_words,
+                                                    cache=cache, model_version=model_version)
+    return [
+        dict(tweet, sentiment=label, probability=probability)
+        for tweet, label, probability in zip(tweets, labels, probabilities)
+    ]
+
+# Like score_tweets, with each tweet's "positive" and "negative" terms attached
+def explain_tweets(tweets, model, vectorizer, stop_words, top_k=fast_path.DEFAULT_TOP_K):
+    explained = explain_batch([tweet["text"] for tweet in tweets], model, vectorizer, stop_words, top_k)
+    return [dict(tweet, **explanation) for tweet, explanation in zip(tweets, explained)]
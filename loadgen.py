@@ -0,0 +1,92 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import aiohttp
+
+# Local load generator for serve.py. Keeps a fixed number of requests in
+# flight for a given duration and reports latency percentiles and throughput.
+
+DEFAULT_TEXTS = [
+    "I absolutely love this product! It's amazing and has completely changed my life for the better!",
+    "This is the worst experience I've ever had. Terrible customer service and poor quality.",
+    "Just got the new iPhone and it's incredible! The camera quality is outstanding.",
+    "Traffic today was absolutely terrible. I was stuck for hours and missed my meeting.",
+    "The food at this restaurant was delicious. Will definitely come back again!",
+]
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+async def _worker(session, url, texts, batch_size, deadline, latencies, errors):
+    while time.monotonic() < deadline:
+        if batch_size > 1:
+            endpoint, payload = "/predict_batch", {"texts": random.choices(texts, k=batch_size)}
+        else:
+            endpoint, payload = "/predict", {"text": random.choice(texts)}
+        start = time.perf_counter()
+        try:
+            async with session.post(url + endpoint, json=payload) as response:
+                await response.read()
+                ok = response.status == 200
+        except aiohttp.ClientError:
+            ok = False
+        if ok:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append(1)
+
+async def run(url, concurrency, duration, batch_size, texts):
+    latencies = []
+    errors = []
+    deadline = time.monotonic() + duration
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            _worker(session, url, texts, batch_size, deadline, latencies, errors)
+            for _ in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "elapsed_s": elapsed,
+        "requests_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "texts_per_s": len(latencies) * batch_size / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate load against the sentiment HTTP service.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests kept in flight")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+    parser.add_argument("--batch-size", type=int, default=1, help="Texts per request; 1 uses /predict")
+    parser.add_argument("--texts-file", help="File with one text per line to sample from")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    texts = DEFAULT_TEXTS
+    if args.texts_file:
+        with open(args.texts_file, encoding="utf-8") as texts_file:
+            texts = [line.strip() for line in texts_file if line.strip()]
+
+    report = asyncio.run(run(args.url.rstrip("/"), args.concurrency, args.duration, args.batch_size, texts))
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print(f"{report['requests']} requests, {report['errors']} errors in {report['elapsed_s']:.1f}s")
+        print(f"throughput: {report['requests_per_s']:.0f} req/s, {report['texts_per_s']:.0f} texts/s")
+        print(f"latency: p50 {report['p50_ms']:.2f} ms, p99 {report['p99_ms']:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+import bisect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+# Low-overhead stage timers, counters and an on-demand sampling profiler.
+#
+# Hot paths wrap themselves in timed("stage") or call inc("name"); both cost a
+# perf_counter pair and one small locked update, so instrumentation stays on in
+# production. Snapshots are exposed as Prometheus text (serve.py /metrics),
+# as one structured JSON log line, or in the Streamlit sidebar.
+#
+# The sampling profiler is off by default and costs nothing until started. When
+# running it snapshots every thread's stack with sys._current_frames() from a
+# background thread, so instrumented code is never modified or slowed directly.
+
+logger = logging.getLogger("metrics")
+
+METRIC_PREFIX = "sentiment"
+
+# Histogram upper bounds in seconds, from sub-millisecond lookups to cold loads
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+DEFAULT_SAMPLE_INTERVAL = 0.005
+DEFAULT_MAX_STACK_DEPTH = 32
+
+class Timer:
+    """Count, total, max and histogram buckets of one stage's durations."""
+
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timers = {}
+        self.counters = {}
+        self.gauges = {}
+        self._collectors = {}
+        self.started = time.time()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = Timer()
+            timer.observe(seconds)
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    # Keep the first value only, for one-off latencies such as time to first prediction
+    def set_gauge_once(self, name, value):
+        with self._lock:
+            self.gauges.setdefault(name, value)
+
+    # fn() returns a {name: value} dict of gauges read at snapshot time.
+    # Adding a collector under an existing name replaces the old one.
+    def add_collector(self, name, fn):
+        with self._lock:
+            self._collectors[name] = fn
+
+    def reset(self):
+        with self._lock:
+            self.timers.clear()
+            self.counters.clear()
+            self.gauges.clear()
+
+    def snapshot(self):
+        gauges = {}
+        with self._lock:
+            collectors = list(self._collectors.items())
+        for name, collector in collectors:
+            try:
+                gauges.update(collector())
+            except Exception:
+                logger.exception("Metrics collector %r failed", name)
+        with self._lock:
+            gauges.update(self.gauges)
+            return {
+                "uptime_seconds": time.time() - self.started,
+                "timers": {
+                    name: {
+                        "count": timer.count,
+                        "total": timer.total,
+                        "mean": timer.total / timer.count if timer.count else 0.0,
+                        "max": timer.max,
+                        "buckets": list(timer.buckets),
+                    }
+                    for name, timer in self.timers.items()
+                },
+                "counters": dict(self.counters),
+                "gauges": gauges,
+            }
+
+REGISTRY = Registry()
+
+def observe(name, seconds):
+    REGISTRY.observe(name, seconds)
+
+def inc(name, amount=1):
+    REGISTRY.inc(name, amount)
+
+def set_gauge(name, value):
+    REGISTRY.set_gauge(name, value)
+
+def set_gauge_once(name, value):
+    REGISTRY.set_gauge_once(name, value)
+
+def add_collector(name, fn):
+    REGISTRY.add_collector(name, fn)
+
+def snapshot():
+    return REGISTRY.snapshot()
+
+class timed:
+    """Record the wall time of a block or function under a stage name.
+
+    Usable as ``with timed("transform"):`` or as a ``@timed("load")`` decorator.
+    Time is recorded even when the block raises.
+    """
+
+    __slots__ = ("name", "_start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        REGISTRY.observe(self.name, time.perf_counter() - self._start)
+        return False
+
+    def __call__(self, fn):
+        name = self.name
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                REGISTRY.observe(name, time.perf_counter() - start)
+        return wrapper
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _metric_name(name):
+    return ''.join(c if c.isalnum() or c == '_' else '_' for c in name)
+
+def render_prometheus(state=None):
+    """Render a snapshot in the Prometheus text exposition format."""
+    state = state or snapshot()
+    stage = f"{METRIC_PREFIX}_stage_duration_seconds"
+    lines = [
+        f"# HELP {stage} Wall time spent in each instrumented stage.",
+        f"# TYPE {stage} histogram",
+    ]
+    for name, timer in sorted(state["timers"].items()):
+        label = f'stage="{_label_value(name)}"'
+        cumulative = 0
+        for bound, count in zip(BUCKETS, timer["buckets"]):
+            cumulative += count
+            lines.append(f'{stage}_bucket{{{label},le="{bound}"}} {cumulative}')
+        lines.append(f'{stage}_bucket{{{label},le="+Inf"}} {timer["count"]}')
+        lines.append(f'{stage}_sum{{{label}}} {timer["total"]:.9f}')
+        lines.append(f'{stage}_count{{{label}}} {timer["count"]}')
+    for name, value in sorted(state["counters"].items()):
+        metric = f"{METRIC_PREFIX}_{_metric_name(name)}_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+    for name, value in sorted(state["gauges"].items()):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        metric = f"{METRIC_PREFIX}_{_metric_name(name)}"
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {value}")
+    lines.append(f"# TYPE {METRIC_PREFIX}_uptime_seconds gauge")
+    lines.append(f"{METRIC_PREFIX}_uptime_seconds {state['uptime_seconds']:.3f}")
+    return '\n'.join(lines) + '\n'
+
+# One JSON object per line, without the histogram buckets
+def log_snapshot(log=logger, level=logging.INFO):
+    state = snapshot()
+    for timer in state["timers"].values():
+        del timer["buckets"]
+    log.log(level, "metrics %s", json.dumps(state, sort_keys=True, default=str))
+
+class LogReporter:
+    """Background thread that writes log_snapshot() every interval seconds."""
+
+    def __init__(self, interval, log=logger):
+        self.interval = interval
+        self.log = log
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-log", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            log_snapshot(self.log)
+
+class SamplingProfiler:
+    """Statistical profiler that can be started and stopped at runtime.
+
+    Every interval seconds the stacks of all other threads are recorded as
+    collapsed "file:function;file:function" strings, the format flame graph
+    tools read. Samples accumulate until reset().
+    """
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL, max_depth=DEFAULT_MAX_STACK_DEPTH):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None):
+        with self._lock:
+            if self.running:
+                return False
+            if interval:
+                self.interval = interval
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        with self._lock:
+            if not self.running:
+                return False
+            self._stop.set()
+            thread = self._thread
+        thread.join()
+        return True
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+
+    def _frame_name(self, frame):
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            sampled = []
+            for thread_id, frame in frames.items():
+                if thread_id == own:
+                    continue
+                names = []
+                while frame is not None and len(names) < self.max_depth:
+                    names.append(self._frame_name(frame))
+                    frame = frame.f_back
+                sampled.append(';'.join(reversed(names)))
+            del frames
+            with self._lock:
+                self.stacks.update(sampled)
+                self.samples += 1
+
+    # Collapsed stacks, one "stack count" line each, most frequent first
+    def collapsed(self):
+        with self._lock:
+            return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + '\n'
+
+    # Leaf functions by their share of all sampled thread stacks, running or waiting
+    def top(self, limit=20):
+        leaves = Counter()
+        with self._lock:
+            for stack, count in self.stacks.items():
+                leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values())
+        return [(name, count, count / total) for name, count in leaves.most_common(limit)]
+
+PROFILER = SamplingProfiler()
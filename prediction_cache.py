@@ -0,0 +1,156 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Bounded cache of predictions keyed on the preprocessed text.
+#
+# Keys hash the cleaned token string together with the model version, so
+# retweets and texts that only differ in punctuation, case or stopwords share
+# an entry, and a new model never serves predictions made by the old one.
+# The in-memory tier is an LRU with a TTL; the optional SQLite tier survives
+# restarts of the Streamlit process.
+
+DEFAULT_MAX_ENTRIES = 100000
+DEFAULT_TTL = 24 * 3600
+DEFAULT_MAX_DISK_ENTRIES = 1000000
+
+# Prune the disk tier after this many inserts
+_DISK_PRUNE_EVERY = 1000
+
+class PredictionCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, disk_path=None,
+                 max_disk_entries=DEFAULT_MAX_DISK_ENTRIES):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_version = None
+        self._disk = None
+        self._disk_inserts = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False, isolation_level=None)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "key BLOB PRIMARY KEY, model_version TEXT, label TEXT, probability REAL, created REAL)"
+            )
+            self._disk.execute("CREATE INDEX IF NOT EXISTS predictions_created ON predictions (created)")
+
+    @staticmethod
+    def key(cleaned_text, model_version):
+        return hashlib.blake2b(f"{model_version}\0{cleaned_text}".encode('utf-8'), digest_size=16).digest()
+
+    # Drop in-memory entries of other model versions the first time a new version is seen.
+    # The disk tier may be shared with processes still on another version; keys include the
+    # version, so old rows are never served and age out through the TTL and size pruning.
+    def _check_version(self, model_version):
+        if model_version == self._model_version:
+            return
+        self._entries.clear()
+        self._model_version = model_version
+
+    def get_many(self, keys, model_version):
+        """Return a list with a (label, probability) tuple or None per key."""
+        now = time.time()
+        results = [None] * len(keys)
+        missing = []
+        with self._lock:
+            self._check_version(model_version)
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None and entry[2] > now:
+                    self._entries.move_to_end(key)
+                    results[i] = entry[:2]
+                    self.hits += 1
+                else:
+                    if entry is not None:
+                        del self._entries[key]
+                    missing.append(i)
+
+            if missing and self._disk is not None:
+                found = self._disk_lookup([keys[i] for i in missing], now)
+                still_missing = []
+                for i in missing:
+                    entry = found.get(keys[i])
+                    if entry is None:
+                        still_missing.append(i)
+                        continue
+                    results[i] = entry[:2]
+                    self._remember(keys[i], entry[0], entry[1], entry[2])
+                    self.disk_hits += 1
+                missing = still_missing
+            self.misses += len(missing)
+        return results
+
+    def _disk_lookup(self, keys, now):
+        found = {}
+        # Stay below SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = self._disk.execute(
+                f"SELECT key, label, probability, created FROM predictions WHERE key IN ({','.join('?' * len(batch))})",
+                batch,
+            ).fetchall()
+            for key, label, probability, created in rows:
+                if created + self.ttl > now:
+                    found[bytes(key)] = (label, probability, created + self.ttl)
+        return found
+
+    def _remember(self, key, label, probability, expires):
+        self._entries[key] = (label, probability, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def put_many(self, items, model_version):
+        """Store (key, label, probability) tuples computed with model_version."""
+        now = time.time()
+        with self._lock:
+            if model_version != self._model_version:
+                # Computed with a model that has been replaced in the meantime
+                return
+            for key, label, probability in items:
+                self._remember(key, label, probability, now + self.ttl)
+            if self._disk is not None and items:
+                self._disk.executemany(
+                    "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?)",
+                    [(key, str(model_version), label, probability, now) for key, label, probability in items],
+                )
+                self._disk_inserts += len(items)
+                if self._disk_inserts >= _DISK_PRUNE_EVERY:
+                    self._prune_disk(now)
+
+    def _prune_disk(self, now):
+        self._disk_inserts = 0
+        self._disk.execute("DELETE FROM predictions WHERE created <= ?", (now - self.ttl,))
+        self._disk.execute(
+            "DELETE FROM predictions WHERE key IN ("
+            "SELECT key FROM predictions ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM predictions")
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "model_version": self._model_version,
+        }
@@ -0,0 +1,111 @@
+import os
+import re
+import ssl
+from functools import lru_cache
+
+# Shared text preprocessing used by both training and the Streamlit app, so
+# the features seen at serving time match the ones the model was trained on.
+#
+# nltk is slow to import, so it is only imported when a word is first stemmed
+# or when the bundled stopword list is missing.
+
+# Precompiled pattern used to strip everything except letters
+NON_ALPHA_RE = re.compile('[^a-zA-Z]')
+
+# Tweet vocabulary is very Zipfian, so a bounded cache catches almost every word
+STEM_CACHE_SIZE = 2 ** 18
+
+# nltk's english stopword list, shipped with the app so startup needs no download
+STOPWORDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stopwords_english.txt')
+
+# Basic list of common stopwords used when the nltk corpus is unavailable
+BASIC_STOPWORDS = frozenset([
+    'a', 'about', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from',
+    'has', 'he', 'in', 'is', 'it', 'its', 'of', 'on', 'that', 'the', 'to',
+    'was', 'were', 'will', 'with',
+])
+
+_stemmer = None
+
+# Download the nltk stopwords corpus, working around SSL certificate issues
+def download_stopwords():
+    import nltk
+
+    try:
+        _create_unverified_https_context = ssl._create_unverified_context
+    except AttributeError:
+        pass
+    else:
+        ssl._create_default_https_context = _create_unverified_https_context
+
+    # Create NLTK data directory if it doesn't exist
+    nltk_data_dir = os.path.expanduser('~/nltk_data')
+    if not os.path.exists(nltk_data_dir):
+        os.makedirs(nltk_data_dir)
+
+    nltk.download('stopwords', quiet=True)
+
+# Read a stopword file with one word per line
+def load_bundled_stopwords(path=STOPWORDS_FILE):
+    with open(path, encoding='utf-8') as stopwords_file:
+        return frozenset(line.strip() for line in stopwords_file if line.strip() and not line.startswith('#'))
+
+# Load english stopwords as a frozenset for constant-time membership checks.
+# The bundled list is used when present; otherwise the nltk corpus is looked
+# up and, if download is true, fetched.
+def load_stopwords(download=True):
+    try:
+        return load_bundled_stopwords()
+    except OSError:
+        pass
+    try:
+        from nltk.corpus import stopwords
+        return frozenset(stopwords.words('english'))
+    except LookupError:
+        if not download:
+            raise
+    download_stopwords()
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words('english'))
+
+# Stopwords for scoring with a trained model. Other stopwords would change the
+# features, so instead of falling back to BASIC_STOPWORDS this raises.
+def load_model_stopwords():
+    try:
+        return load_stopwords()
+    except Exception as e:
+        raise RuntimeError(f"Cannot load the english stopwords the model was trained with: {e}") from e
+
+# Porter-stem a single word, memoized across calls
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem(word):
+    global _stemmer
+    if _stemmer is None:
+        from nltk.stem.porter import PorterStemmer
+        _stemmer = PorterStemmer()
+    return _stemmer.stem(word)
+
+# Clean one text: keep letters only, lowercase, drop stopwords and stem
+def clean_text(text, stop_words, stem_words=True):
+    words = NON_ALPHA_RE.sub(' ', text).lower().split()
+    if stem_words:
+        return ' '.join([stem(word) for word in words if word not in stop_words])
+    return ' '.join([word for word in words if word not in stop_words])
+
+# Clean a batch of texts (list, iterable or pandas Series) into a list
+def clean_texts(texts, stop_words, stem_words=True):
+    if not isinstance(stop_words, (set, frozenset)):
+        stop_words = frozenset(stop_words)
+    sub = NON_ALPHA_RE.sub
+    cleaned = []
+    append = cleaned.append
+    if stem_words:
+        stem_word = stem
+        for text in texts:
+            words = sub(' ', text).lower().split()
+            append(' '.join([stem_word(word) for word in words if word not in stop_words]))
+    else:
+        for text in texts:
+            words = sub(' ', text).lower().split()
+            append(' '.join([word for word in words if word not in stop_words]))
+    return cleaned
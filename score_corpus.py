@@ -0,0 +1,266 @@
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import artifact
+import dataset_cache
+import inference
+import preprocessing
+import search_index
+import user_index
+from search_index import INDEX_DIR, find_key, load_arrays, save_arrays
+
+# Offline scoring of the whole dataset with the current model.
+#
+# Every row of the dataset cache gets the model's positive-class probability,
+# stored as one float32 array aligned to the cache rows (6.4 MB for 1.6M
+# tweets). Rollups are computed once from it:
+#   per day    - tweets, labelled positive, predicted positive, score sum
+#   per user   - predicted positive and score sum, aligned to the user index
+#   per token  - the same, aligned to the search index vocabulary
+# Token and user rollups are segment sums over the existing posting lists
+# (np.add.reduceat), so no text is touched again. The UI reads the mapped
+# arrays and never re-scores the corpus.
+
+logger = logging.getLogger("score_corpus")
+
+SCORES_PREFIX = "scores"
+SCORE_ARRAYS = (
+    "scores",
+    "day_dates", "day_tweets", "day_label_positive", "day_predicted_positive", "day_score_sum",
+    "user_predicted_positive", "user_score_sum",
+    "token_label_positive", "token_predicted_positive", "token_score_sum",
+)
+SUMMARY_FILE = "scores_summary.json"
+
+DEFAULT_CHUNK_SIZE = 50000
+
+# Bound the temporary gathered arrays of the segment sums
+_SEGMENT_CHUNK = 5000000
+
+def _text_chunks(texts, chunk_size):
+    for start in range(0, len(texts), chunk_size):
+        yield texts.slice(start, chunk_size).to_pylist()
+
+# Positive-class probability of every text, scored in a process pool
+def score_texts(texts, model_path, vectorizer_path, artifact_dir, stop_words, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    scores = np.empty(len(texts), dtype=np.float32)
+    position = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=inference.init_scoring_worker,
+                             initargs=(model_path, vectorizer_path, artifact_dir, stop_words)) as executor:
+        for chunk_scores in executor.map(inference.score_in_worker, _text_chunks(texts, chunk_size)):
+            scores[position:position + len(chunk_scores)] = chunk_scores
+            position += len(chunk_scores)
+            logger.info("%d/%d rows, %.0f rows/s", position, len(texts), position / (time.perf_counter() - start))
+    return scores
+
+# Sum of values[rows] over each posting list offsets[i]:offsets[i + 1]
+def segment_sums(values, rows, offsets, dtype=np.float64):
+    sums = np.zeros(len(offsets) - 1, dtype=dtype)
+    segment = 0
+    while segment < len(sums):
+        # Take as many whole segments as fit in one chunk, at least one
+        end = int(np.searchsorted(offsets, offsets[segment] + _SEGMENT_CHUNK, side='right')) - 1
+        end = min(max(end, segment + 1), len(sums))
+        lo, hi = int(offsets[segment]), int(offsets[end])
+        if hi > lo:
+            gathered = np.asarray(values)[np.asarray(rows[lo:hi])].astype(dtype, copy=False)
+            starts = np.asarray(offsets[segment:end]) - lo
+            # reduceat would return a value instead of 0 for empty segments
+            nonempty = np.diff(np.asarray(offsets[segment:end + 1])) > 0
+            sums[segment:end][nonempty] = np.add.reduceat(gathered, starts[nonempty])
+        segment = end
+    return sums
+
+def daily_rollup(dates, label_positive, predicted_positive, scores):
+    # Rows with an unparseable date are left out of the daily view
+    valid = ~np.isnat(dates)
+    if not valid.all():
+        dates, label_positive, predicted_positive, scores = (
+            dates[valid], label_positive[valid], predicted_positive[valid], scores[valid])
+    days = dates.astype('datetime64[D]').astype(np.int64)
+    day_dates, codes = np.unique(days, return_inverse=True)
+    return {
+        "day_dates": day_dates,
+        "day_tweets": np.bincount(codes, minlength=len(day_dates)).astype(np.uint32),
+        "day_label_positive": np.bincount(codes, weights=label_positive, minlength=len(day_dates)).astype(np.uint32),
+        "day_predicted_positive": np.bincount(codes, weights=predicted_positive, minlength=len(day_dates)).astype(np.uint32),
+        "day_score_sum": np.bincount(codes, weights=scores, minlength=len(day_dates)),
+    }
+
+def agreement(label_positive, predicted_positive):
+    label_positive = np.asarray(label_positive, dtype=bool)
+    predicted_positive = np.asarray(predicted_positive, dtype=bool)
+    true_positive = int((label_positive & predicted_positive).sum())
+    true_negative = int((~label_positive & ~predicted_positive).sum())
+    false_positive = int((~label_positive & predicted_positive).sum())
+    false_negative = int((label_positive & ~predicted_positive).sum())
+    total = len(label_positive)
+    return {
+        "tweets": total,
+        "agreement": (true_positive + true_negative) / total if total else None,
+        "true_positive": true_positive,
+        "true_negative": true_negative,
+        "false_positive": false_positive,
+        "false_negative": false_negative,
+    }
+
+def build_scores(args):
+    if dataset_cache.is_stale(args.csv, args.cache):
+        dataset_cache.build_cache(args.csv, args.cache)
+    fingerprint = dataset_cache.cached_fingerprint(args.cache)
+    table = dataset_cache.load_table(['target', 'date', 'text'], args.csv, args.cache)
+    version = inference.load_model(args.model, args.vectorizer, args.artifact_dir).version
+    stop_words = preprocessing.load_model_stopwords()
+
+    timings = {}
+    start = time.perf_counter()
+    logger.info("Scoring %d tweets with model %s", table.num_rows, version)
+    scores = score_texts(table.column('text').combine_chunks(), args.model, args.vectorizer, args.artifact_dir,
+                         stop_words, args.workers, args.chunk_size)
+    timings["score"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    label_positive = (table.column('target').to_pandas().astype(object) == "Positive").to_numpy(dtype=bool)
+    predicted_positive = scores > 0.5
+    arrays = {"scores": scores}
+    dates = table.column('date').to_numpy()
+    arrays.update(daily_rollup(dates, label_positive, predicted_positive, scores))
+
+    users = user_index.load_or_build(args.index_dir, args.csv, args.cache)
+    arrays["user_predicted_positive"] = segment_sums(predicted_positive, users.rows, users.offsets).astype(np.uint32)
+    arrays["user_score_sum"] = segment_sums(scores, users.rows, users.offsets).astype(np.float32)
+
+    tokens = search_index.load_or_build(args.index_dir, args.csv, args.cache)
+    arrays["token_label_positive"] = segment_sums(label_positive, tokens.postings, tokens.offsets).astype(np.uint32)
+    arrays["token_predicted_positive"] = segment_sums(predicted_positive, tokens.postings, tokens.offsets).astype(np.uint32)
+    arrays["token_score_sum"] = segment_sums(scores, tokens.postings, tokens.offsets).astype(np.float32)
+    timings["rollups"] = time.perf_counter() - start
+
+    save_arrays(args.index_dir, SCORES_PREFIX, arrays, fingerprint)
+    summary = dict(agreement(label_positive, predicted_positive), model_version=version,
+                   mean_score=float(scores.mean()) if len(scores) else None,
+                   created=time.strftime("%Y-%m-%dT%H:%M:%S"), timings=timings)
+    summary_path = os.path.join(args.index_dir, SUMMARY_FILE)
+    with open(summary_path + '.tmp', 'w') as summary_file:
+        json.dump(summary, summary_file, indent=2)
+    os.replace(summary_path + '.tmp', summary_path)
+    return summary
+
+class CorpusScores:
+    """Read-only view of the precomputed scores and rollups."""
+
+    def __init__(self, arrays, summary):
+        self.arrays = arrays
+        self.summary = summary
+        self.scores = arrays["scores"]
+
+    @classmethod
+    def load(cls, directory=INDEX_DIR, cache_path=dataset_cache.CACHE_FILE):
+        """Memory-map the scores for the current dataset cache, None if missing or stale."""
+        try:
+            fingerprint = dataset_cache.cached_fingerprint(cache_path)
+            with open(os.path.join(directory, SUMMARY_FILE)) as summary_file:
+                summary = json.load(summary_file)
+        except (OSError, ValueError):
+            return None
+        arrays = load_arrays(directory, SCORES_PREFIX, SCORE_ARRAYS, fingerprint)
+        if arrays is None:
+            return None
+        return cls(arrays, summary)
+
+    @property
+    def model_version(self):
+        return self.summary.get("model_version")
+
+    # Model-vs-label agreement on a subset of rows
+    def agreement_for_rows(self, rows, targets):
+        rows = np.asarray(rows)
+        label_positive = (targets.iloc[rows].astype(object) == "Positive").to_numpy(dtype=bool)
+        result = agreement(label_positive, np.asarray(self.scores)[rows] > 0.5)
+        result["mean_score"] = float(np.asarray(self.scores)[rows].mean()) if len(rows) else None
+        return result
+
+    # Predicted positive count and mean score over the given user key ids
+    def for_users(self, key_ids, users):
+        key_ids = np.asarray(key_ids, dtype=np.int64)
+        tweets = int((users.offsets[key_ids + 1] - users.offsets[key_ids]).sum())
+        predicted = int(self.arrays["user_predicted_positive"][key_ids].sum())
+        return {
+            "tweets": tweets,
+            "predicted_positive": predicted,
+            "predicted_positive_ratio": predicted / tweets if tweets else 0.0,
+            "mean_score": float(self.arrays["user_score_sum"][key_ids].sum()) / tweets if tweets else None,
+        }
+
+    # Label and model view of one search index token, None if the token is unknown
+    def for_token(self, token, tokens):
+        position = find_key(tokens.vocab, token.lower().encode('utf-8'))
+        if position < 0:
+            return None
+        tweets = int(tokens.offsets[position + 1] - tokens.offsets[position])
+        return {
+            "token": token.lower(),
+            "tweets": tweets,
+            "label_positive_ratio": int(self.arrays["token_label_positive"][position]) / tweets,
+            "predicted_positive_ratio": int(self.arrays["token_predicted_positive"][position]) / tweets,
+            "mean_score": float(self.arrays["token_score_sum"][position]) / tweets,
+        }
+
+    # Most frequent tokens with label and model positive ratios
+    def top_tokens(self, tokens, limit=20, stop_words=frozenset()):
+        counts = np.diff(np.asarray(tokens.offsets))
+        order = np.argsort(counts)[::-1]
+        result = []
+        for position in order:
+            token = tokens.vocab[position].decode('utf-8')
+            if token in stop_words or len(token) < 2:
+                continue
+            tweets = int(counts[position])
+            result.append({
+                "token": token,
+                "tweets": tweets,
+                "label_positive_ratio": int(self.arrays["token_label_positive"][position]) / tweets,
+                "predicted_positive_ratio": int(self.arrays["token_predicted_positive"][position]) / tweets,
+            })
+            if len(result) == limit:
+                break
+        return result
+
+    # Per-day label and model positive ratios as a DataFrame
+    def daily(self):
+        tweets = np.asarray(self.arrays["day_tweets"], dtype=np.float64)
+        return pd.DataFrame({
+            "day": np.asarray(self.arrays["day_dates"]).astype('datetime64[D]'),
+            "tweets": np.asarray(self.arrays["day_tweets"]),
+            "label positive": np.asarray(self.arrays["day_label_positive"]) / tweets,
+            "model positive": np.asarray(self.arrays["day_predicted_positive"]) / tweets,
+            "mean score": np.asarray(self.arrays["day_score_sum"]) / tweets,
+        })
+
+def main():
+    parser = argparse.ArgumentParser(description="Score every tweet of the dataset once and precompute rollups.")
+    parser.add_argument("--csv", default=dataset_cache.DATASET_CSV, help="Path to the source CSV")
+    parser.add_argument("--cache", default=dataset_cache.CACHE_FILE, help="Path of the dataset cache")
+    parser.add_argument("--index-dir", default=INDEX_DIR, help="Directory with the indexes; scores are written here too")
+    parser.add_argument("--model", default=inference.MODEL_PATH, help="Path to model.pkl")
+    parser.add_argument("--vectorizer", default=inference.VECTORIZER_PATH, help="Path to vectorizer.pkl")
+    parser.add_argument("--artifact-dir", default=artifact.ARTIFACT_DIR, help="Model artifact directory ('' for pickles only)")
+    parser.add_argument("--workers", type=int, default=None, help="Scoring processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Tweets per scoring task")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    summary = build_scores(args)
+    print(f"Scored {summary['tweets']} tweets with model {summary['model_version']} in "
+          f"{summary['timings']['score']:.1f}s; model agrees with the labels on {summary['agreement']:.1%}")
+
+if __name__ == "__main__":
+    main()
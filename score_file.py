@@ -0,0 +1,250 @@
+import argparse
+import contextlib
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import artifact
+import inference
+import preprocessing
+
+# Bulk scoring of exported tweet dumps.
+#
+# The input (CSV or JSON lines) is read in chunks; each chunk's texts are
+# cleaned and scored in a process pool whose workers load the model once.
+# Only a bounded number of chunks is in flight, and results are appended to
+# the output in input order, so memory stays constant whatever the file size.
+#
+# After every written chunk a small progress file next to the output records
+# how many input rows are done and how long the output is. An interrupted run
+# started again with --resume truncates the output to that length and skips
+# the rows already scored.
+
+logger = logging.getLogger("score_file")
+
+DEFAULT_CHUNK_SIZE = 10000
+PROGRESS_SUFFIX = ".progress.json"
+
+# Chunks queued per worker beyond the one it is scoring
+_IN_FLIGHT_PER_WORKER = 2
+
+def input_format(path, requested=None):
+    if requested:
+        return requested
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def progress_path(output_path):
+    return output_path + PROGRESS_SUFFIX
+
+def load_progress(output_path, input_path):
+    try:
+        with open(progress_path(output_path)) as progress_file:
+            progress = json.load(progress_file)
+    except (OSError, ValueError):
+        return None
+    if progress.get("input") != _fingerprint(input_path):
+        raise ValueError(f"{progress_path(output_path)} belongs to a different version of {input_path}; "
+                         "delete it or run without --resume")
+    return progress
+
+def save_progress(output_path, progress):
+    path = progress_path(output_path)
+    with open(path + '.tmp', 'w') as progress_file:
+        json.dump(progress, progress_file)
+    os.replace(path + '.tmp', path)
+
+class CsvFormat:
+    """Read rows of a CSV file and write them back with sentiment columns added."""
+
+    def __init__(self, text_column, header=True, encoding='utf-8', delimiter=','):
+        self.text_column = text_column
+        self.header = header
+        self.encoding = encoding
+        self.delimiter = delimiter
+        self.fieldnames = None
+        self.text_index = None
+
+    def open_input(self, path):
+        return open(path, encoding=self.encoding, errors='replace', newline='')
+
+    def records(self, input_file):
+        reader = csv.reader(input_file, delimiter=self.delimiter)
+        if self.header:
+            self.fieldnames = next(reader, [])
+            if self.text_column in self.fieldnames:
+                self.text_index = self.fieldnames.index(self.text_column)
+        if self.text_index is None:
+            if not self.text_column.isdigit():
+                raise ValueError(f"Column {self.text_column!r} not found; header is {self.fieldnames}")
+            self.text_index = int(self.text_column)
+        for row in reader:
+            yield row, row[self.text_index] if self.text_index < len(row) else ""
+
+    def write_header(self, output_file):
+        if self.header:
+            csv.writer(output_file).writerow(list(self.fieldnames) + ["sentiment", "probability"])
+
+    def write(self, output_file, records, results):
+        writer = csv.writer(output_file)
+        writer.writerows(record + [label, f"{probability:.6f}"] for record, (label, probability) in zip(records, results))
+
+class JsonlFormat:
+    """Read JSON objects, one per line, and write them back with sentiment fields added."""
+
+    def __init__(self, text_field, encoding='utf-8'):
+        self.text_field = text_field
+        self.encoding = encoding
+
+    def open_input(self, path):
+        return open(path, encoding=self.encoding, errors='replace')
+
+    def records(self, input_file):
+        for line in input_file:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = {"error": "invalid json", "line": line.rstrip('\n')}
+            text = record.get(self.text_field) if isinstance(record, dict) else None
+            yield record, text if isinstance(text, str) else ""
+
+    def write_header(self, output_file):
+        pass
+
+    def write(self, output_file, records, results):
+        for record, (label, probability) in zip(records, results):
+            if not isinstance(record, dict):
+                record = {"value": record}
+            record = dict(record, sentiment=label, probability=probability)
+            output_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+def chunks(records, chunk_size, skip=0):
+    chunk_records = []
+    texts = []
+    for i, (record, text) in enumerate(records):
+        if i < skip:
+            continue
+        chunk_records.append(record)
+        texts.append(text)
+        if len(texts) == chunk_size:
+            yield chunk_records, texts
+            chunk_records = []
+            texts = []
+    if texts:
+        yield chunk_records, texts
+
+def _labelled(probabilities):
+    return [("Positive" if probability > 0.5 else "Negative", float(probability)) for probability in probabilities]
+
+def score_file(input_path, output_path, file_format, model_path=inference.MODEL_PATH,
+               vectorizer_path=inference.VECTORIZER_PATH, artifact_dir=artifact.ARTIFACT_DIR,
+               stop_words=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, resume=False):
+    """Score every record of input_path into output_path.
+
+    Returns (rows in the output, rows scored by this run, seconds).
+    """
+    workers = workers or os.cpu_count()
+    progress = load_progress(output_path, input_path) if resume else None
+    if resume and progress is None and os.path.exists(output_path):
+        raise ValueError(f"{output_path} exists but has no progress file; nothing to resume")
+    if progress and not os.path.exists(output_path):
+        raise ValueError(f"{progress_path(output_path)} exists but {output_path} is missing; nothing to resume")
+    skip = progress["rows"] if progress else 0
+    if stop_words is None:
+        # The same stopwords the model was trained with
+        stop_words = preprocessing.load_model_stopwords()
+
+    if progress:
+        # Drop anything written after the last recorded chunk
+        with open(output_path, 'r+b') as output_file:
+            output_file.truncate(progress["output_bytes"])
+        logger.info("Resuming after %d rows", skip)
+    else:
+        progress = {"input": _fingerprint(input_path), "rows": 0, "output_bytes": 0}
+
+    rows = 0
+    start = time.perf_counter()
+    last_report = start
+    with file_format.open_input(input_path) as input_file, \
+            open(output_path, 'a' if skip or progress["output_bytes"] else 'w', encoding='utf-8', newline='') as output_file, \
+            ProcessPoolExecutor(max_workers=workers, initializer=inference.init_scoring_worker,
+                                initargs=(model_path, vectorizer_path, artifact_dir, stop_words)) as executor:
+        pending = deque()
+        header_needed = not progress["output_bytes"]
+
+        def write_oldest():
+            nonlocal rows, last_report, header_needed
+            if header_needed:
+                # The CSV header is known once the first rows were read
+                file_format.write_header(output_file)
+                header_needed = False
+            chunk_records, future = pending.popleft()
+            file_format.write(output_file, chunk_records, _labelled(future.result()))
+            output_file.flush()
+            rows += len(chunk_records)
+            progress["rows"] = skip + rows
+            progress["output_bytes"] = output_file.tell()
+            save_progress(output_path, progress)
+            now = time.perf_counter()
+            if now - last_report >= 5:
+                logger.info("%d rows, %.0f rows/s", skip + rows, rows / (now - start))
+                last_report = now
+
+        for chunk_records, texts in chunks(file_format.records(input_file), chunk_size, skip):
+            pending.append((chunk_records, executor.submit(inference.score_in_worker, texts)))
+            if len(pending) >= workers * (_IN_FLIGHT_PER_WORKER + 1):
+                write_oldest()
+        while pending:
+            write_oldest()
+        if header_needed and getattr(file_format, "fieldnames", None) is not None:
+            file_format.write_header(output_file)
+
+    # An empty input never writes a chunk, so there may be no progress file
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(progress_path(output_path))
+    return skip + rows, rows, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Score every tweet of a CSV or JSON lines file.")
+    parser.add_argument("input", help="CSV or JSONL file to score")
+    parser.add_argument("output", help="Where to write the input records with sentiment and probability added")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Input format (default: from the file extension)")
+    parser.add_argument("--text-column", default="text", help="CSV column name or 0-based index, or JSON field, holding the text")
+    parser.add_argument("--no-header", action="store_true", help="The CSV has no header row (use a numeric --text-column)")
+    parser.add_argument("--encoding", default="utf-8", help="Input encoding (ISO-8859-1 for the Sentiment140 CSV)")
+    parser.add_argument("--delimiter", default=",", help="CSV delimiter")
+    parser.add_argument("--model", default=inference.MODEL_PATH, help="Path to model.pkl")
+    parser.add_argument("--vectorizer", default=inference.VECTORIZER_PATH, help="Path to vectorizer.pkl")
+    parser.add_argument("--artifact-dir", default=artifact.ARTIFACT_DIR, help="Model artifact directory ('' for pickles only)")
+    parser.add_argument("--workers", type=int, default=None, help="Scoring processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per scoring task")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run into the same output")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    if input_format(args.input, args.format) == "csv":
+        file_format = CsvFormat(args.text_column, header=not args.no_header, encoding=args.encoding, delimiter=args.delimiter)
+    else:
+        file_format = JsonlFormat(args.text_column, encoding=args.encoding)
+    stop_words = preprocessing.load_model_stopwords()
+
+    try:
+        total, scored, seconds = score_file(args.input, args.output, file_format, args.model, args.vectorizer,
+                                            args.artifact_dir, stop_words, args.workers, args.chunk_size, args.resume)
+    except ValueError as e:
+        sys.exit(f"error: {e}")
+    print(f"Scored {scored} rows in {seconds:.1f}s ({scored / seconds if seconds else 0:.0f} rows/s); "
+          f"{total} rows in {args.output}")
+
+if __name__ == "__main__":
+    main()
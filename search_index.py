@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+import dataset_cache
+import metrics
+
+# Inverted token index over the tweet texts for the "Search dataset" view.
+#
+# The index is stored as three flat arrays so it can be memory-mapped:
+#   vocab    - sorted fixed-width byte strings, one per token
+#   offsets  - offsets[i]:offsets[i + 1] is the posting list of vocab[i]
+#   postings - sorted uint32 row ids of the tweets containing each token
+# Looking a token up is a binary search on the mapped vocab and returns a
+# view of the mapped postings, so a query never touches the whole corpus.
+
+INDEX_DIR = dataset_cache.CACHE_DIR
+INDEX_FORMAT_VERSION = "1"
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+MAX_TOKEN_LENGTH = 32
+
+# Number of texts tokenized together while building the index
+BUILD_CHUNK_SIZE = 200000
+
+_QUERY_PHRASE_RE = re.compile(r'"([^"]*)"')
+_QUERY_OR_RE = re.compile(r'\s+OR\s+')
+
+# Split lowercased text into index tokens
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if len(token) <= MAX_TOKEN_LENGTH]
+
+# Build flat CSR-style (vocab, offsets, postings) arrays from per-row token lists.
+# Shared with the user index, which indexes user names the same way.
+def build_postings(token_lists):
+    token_ids = {}
+    row_parts = []
+    code_parts = []
+    for chunk_start, chunk in token_lists:
+        exploded = chunk.explode().dropna()
+        if exploded.empty:
+            continue
+        pairs = pd.DataFrame({
+            'row': exploded.index.to_numpy(dtype='int64') + chunk_start,
+            'token': exploded.to_numpy(dtype=object),
+        }).drop_duplicates()
+        local_codes, local_tokens = pd.factorize(pairs['token'])
+        mapping = np.empty(len(local_tokens), dtype=np.uint32)
+        for i, token in enumerate(local_tokens):
+            mapping[i] = token_ids.setdefault(token, len(token_ids))
+        row_parts.append(pairs['row'].to_numpy(dtype=np.uint32))
+        code_parts.append(mapping[local_codes])
+
+    tokens = np.array(list(token_ids), dtype=object)
+    order = np.argsort(tokens, kind='stable')
+    rank = np.empty(len(tokens), dtype=np.uint32)
+    rank[order] = np.arange(len(tokens), dtype=np.uint32)
+
+    rows = np.concatenate(row_parts) if row_parts else np.empty(0, dtype=np.uint32)
+    codes = rank[np.concatenate(code_parts)] if code_parts else np.empty(0, dtype=np.uint32)
+    sort = np.lexsort((rows, codes))
+
+    vocab = np.array([token.encode('utf-8') for token in tokens[order]], dtype=bytes)
+    if vocab.dtype.itemsize == 0:
+        vocab = vocab.astype('S1')
+    offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes, minlength=len(tokens)), out=offsets[1:])
+    return vocab, offsets, rows[sort]
+
+def _chunked_token_lists(texts, pattern, max_length, chunk_size=BUILD_CHUNK_SIZE):
+    for start in range(0, len(texts), chunk_size):
+        chunk = texts.iloc[start:start + chunk_size].astype(object).str.lower().str.findall(pattern)
+        chunk.index = np.arange(len(chunk))
+        chunk = chunk.map(lambda tokens: [t for t in tokens if len(t) <= max_length])
+        yield start, chunk
+
+# Save the index arrays and the fingerprint of the data they were built from
+def save_arrays(directory, prefix, arrays, fingerprint):
+    os.makedirs(directory, exist_ok=True)
+    for name, array in arrays.items():
+        tmp_path = os.path.join(directory, f"{prefix}_{name}.tmp.npy")
+        np.save(tmp_path, array)
+        os.replace(tmp_path, os.path.join(directory, f"{prefix}_{name}.npy"))
+    meta_path = os.path.join(directory, f"{prefix}_meta.json")
+    with open(meta_path + '.tmp', 'w') as meta_file:
+        json.dump({"format_version": INDEX_FORMAT_VERSION, "source": fingerprint}, meta_file)
+    os.replace(meta_path + '.tmp', meta_path)
+
+# Memory-map saved index arrays, or return None if they are missing or stale
+def load_arrays(directory, prefix, names, fingerprint):
+    meta_path = os.path.join(directory, f"{prefix}_meta.json")
+    try:
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+    except (OSError, ValueError):
+        return None
+    if meta.get("format_version") != INDEX_FORMAT_VERSION or meta.get("source") != fingerprint:
+        return None
+    try:
+        return {
+            name: np.load(os.path.join(directory, f"{prefix}_{name}.npy"), mmap_mode='r')
+            for name in names
+        }
+    except (OSError, ValueError):
+        return None
+
+# Binary search for an exact key in a sorted byte-string array, -1 if absent
+def find_key(keys, key):
+    if len(key) > keys.dtype.itemsize:
+        return -1
+    position = int(np.searchsorted(keys, key))
+    if position < len(keys) and keys[position] == key:
+        return position
+    return -1
+
+# Range [lo, hi) of the keys in a sorted byte-string array starting with prefix
+def prefix_range(keys, prefix):
+    if len(prefix) >= keys.dtype.itemsize:
+        position = find_key(keys, prefix)
+        return (position, position + 1) if position >= 0 else (0, 0)
+    lo = int(np.searchsorted(keys, prefix))
+    hi = int(np.searchsorted(keys, prefix + b'\xff'))
+    return lo, hi
+
+# Intersect sorted row-id arrays, smallest first so work stays proportional to the rarest term
+def intersect_all(row_lists):
+    row_lists = sorted(row_lists, key=len)
+    result = row_lists[0]
+    for rows in row_lists[1:]:
+        if len(result) == 0:
+            break
+        if len(rows) == 0:
+            return rows
+        positions = np.searchsorted(rows, result)
+        positions[positions == len(rows)] = 0
+        result = result[rows[positions] == result]
+    return result
+
+def union_all(row_lists):
+    row_lists = [rows for rows in row_lists if len(rows)]
+    if not row_lists:
+        return np.empty(0, dtype=np.uint32)
+    if len(row_lists) == 1:
+        return row_lists[0]
+    return np.unique(np.concatenate(row_lists))
+
+class SearchIndex:
+    def __init__(self, vocab, offsets, postings):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.postings = postings
+
+    @classmethod
+    def build(cls, texts):
+        vocab, offsets, postings = build_postings(_chunked_token_lists(texts, TOKEN_RE.pattern, MAX_TOKEN_LENGTH))
+        return cls(vocab, offsets, postings)
+
+    def save(self, directory, fingerprint):
+        save_arrays(directory, "search", {
+            "vocab": self.vocab, "offsets": self.offsets, "postings": self.postings,
+        }, fingerprint)
+
+    @classmethod
+    def load(cls, directory, fingerprint):
+        arrays = load_arrays(directory, "search", ("vocab", "offsets", "postings"), fingerprint)
+        if arrays is None:
+            return None
+        return cls(arrays["vocab"], arrays["offsets"], arrays["postings"])
+
+    def __len__(self):
+        return len(self.vocab)
+
+    # Sorted row ids of the tweets containing token (a view, no copy)
+    def rows_for_token(self, token):
+        position = find_key(self.vocab, token.encode('utf-8'))
+        if position < 0:
+            return self.postings[:0]
+        return self.postings[self.offsets[position]:self.offsets[position + 1]]
+
+    # Rows containing any token that starts with prefix
+    def rows_for_prefix(self, prefix):
+        lo, hi = prefix_range(self.vocab, prefix.encode('utf-8'))
+        # Posting lists of consecutive vocab entries are stored back to back
+        rows = self.postings[self.offsets[lo]:self.offsets[hi]]
+        return rows if hi - lo == 1 else np.unique(rows)
+
+    # Exact token match, falling back to a prefix match for partial words
+    def rows_for_term(self, token):
+        rows = self.rows_for_token(token)
+        if len(rows) == 0:
+            rows = self.rows_for_prefix(token)
+        return rows
+
+    def _match_clause(self, clause, texts):
+        phrases = [phrase.strip().lower() for phrase in _QUERY_PHRASE_RE.findall(clause) if phrase.strip()]
+        words = _QUERY_PHRASE_RE.sub(' ', clause)
+        tokens = tokenize(words) + [token for phrase in phrases for token in tokenize(phrase)]
+        if not tokens:
+            return self.postings[:0]
+        # Words with punctuation (e.g. "#ff", "can't") are verified as phrases too
+        phrases += [word.lower() for word in words.split() if ' '.join(tokenize(word)) != word.lower()]
+
+        rows = intersect_all([self.rows_for_term(token) for token in dict.fromkeys(tokens)])
+        if phrases and texts is not None and len(rows):
+            candidates = texts.iloc[rows].astype(object).str.lower()
+            keep = np.ones(len(rows), dtype=bool)
+            for phrase in phrases:
+                keep &= candidates.str.contains(phrase, regex=False).to_numpy(dtype=bool)
+            rows = rows[keep]
+        return rows
+
+    @metrics.timed("search")
+    def search(self, query, texts=None):
+        """Return the sorted row ids matching query.
+
+        Words are ANDed together, clauses separated by ``OR`` are unioned,
+        words missing from the vocabulary match as prefixes, and quoted
+        phrases are checked against ``texts`` for the candidate rows only.
+        """
+        clauses = [clause for clause in _QUERY_OR_RE.split(query.strip()) if clause.strip()]
+        return union_all([self._match_clause(clause, texts) for clause in clauses])
+
+# One page of sorted row ids after cursor, the last row id of the page before.
+# Returns (page, offset of the page, cursor of the next page or None on the last page).
+# A cursor of -1 starts at the first row; each page costs one binary search.
+def page_rows(rows, cursor, page_size):
+    rows = np.asarray(rows)
+    start = int(np.searchsorted(rows, cursor, side='right'))
+    page = rows[start:start + page_size]
+    next_cursor = int(page[-1]) if start + page_size < len(rows) else None
+    return page, start, next_cursor
+
+# Load the persisted index for the current dataset cache, rebuilding it if stale
+@metrics.timed("search_index_load")
+def load_or_build(directory=INDEX_DIR, csv_path=dataset_cache.DATASET_CSV, cache_path=dataset_cache.CACHE_FILE):
+    if dataset_cache.is_stale(csv_path, cache_path):
+        dataset_cache.build_cache(csv_path, cache_path)
+    fingerprint = dataset_cache.cached_fingerprint(cache_path)
+    index = SearchIndex.load(directory, fingerprint)
+    if index is None:
+        texts = dataset_cache.load_dataset(['text'], csv_path, cache_path)['text']
+        SearchIndex.build(texts).save(directory, fingerprint)
+        index = SearchIndex.load(directory, fingerprint)
+    return index
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the inverted token index for the dataset search.")
+    parser.add_argument("--csv", default=dataset_cache.DATASET_CSV, help="Path to the source CSV")
+    parser.add_argument("--dir", default=INDEX_DIR, help="Directory to write the index to")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = load_or_build(args.dir, args.csv)
+    print(f"Index with {len(index)} tokens and {len(index.postings)} postings ready in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
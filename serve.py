@@ -0,0 +1,393 @@
+import argparse
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+import artifact
+import fast_path
+import inference
+import metrics
+import prediction_cache
+import preprocessing
+
+# Headless HTTP inference service.
+#
+# The model and vectorizer are loaded once at startup and hot-swapped when a
+# new artifact version is published. Concurrent requests are queued and merged
+# into micro-batches so a burst of single-text requests costs one
+# vectorizer.transform and one predict_proba instead of one per request.
+#
+#   POST /predict        {"text": "..."}           -> {"sentiment": ..., "probability": ...}
+#   POST /predict_batch  {"texts": ["...", ...]}   -> {"results": [{...}, ...]}
+#   POST /explain        {"text": "..."} or {"texts": [...]}, optional "top_k"
+#                        -> predictions with the terms that pushed them up or down
+#   GET  /search?q=...&page_size=N&cursor=C        a page of dataset tweets with predictions (with --dataset);
+#                        pass the returned next_cursor to get the following page
+#   GET  /health
+#   GET  /metrics                                     Prometheus text format
+#   GET  /profile        collapsed stacks (?format=top for the hottest functions)
+#   POST /profile        {"action": "start" | "stop" | "reset", "interval": seconds}
+
+logger = logging.getLogger("serve")
+
+DEFAULT_MAX_BATCH_SIZE = 256
+DEFAULT_MAX_WAIT_MS = 5.0
+DEFAULT_MAX_QUEUE = 1024
+MAX_TEXTS_PER_REQUEST = 10000
+MAX_TOP_K = 50
+DEFAULT_SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 1000
+
+# Dataset columns /search returns
+SEARCH_COLUMNS = ('target', 'user', 'text')
+
+class MicroBatcher:
+    """Merge queued requests into batches of at most max_batch_size texts.
+
+    A batch is flushed once it is full or max_wait_ms after its first request
+    arrived. The queue holds at most max_queue requests; submit() raises
+    asyncio.QueueFull beyond that so callers can shed load.
+    """
+
+    def __init__(self, score_batch, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS, max_queue=DEFAULT_MAX_QUEUE):
+        self.score_batch = score_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        # Scoring is CPU bound and releases the GIL in numpy/scipy; one thread keeps batches ordered
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scorer")
+        self.batches = 0
+        self.texts = 0
+        self._task = None
+        # Requests taken off the queue for the batch being collected or scored
+        self._batch = []
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # Requests still waiting would otherwise hang until their clients time out
+        waiting = [future for _, future in self._batch]
+        while not self.queue.empty():
+            waiting.append(self.queue.get_nowait()[1])
+        for future in waiting:
+            if not future.done():
+                future.set_exception(web.HTTPServiceUnavailable(text="Server is shutting down"))
+        self.executor.shutdown(wait=False)
+
+    async def submit(self, texts):
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((texts, future))
+        return await future
+
+    async def _collect(self):
+        batch = self._batch = [await self.queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            texts = [text for request_texts, _ in batch for text in request_texts]
+            try:
+                with metrics.timed("batch"):
+                    labels, probabilities = await loop.run_in_executor(self.executor, self.score_batch, texts)
+            except Exception as e:
+                metrics.inc("batch_errors")
+                logger.exception("Scoring a batch of %d texts failed", len(texts))
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            metrics.inc("batches")
+            metrics.inc("batched_texts", len(texts))
+            start = 0
+            for request_texts, future in batch:
+                end = start + len(request_texts)
+                if not future.done():
+                    future.set_result(list(zip(labels[start:end], probabilities[start:end])))
+                start = end
+
+def _result(label, probability):
+    return {"sentiment": label, "probability": probability}
+
+async def _read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="Request body must be JSON")
+
+async def _score(request, texts):
+    try:
+        return await request.app["batcher"].submit(texts)
+    except asyncio.QueueFull:
+        metrics.inc("rejected_requests")
+        raise web.HTTPServiceUnavailable(text="Server is overloaded, retry later", headers={"Retry-After": "1"})
+
+async def handle_predict(request):
+    body = await _read_json(request)
+    text = body.get("text") if isinstance(body, dict) else None
+    if not isinstance(text, str):
+        raise web.HTTPBadRequest(text='Expected {"text": "..."}')
+    [(label, probability)] = await _score(request, [text])
+    return web.json_response(_result(label, probability))
+
+async def handle_predict_batch(request):
+    body = await _read_json(request)
+    texts = body.get("texts") if isinstance(body, dict) else None
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        raise web.HTTPBadRequest(text='Expected {"texts": ["...", ...]}')
+    if len(texts) > MAX_TEXTS_PER_REQUEST:
+        raise web.HTTPRequestEntityTooLarge(max_size=MAX_TEXTS_PER_REQUEST, actual_size=len(texts))
+    results = await _score(request, texts) if texts else []
+    return web.json_response({"results": [_result(label, probability) for label, probability in results]})
+
+def _explanation(result):
+    return dict(_result(result["sentiment"], result["probability"]),
+                positive=[{"term": term, "contribution": contribution} for term, contribution in result["positive"]],
+                negative=[{"term": term, "contribution": contribution} for term, contribution in result["negative"]])
+
+# Explanations skip the micro-batcher and cache; they run on the default executor
+async def handle_explain(request):
+    body = await _read_json(request)
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text='Expected {"text": "..."} or {"texts": ["...", ...]}')
+    single = "text" in body
+    texts = [body["text"]] if single else body.get("texts")
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        raise web.HTTPBadRequest(text='Expected {"text": "..."} or {"texts": ["...", ...]}')
+    if len(texts) > MAX_TEXTS_PER_REQUEST:
+        raise web.HTTPRequestEntityTooLarge(max_size=MAX_TEXTS_PER_REQUEST, actual_size=len(texts))
+    top_k = body.get("top_k", fast_path.DEFAULT_TOP_K)
+    if not isinstance(top_k, int) or isinstance(top_k, bool) or not 1 <= top_k <= MAX_TOP_K:
+        raise web.HTTPBadRequest(text=f"top_k must be an integer from 1 to {MAX_TOP_K}")
+    handle = request.app["model_handle"]
+
+    def explain():
+        # get() may load a new model, so it runs here rather than on the event loop
+        loaded = handle.get()
+        return inference.explain_batch(texts, loaded.model, loaded.vectorizer, request.app["stop_words"], top_k)
+
+    try:
+        results = await asyncio.get_running_loop().run_in_executor(None, explain)
+    except ValueError as e:
+        raise web.HTTPNotImplemented(text=str(e))
+    if single:
+        return web.json_response(_explanation(results[0]))
+    return web.json_response({"results": [_explanation(result) for result in results]})
+
+async def handle_search(request):
+    import search_index
+
+    query = request.query.get("q", "").strip()
+    if not query:
+        raise web.HTTPBadRequest(text="Expected ?q=keywords")
+    try:
+        page_size = min(max(int(request.query.get("page_size", DEFAULT_SEARCH_PAGE_SIZE)), 1), MAX_SEARCH_PAGE_SIZE)
+        cursor = int(request.query.get("cursor", -1))
+    except ValueError:
+        raise web.HTTPBadRequest(text="page_size and cursor must be integers")
+    dataset = request.app["dataset"]
+
+    # Pages in dataset order, like the app: the cursor is the last row id of the previous page
+    def search():
+        rows = request.app["tweet_index"].search(query, dataset['text'])
+        page, _, next_cursor = search_index.page_rows(rows, cursor, page_size)
+        return rows, dataset.iloc[page], next_cursor
+
+    # Phrase checks can read many rows; keep them off the event loop so /predict stays responsive
+    rows, matches, next_cursor = await asyncio.get_running_loop().run_in_executor(request.app["search_executor"], search)
+    texts = matches['text'].astype(str).tolist()
+    results = await _score(request, texts) if texts else []
+    return web.json_response({
+        "query": query,
+        "matches": len(rows),
+        "next_cursor": next_cursor,
+        "results": [
+            dict(_result(label, probability), user=user, text=text, label=target)
+            for user, text, target, (label, probability)
+            in zip(matches['user'].astype(str), texts, matches['target'].astype(str), results)
+        ],
+    })
+
+async def handle_health(request):
+    batcher = request.app["batcher"]
+    return web.json_response({
+        "status": "ok",
+        # current never reloads; the scoring thread picks up new models
+        "model_version": request.app["model_handle"].current.version,
+        "queued": batcher.queue.qsize(),
+        "batches": batcher.batches,
+        "texts": batcher.texts,
+        "cache": request.app["prediction_cache"].stats() if request.app["prediction_cache"] is not None else None,
+    })
+
+async def handle_metrics(request):
+    return web.Response(text=metrics.render_prometheus(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+async def handle_profile(request):
+    profiler = metrics.PROFILER
+    if request.query.get("format") == "top":
+        return web.json_response({
+            "running": profiler.running,
+            "samples": profiler.samples,
+            "top": [{"function": name, "samples": count, "share": share} for name, count, share in profiler.top()],
+        })
+    return web.Response(text=profiler.collapsed(), content_type="text/plain")
+
+async def handle_profile_control(request):
+    body = await _read_json(request)
+    action = body.get("action") if isinstance(body, dict) else None
+    profiler = metrics.PROFILER
+    if action == "start":
+        interval = body.get("interval")
+        if interval is not None and (not isinstance(interval, (int, float)) or interval <= 0):
+            raise web.HTTPBadRequest(text="interval must be a positive number of seconds")
+        profiler.start(interval)
+    elif action == "stop":
+        profiler.stop()
+    elif action == "reset":
+        profiler.reset()
+    else:
+        raise web.HTTPBadRequest(text='Expected {"action": "start" | "stop" | "reset"}')
+    logger.info("Profiler %s", action)
+    return web.json_response({"running": profiler.running, "samples": profiler.samples, "interval": profiler.interval})
+
+def create_app(handle, stop_words, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+               max_wait_ms=DEFAULT_MAX_WAIT_MS, max_queue=DEFAULT_MAX_QUEUE, cache=None,
+               dataset=None, tweet_index=None):
+    def score_batch(texts):
+        # Each batch picks up a newly published model, so swaps never split a batch
+        loaded = handle.get()
+        return inference.predict_sentiment_batch(texts, loaded.model, loaded.vectorizer, stop_words,
+                                                 chunk_size=max(len(texts), 1), cache=cache, model_version=loaded.version)
+
+    batcher = MicroBatcher(score_batch, max_batch_size, max_wait_ms, max_queue)
+
+    def collect():
+        gauges = {"queued_requests": batcher.queue.qsize(), "profiler_running": int(metrics.PROFILER.running)}
+        if cache is not None:
+            stats = cache.stats()
+            gauges.update({"prediction_cache_entries": stats["entries"], "prediction_cache_hit_rate": stats["hit_rate"],
+                           "prediction_cache_evictions": stats["evictions"]})
+        return gauges
+
+    # Replaces the collector of an earlier app, so only the live batcher is reported
+    metrics.add_collector("serve", collect)
+
+    async def on_startup(app):
+        batcher.start()
+
+    # One thread is enough: searches are mostly Python and would share the GIL anyway
+    search_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search") if dataset is not None else None
+
+    async def on_cleanup(app):
+        await batcher.stop()
+        if search_executor is not None:
+            search_executor.shutdown(wait=False)
+
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app["batcher"] = batcher
+    app["model_handle"] = handle
+    app["stop_words"] = stop_words
+    app["prediction_cache"] = cache
+    app["dataset"] = dataset
+    app["tweet_index"] = tweet_index
+    app["search_executor"] = search_executor
+    app.router.add_post("/predict", handle_predict)
+    app.router.add_post("/predict_batch", handle_predict_batch)
+    app.router.add_post("/explain", handle_explain)
+    if dataset is not None and tweet_index is not None:
+        app.router.add_get("/search", handle_search)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/profile", handle_profile)
+    app.router.add_post("/profile", handle_profile_control)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+def add_arguments(parser):
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model", default=inference.MODEL_PATH, help="Path to model.pkl")
+    parser.add_argument("--vectorizer", default=inference.VECTORIZER_PATH, help="Path to vectorizer.pkl")
+    parser.add_argument("--artifact-dir", default=artifact.ARTIFACT_DIR, help="Model artifact directory, watched for new versions ('' for pickles only)")
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE, help="Maximum texts per micro-batch")
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS, help="How long a batch waits for more requests")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE, help="Queued requests before answering 503")
+    parser.add_argument("--cache-size", type=int, default=prediction_cache.DEFAULT_MAX_ENTRIES, help="Cached predictions kept in memory (0 disables the cache)")
+    parser.add_argument("--cache-ttl", type=float, default=prediction_cache.DEFAULT_TTL, help="Seconds a cached prediction stays valid")
+    parser.add_argument("--cache-db", help="SQLite file for a persistent cache tier")
+    parser.add_argument("--access-log", action="store_true", help="Log every request")
+    parser.add_argument("--metrics-log-interval", type=float, default=0, help="Also log a JSON metrics snapshot every N seconds (0 disables)")
+    parser.add_argument("--profile", action="store_true", help="Start the sampling profiler at launch (toggle later via POST /profile)")
+    parser.add_argument("--dataset", action="store_true", help="Also serve GET /search over the cached Sentiment140 dataset")
+
+# The model, stop words and optional dataset, all read-only once loaded.
+# workers.py loads them once before forking so every worker shares them.
+def load_resources(args):
+    handle = inference.ModelHandle(args.model, args.vectorizer, args.artifact_dir)
+    logger.info("Loaded model version %s", handle.get().version)
+    resources = {"handle": handle, "stop_words": preprocessing.load_model_stopwords(), "dataset": None, "tweet_index": None}
+    if args.dataset:
+        import dataset_cache
+        import search_index
+
+        resources["dataset"] = dataset_cache.load_dataset(list(SEARCH_COLUMNS))
+        resources["tweet_index"] = search_index.load_or_build()
+        logger.info("Loaded %d dataset rows and their search index", len(resources["dataset"]))
+    return resources
+
+# Per-process state (prediction cache, batcher) around the shared resources
+def build_app(args, resources):
+    cache = prediction_cache.PredictionCache(args.cache_size, args.cache_ttl, args.cache_db) if args.cache_size > 0 else None
+    return create_app(resources["handle"], resources["stop_words"], args.max_batch_size, args.max_wait_ms,
+                      args.max_queue, cache, resources["dataset"], resources["tweet_index"])
+
+def start_reporters(args):
+    if args.metrics_log_interval > 0:
+        metrics.LogReporter(args.metrics_log_interval).start()
+    if args.profile:
+        metrics.PROFILER.start()
+
+def access_log(args):
+    return logging.getLogger("aiohttp.access") if args.access_log else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve sentiment predictions over HTTP.")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    app = build_app(args, load_resources(args))
+    start_reporters(args)
+    web.run_app(app, host=args.host, port=args.port, access_log=access_log(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,491 @@
+import argparse
+import csv
+import heapq
+import json
+import logging
+import math
+import os
+import queue
+import socket
+import threading
+import time
+from collections import deque, namedtuple
+
+import dataset_cache
+import inference
+import metrics
+import preprocessing
+import search_index
+
+# Streaming ingestion and live sentiment aggregates.
+#
+# A source (CSV replay at a fixed rate, a followed file or a local TCP socket)
+# runs in its own thread and pushes events into a bounded queue. The scorer
+# thread drains the queue in micro-batches, scores each batch with one
+# predict_sentiment_batch call and folds the results into SlidingWindow
+# aggregates. Each event is added to the running totals once and subtracted
+# once when its minute leaves the window, so updates are O(1) per event and
+# key; readers only ever look at the totals and never rescan events.
+
+logger = logging.getLogger("streaming")
+
+# A tweet arriving on the stream; timestamp is epoch seconds
+Event = namedtuple('Event', ['timestamp', 'user', 'text'])
+
+DEFAULT_RATE = 50.0
+DEFAULT_WINDOW_MINUTES = 15
+DEFAULT_MAX_BATCH_SIZE = 256
+DEFAULT_MAX_WAIT = 0.2
+DEFAULT_QUEUE_SIZE = 10000
+MAX_KEYWORDS_PER_EVENT = 20
+
+# Record timestamps further ahead of the local clock than this are treated as arrival time
+MAX_CLOCK_SKEW = 60.0
+
+# Build an event from a JSON object line ({"text": ..., "user": ...}) or plain text
+def parse_line(line, timestamp=None):
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith('{'):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if isinstance(record, dict) and isinstance(record.get("text"), str):
+            return Event(_record_timestamp(record, timestamp), str(record.get("user") or ""), record["text"])
+    return Event(timestamp or time.time(), "", line)
+
+# Epoch seconds of a JSON record. Missing, non-numeric, non-finite and
+# future timestamps count as arrival time.
+def _record_timestamp(record, timestamp=None):
+    arrival = timestamp or time.time()
+    try:
+        value = float(record["timestamp"])
+    except (KeyError, TypeError, ValueError):
+        if record.get("timestamp") is not None:
+            metrics.inc("stream_bad_timestamps")
+        return arrival
+    if not math.isfinite(value) or value > time.time() + MAX_CLOCK_SKEW:
+        metrics.inc("stream_bad_timestamps")
+        return arrival
+    return value
+
+def replay_csv(path=dataset_cache.DATASET_CSV, rate=DEFAULT_RATE, loop=False, stop=None):
+    """Yield the rows of a Sentiment140-format CSV as events at rate per second.
+
+    Events are stamped with the replay time so the live windows fill up as if
+    the tweets were arriving now. rate <= 0 replays as fast as possible.
+    """
+    stop = stop or threading.Event()
+    interval = 1.0 / rate if rate > 0 else 0.0
+    next_time = time.monotonic()
+    while not stop.is_set():
+        with open(path, encoding='ISO-8859-1', newline='') as csv_file:
+            for row in csv.reader(csv_file):
+                if stop.is_set():
+                    return
+                if len(row) < 6:
+                    continue
+                if interval:
+                    next_time += interval
+                    delay = next_time - time.monotonic()
+                    if delay > 0:
+                        stop.wait(delay)
+                    elif delay < -1.0:
+                        # Fell behind (slow consumer); do not burst to catch up
+                        next_time = time.monotonic()
+                yield Event(time.time(), row[4], row[5])
+        if not loop:
+            return
+
+def tail_file(path, from_start=False, poll_interval=0.25, stop=None):
+    """Follow a file like ``tail -f`` and yield one event per line.
+
+    Lines are JSON objects with "text" and optional "user"/"timestamp", or
+    plain tweet text. Truncation or replacement of the file (log rotation) is
+    detected and reading restarts at the top of the new file.
+    """
+    stop = stop or threading.Event()
+    while not os.path.exists(path):
+        if stop.wait(poll_interval):
+            return
+    tail_file_handle = open(path, encoding='utf-8', errors='replace')
+    try:
+        if not from_start:
+            tail_file_handle.seek(0, os.SEEK_END)
+        inode = os.fstat(tail_file_handle.fileno()).st_ino
+        partial = ""
+        while not stop.is_set():
+            line = tail_file_handle.readline()
+            if line:
+                if not line.endswith('\n'):
+                    # Writer has not finished the line yet
+                    partial += line
+                    continue
+                event = parse_line(partial + line)
+                partial = ""
+                if event is not None:
+                    yield event
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+            if stat is not None and (stat.st_ino != inode or stat.st_size < tail_file_handle.tell()):
+                tail_file_handle.close()
+                tail_file_handle = open(path, encoding='utf-8', errors='replace')
+                inode = os.fstat(tail_file_handle.fileno()).st_ino
+                partial = ""
+                continue
+            stop.wait(poll_interval)
+    finally:
+        tail_file_handle.close()
+
+def read_socket(host="127.0.0.1", port=9999, stop=None, poll_interval=0.25):
+    """Listen on a local TCP port and yield one event per received line.
+
+    Any number of producers can connect; lines use the same format as tail_file.
+    """
+    stop = stop or threading.Event()
+    lines = queue.Queue(maxsize=DEFAULT_QUEUE_SIZE)
+
+    def handle(connection):
+        with connection, connection.makefile('r', encoding='utf-8', errors='replace') as stream:
+            for line in stream:
+                if stop.is_set():
+                    return
+                lines.put(line)
+
+    def accept(server):
+        while not stop.is_set():
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            threading.Thread(target=handle, args=(connection,), name="stream-socket-client", daemon=True).start()
+
+    server = socket.create_server((host, port))
+    server.settimeout(poll_interval)
+    logger.info("Listening for tweets on %s:%d", host, port)
+    threading.Thread(target=accept, args=(server,), name="stream-socket-accept", daemon=True).start()
+    try:
+        while not stop.is_set():
+            try:
+                line = lines.get(timeout=poll_interval)
+            except queue.Empty:
+                continue
+            event = parse_line(line)
+            if event is not None:
+                yield event
+    finally:
+        server.close()
+
+class SlidingWindow:
+    """Positive ratios over the last window_minutes, overall and per key.
+
+    Per-minute buckets hold the counts added during that minute. When a
+    minute falls out of the window its counts are subtracted from the
+    running totals, so add() and expiry are O(1) per event and key.
+    Minutes expire by clock(), so no event timestamp can empty the window;
+    events stamped after the current minute count in it.
+    """
+
+    def __init__(self, window_minutes=DEFAULT_WINDOW_MINUTES, clock=time.time):
+        self.window_minutes = window_minutes
+        self.clock = clock
+        # (minute, positive, total, {(kind, key): [positive, total]}) oldest first
+        self.buckets = deque()
+        self.positive = 0
+        self.total = 0
+        self.keys = {}
+        self.events = 0
+        self._lock = threading.Lock()
+
+    def _bucket(self, minute):
+        if self.buckets and self.buckets[-1][0] == minute:
+            return self.buckets[-1]
+        if self.buckets and minute < self.buckets[-1][0]:
+            # Late event: count it in the closest earlier minute, which expires no later than its own
+            if minute <= self.buckets[-1][0] - self.window_minutes:
+                return None
+            for bucket in reversed(self.buckets):
+                if bucket[0] <= minute:
+                    return bucket
+            bucket = [minute, 0, 0, {}]
+            self.buckets.appendleft(bucket)
+            return bucket
+        bucket = [minute, 0, 0, {}]
+        self.buckets.append(bucket)
+        return bucket
+
+    def _expire(self, now_minute):
+        oldest = now_minute - self.window_minutes + 1
+        while self.buckets and self.buckets[0][0] < oldest:
+            _, positive, total, keys = self.buckets.popleft()
+            self.positive -= positive
+            self.total -= total
+            for key, (key_positive, key_total) in keys.items():
+                counts = self.keys[key]
+                counts[0] -= key_positive
+                counts[1] -= key_total
+                if counts[1] == 0:
+                    del self.keys[key]
+
+    def add(self, timestamp, positive, keys=()):
+        now_minute = int(self.clock() // 60)
+        minute = min(int(timestamp // 60), now_minute) if math.isfinite(timestamp) else now_minute
+        positive = int(positive)
+        with self._lock:
+            self._expire(now_minute)
+            bucket = self._bucket(minute)
+            if bucket is None:
+                # Older than the whole window
+                return
+            bucket[1] += positive
+            bucket[2] += 1
+            self.positive += positive
+            self.total += 1
+            self.events += 1
+            for key in keys:
+                counts = bucket[3].get(key)
+                if counts is None:
+                    counts = bucket[3][key] = [0, 0]
+                counts[0] += positive
+                counts[1] += 1
+                totals = self.keys.get(key)
+                if totals is None:
+                    totals = self.keys[key] = [0, 0]
+                totals[0] += positive
+                totals[1] += 1
+
+    # Drop minutes that left the window while no events arrived
+    def advance(self, timestamp=None):
+        with self._lock:
+            self._expire(int((timestamp or self.clock()) // 60))
+
+    def ratio(self):
+        with self._lock:
+            return self.positive / self.total if self.total else None
+
+    # [(minute start epoch seconds, positive, total)] oldest first
+    def per_minute(self):
+        with self._lock:
+            return [(minute * 60, positive, total) for minute, positive, total, _ in self.buckets]
+
+    # Most frequent keys of one kind with their positive ratio
+    def top(self, kind, limit=10, min_count=1):
+        with self._lock:
+            items = [(key, counts[0], counts[1]) for (key_kind, key), counts in self.keys.items()
+                     if key_kind == kind and counts[1] >= min_count]
+        return [
+            {"key": key, "tweets": total, "positive": positive, "positive_ratio": positive / total}
+            for key, positive, total in heapq.nlargest(limit, items, key=lambda item: item[2])
+        ]
+
+    def counts(self, kind, key):
+        with self._lock:
+            positive, total = self.keys.get((kind, key), (0, 0))
+        return {"tweets": total, "positive": positive, "positive_ratio": positive / total if total else None}
+
+    def summary(self):
+        with self._lock:
+            return {
+                "window_minutes": self.window_minutes,
+                "events": self.events,
+                "tweets_in_window": self.total,
+                "positive_ratio": self.positive / self.total if self.total else None,
+            }
+
+# Keyword keys of an event: its distinct non-stopword index tokens
+def event_keywords(text, stop_words):
+    tokens = [token for token in dict.fromkeys(search_index.tokenize(text))
+              if len(token) > 1 and token not in stop_words and not token.isdigit()]
+    return tokens[:MAX_KEYWORDS_PER_EVENT]
+
+class StreamPipeline:
+    """Source thread -> bounded queue -> batched scorer thread -> SlidingWindow.
+
+    source_factory(stop_event) returns an iterable of Events. get_model()
+    returns a LoadedModel, so a hot-swapped model is picked up per batch.
+    """
+
+    def __init__(self, source_factory, get_model, stop_words, window_minutes=DEFAULT_WINDOW_MINUTES,
+                 max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT,
+                 queue_size=DEFAULT_QUEUE_SIZE, cache=None, recent=20):
+        self.source_factory = source_factory
+        self.get_model = get_model
+        self.stop_words = stop_words
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.cache = cache
+        self.window = SlidingWindow(window_minutes)
+        self.recent = deque(maxlen=recent)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.batches = 0
+        self.error = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self):
+        if self.running:
+            return self
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._read, name="stream-source", daemon=True),
+            threading.Thread(target=self._score, name="stream-scorer", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _read(self):
+        try:
+            for event in self.source_factory(self._stop):
+                if self._stop.is_set():
+                    break
+                try:
+                    self.queue.put_nowait(event)
+                except queue.Full:
+                    # Shed load instead of stalling the source
+                    self.dropped += 1
+                    metrics.inc("stream_dropped")
+        except Exception as e:
+            logger.exception("Stream source failed")
+            self.error = str(e)
+        finally:
+            self._put_end()
+
+    # Queue the end marker without blocking, making room by dropping the oldest event
+    def _put_end(self):
+        while True:
+            try:
+                self.queue.put_nowait(None)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    continue
+                self.dropped += 1
+                metrics.inc("stream_dropped")
+
+    def _next_batch(self):
+        try:
+            first = self.queue.get(timeout=self.max_wait)
+        except queue.Empty:
+            return [], False
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                event = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if event is None:
+                return batch, True
+            batch.append(event)
+        return batch, False
+
+    def _score(self):
+        finished = False
+        while not finished and not self._stop.is_set():
+            batch, finished = self._next_batch()
+            if not batch:
+                self.window.advance()
+                continue
+            try:
+                self.process(batch)
+            except Exception as e:
+                logger.exception("Scoring a stream batch of %d events failed", len(batch))
+                self.error = str(e)
+
+    # Score one batch and fold it into the aggregates
+    def process(self, batch):
+        loaded = self.get_model()
+        with metrics.timed("stream_batch"):
+            labels, probabilities = inference.predict_sentiment_batch(
+                [event.text for event in batch], loaded.model, loaded.vectorizer, self.stop_words,
+                chunk_size=max(len(batch), 1), cache=self.cache,
+                model_version=loaded.version if self.cache is not None else None,
+            )
+            for event, label in zip(batch, labels):
+                keys = [("keyword", keyword) for keyword in event_keywords(event.text, self.stop_words)]
+                if event.user:
+                    keys.append(("user", event.user))
+                self.window.add(event.timestamp, label == "Positive", keys)
+        for event, label, probability in zip(batch, labels, probabilities):
+            self.recent.appendleft({"user": event.user, "text": event.text, "sentiment": label, "probability": probability})
+        self.batches += 1
+        metrics.inc("stream_events", len(batch))
+
+    def status(self):
+        return dict(self.window.summary(), running=self.running, queued=self.queue.qsize(),
+                    dropped=self.dropped, batches=self.batches, error=self.error)
+
+def source_factory(args):
+    if args.source == "replay":
+        return lambda stop: replay_csv(args.csv, args.rate, args.loop, stop)
+    if args.source == "tail":
+        return lambda stop: tail_file(args.path, args.from_start, stop=stop)
+    return lambda stop: read_socket(args.host, args.port, stop)
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a live tweet stream and print sliding-window sentiment.")
+    subparsers = parser.add_subparsers(dest="source", required=True)
+    replay = subparsers.add_parser("replay", help="Replay the training CSV at a fixed rate")
+    replay.add_argument("--csv", default=dataset_cache.DATASET_CSV)
+    replay.add_argument("--rate", type=float, default=DEFAULT_RATE, help="Tweets per second (0 for as fast as possible)")
+    replay.add_argument("--loop", action="store_true", help="Start over at the end of the file")
+    tail = subparsers.add_parser("tail", help="Follow a file of JSON or plain-text lines")
+    tail.add_argument("path")
+    tail.add_argument("--from-start", action="store_true", help="Read existing lines before following")
+    listen = subparsers.add_parser("socket", help="Accept lines on a local TCP port")
+    listen.add_argument("--host", default="127.0.0.1")
+    listen.add_argument("--port", type=int, default=9999)
+    for subparser in (replay, tail, listen):
+        subparser.add_argument("--window", type=int, default=DEFAULT_WINDOW_MINUTES, help="Window length in minutes")
+        subparser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE)
+        subparser.add_argument("--report-every", type=float, default=5.0, help="Seconds between printed summaries")
+        subparser.add_argument("--top", type=int, default=5, help="Users and keywords shown per summary")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    stop_words = preprocessing.load_model_stopwords()
+    handle = inference.ModelHandle()
+    pipeline = StreamPipeline(source_factory(args), handle.get, stop_words, args.window, args.max_batch_size).start()
+    try:
+        while pipeline.running:
+            time.sleep(args.report_every)
+            status = pipeline.status()
+            ratio = status["positive_ratio"]
+            print(f"{status['events']} events, {status['tweets_in_window']} in window, "
+                  f"positive {ratio:.1%}" if ratio is not None else f"{status['events']} events, window empty")
+            for kind in ("user", "keyword"):
+                top = pipeline.window.top(kind, args.top)
+                if top:
+                    print(f"  top {kind}s: " + ", ".join(f"{item['key']} {item['positive_ratio']:.0%} of {item['tweets']}" for item in top))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import random
+
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+
+import artifact
+import fast_path
+
+POSITIVE = "good great love happy wonderful nice awesome".split()
+NEGATIVE = "bad sad hate awful terrible angry worst".split()
+FILLER = "day work home today night time people".split()
+
+# Cleaned texts with repeated terms, so term frequencies above one are exercised
+def _texts(count, seed):
+    rng = random.Random(seed)
+    texts = []
+    labels = []
+    for i in range(count):
+        label = i % 2
+        words = rng.choices(POSITIVE if label else NEGATIVE, k=3) + rng.choices(FILLER, k=rng.randint(0, 6))
+        rng.shuffle(words)
+        texts.append(" ".join(words))
+        labels.append(label)
+    return texts, labels
+
+# Unseen texts, including unknown terms and texts with no known term at all
+def _checked_texts():
+    texts, _ = _texts(300, seed=1)
+    return texts + ["", "zebra", "good zebra good good", "love love love hate"]
+
+def _fit(**settings):
+    texts, labels = _texts(600, seed=0)
+    vectorizer = TfidfVectorizer(**settings)
+    model = LogisticRegression().fit(vectorizer.fit_transform(texts), labels)
+    return model, vectorizer
+
+@pytest.mark.parametrize("settings", [
+    {},
+    {"ngram_range": (1, 2)},
+    {"sublinear_tf": True},
+    {"binary": True, "norm": "l1"},
+    {"norm": None},
+])
+def test_parity_with_sklearn(settings):
+    model, vectorizer = _fit(**settings)
+    result = fast_path.check_parity(model, vectorizer, _checked_texts())
+    assert result["ok"], result
+
+@pytest.mark.parametrize("shared_vocabulary", [False, True])
+def test_parity_with_artifact(tmp_path, monkeypatch, shared_vocabulary):
+    model, vectorizer = _fit(ngram_range=(1, 2), sublinear_tf=True)
+    artifact.export_artifact(model, vectorizer, str(tmp_path))
+    loaded_model, loaded_vectorizer, _ = artifact.load_artifact(str(tmp_path))
+    monkeypatch.setattr(fast_path, "SHARED_VOCABULARY", shared_vocabulary)
+    result = fast_path.check_parity(loaded_model, loaded_vectorizer, _checked_texts())
+    assert result["ok"], result
+    scorer = fast_path.LinearScorer.from_model(loaded_model, loaded_vectorizer, shared_vocabulary)
+    assert (scorer.vocabulary is None) == shared_vocabulary
+
+def test_explain_sums_to_decision():
+    model, vectorizer = _fit(ngram_range=(1, 2))
+    scorer = fast_path.LinearScorer.from_model(model, vectorizer)
+    texts = _checked_texts()
+    probabilities, explanations = scorer.explain(texts, top_k=1000)
+    assert probabilities.tolist() == pytest.approx(scorer.predict_proba(texts).tolist())
+    for decision, explanation in zip(scorer.decision_function(texts), explanations):
+        total = sum(value for _, value in explanation["positive"] + explanation["negative"])
+        assert total + scorer.intercept == pytest.approx(decision)
@@ -0,0 +1,77 @@
+import os
+import pickle
+
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+
+import preprocessing
+import score_file
+
+TEXTS = ["good great day", "bad awful day", "love this", "hate this", "nice work", "terrible work", "happy people"]
+
+@pytest.fixture(scope="module")
+def model_paths(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("model")
+    stop_words = preprocessing.load_stopwords()
+    vectorizer = TfidfVectorizer()
+    features = vectorizer.fit_transform(preprocessing.clean_texts(TEXTS, stop_words))
+    model = LogisticRegression().fit(features, [1, 0, 1, 0, 1, 0, 1])
+    paths = (str(directory / "model.pkl"), str(directory / "vectorizer.pkl"))
+    for obj, path in zip((model, vectorizer), paths):
+        with open(path, 'wb') as out:
+            pickle.dump(obj, out)
+    return paths
+
+def _score(input_path, output_path, model_paths, file_format=None, **kwargs):
+    file_format = file_format or score_file.CsvFormat("text")
+    return score_file.score_file(str(input_path), str(output_path), file_format, *model_paths, artifact_dir='',
+                                 workers=1, chunk_size=2, **kwargs)
+
+def _write_csv(path, texts):
+    path.write_text("id,text\n" + "".join(f"{i},{text}\n" for i, text in enumerate(texts)))
+
+def test_scores_every_row(tmp_path, model_paths):
+    _write_csv(tmp_path / "in.csv", TEXTS)
+    total, scored, _ = _score(tmp_path / "in.csv", tmp_path / "out.csv", model_paths)
+    lines = (tmp_path / "out.csv").read_text().splitlines()
+    assert (total, scored) == (len(TEXTS), len(TEXTS))
+    assert lines[0] == "id,text,sentiment,probability"
+    assert [line.split(',')[1] for line in lines[1:]] == TEXTS
+    assert not os.path.exists(score_file.progress_path(str(tmp_path / "out.csv")))
+
+def test_resume_matches_an_uninterrupted_run(tmp_path, model_paths):
+    _write_csv(tmp_path / "in.csv", TEXTS)
+    _score(tmp_path / "in.csv", tmp_path / "expected.csv", model_paths)
+    expected = (tmp_path / "expected.csv").read_bytes()
+    # Interrupted after the header and two rows, with part of a later chunk already written
+    done = len(b''.join(expected.splitlines(keepends=True)[:3]))
+    (tmp_path / "out.csv").write_bytes(expected[:done] + b"5,partial")
+    score_file.save_progress(str(tmp_path / "out.csv"), {
+        "input": score_file._fingerprint(str(tmp_path / "in.csv")), "rows": 2, "output_bytes": done})
+    total, scored, _ = _score(tmp_path / "in.csv", tmp_path / "out.csv", model_paths, resume=True)
+    assert (total, scored) == (len(TEXTS), len(TEXTS) - 2)
+    assert (tmp_path / "out.csv").read_bytes() == expected
+
+@pytest.mark.parametrize("name, content, file_format, output", [
+    ("in.csv", "id,text\n", score_file.CsvFormat("text"), "id,text,sentiment,probability\n"),
+    ("in.jsonl", "", score_file.JsonlFormat("text"), ""),
+])
+def test_empty_input(tmp_path, model_paths, name, content, file_format, output):
+    (tmp_path / name).write_text(content)
+    for resume in (False, True):
+        assert _score(tmp_path / name, tmp_path / "out", model_paths, file_format, resume=resume)[:2] == (0, 0)
+        assert (tmp_path / "out").read_text() == output
+        assert not os.path.exists(score_file.progress_path(str(tmp_path / "out")))
+        (tmp_path / "out").unlink()
+
+def test_resume_needs_both_output_and_progress(tmp_path, model_paths):
+    _write_csv(tmp_path / "in.csv", TEXTS)
+    (tmp_path / "out.csv").write_text("id,text,sentiment,probability\n")
+    with pytest.raises(ValueError, match="no progress file"):
+        _score(tmp_path / "in.csv", tmp_path / "out.csv", model_paths, resume=True)
+    (tmp_path / "out.csv").unlink()
+    score_file.save_progress(str(tmp_path / "out.csv"), {
+        "input": score_file._fingerprint(str(tmp_path / "in.csv")), "rows": 2, "output_bytes": 10})
+    with pytest.raises(ValueError, match="is missing"):
+        _score(tmp_path / "in.csv", tmp_path / "out.csv", model_paths, resume=True)
@@ -0,0 +1,201 @@
+import argparse
+import json
+import logging
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer, TfidfTransformer, TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import make_pipeline
+
+import artifact
+import dataset_cache
+import inference
+import preprocessing
+
+# Scriptable, multi-core version of the training notebook.
+#
+# Stemming runs in a process pool over chunks of tweets. Features are built in
+# parallel as well: either a TF-IDF vocabulary is assembled from per-chunk
+# document frequencies and then used as a fixed vocabulary, or a stateless
+# hashing vectorizer is used. The resulting model.pkl and vectorizer.pkl are
+# drop-in replacements for the files app.py loads.
+
+logger = logging.getLogger("train")
+
+DEFAULT_CHUNK_SIZE = 50000
+DEFAULT_HASH_BITS = 20
+
+# Log and record the wall time of one training stage
+@contextmanager
+def stage(name, timings):
+    logger.info("%s...", name)
+    start = time.perf_counter()
+    yield
+    timings[name] = time.perf_counter() - start
+    logger.info("%s took %.2fs", name, timings[name])
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _clean_chunk(args):
+    texts, stop_words = args
+    return preprocessing.clean_texts(texts, stop_words)
+
+# Stem and clean texts in parallel, preserving order
+def preprocess_parallel(texts, stop_words, executor, chunk_size=DEFAULT_CHUNK_SIZE):
+    cleaned = []
+    for chunk in executor.map(_clean_chunk, ((chunk, stop_words) for chunk in chunked(texts, chunk_size))):
+        cleaned.extend(chunk)
+    return cleaned
+
+def _document_frequencies(args):
+    texts, ngram_range = args
+    counter = CountVectorizer(binary=True, ngram_range=ngram_range)
+    try:
+        counts = counter.fit_transform(texts)
+    except ValueError:
+        # Chunk without a single token
+        return {}
+    return dict(zip(counter.get_feature_names_out(), np.asarray(counts.sum(axis=0)).ravel().tolist()))
+
+# Build a fitted TfidfVectorizer from document frequencies counted in parallel
+def fit_tfidf_vocabulary(texts, executor, ngram_range=(1, 1), min_df=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    frequencies = {}
+    for chunk_frequencies in executor.map(_document_frequencies, ((chunk, ngram_range) for chunk in chunked(texts, chunk_size))):
+        for term, count in chunk_frequencies.items():
+            frequencies[term] = frequencies.get(term, 0) + count
+    terms = sorted(term for term, count in frequencies.items() if count >= min_df)
+    if not terms:
+        raise ValueError("Empty vocabulary; the training texts contain no tokens")
+    document_frequency = np.array([frequencies[term] for term in terms], dtype=np.float64)
+
+    vectorizer = TfidfVectorizer(vocabulary={term: i for i, term in enumerate(terms)}, ngram_range=ngram_range)
+    # Same smoothed idf TfidfVectorizer.fit computes
+    vectorizer.idf_ = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+    return vectorizer
+
+_worker_vectorizer = None
+
+def _init_transform_worker(vectorizer):
+    global _worker_vectorizer
+    _worker_vectorizer = vectorizer
+
+def _transform_chunk(texts):
+    return _worker_vectorizer.transform(texts)
+
+# Transform texts in parallel with a fitted or stateless vectorizer
+def transform_parallel(vectorizer, texts, workers, chunk_size=DEFAULT_CHUNK_SIZE):
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_transform_worker, initargs=(vectorizer,)) as executor:
+        return sp.vstack(list(executor.map(_transform_chunk, chunked(texts, chunk_size))), format='csr')
+
+# Write a pickle next to its final path first so app.py never reads a partial file
+def save_pickle(obj, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as output_file:
+        pickle.dump(obj, output_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def load_training_data(csv_path, limit=None):
+    dataset = dataset_cache.load_dataset(['target', 'text'], csv_path)
+    if limit is not None and limit < len(dataset):
+        dataset = dataset.sample(limit, random_state=0)
+    texts = dataset['text'].astype(object).tolist()
+    # Converting Negative to 0 and Positive to 1
+    labels = (dataset['target'] == "Positive").to_numpy(dtype=np.int8)
+    return texts, labels
+
+def train(args):
+    timings = {}
+    workers = args.workers or os.cpu_count()
+    ngram_range = (1, args.ngram_max)
+
+    with stage("load", timings):
+        texts, labels = load_training_data(args.csv, args.limit)
+        stop_words = preprocessing.load_stopwords()
+        logger.info("%d tweets, %d workers", len(texts), workers)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        with stage("preprocess", timings):
+            cleaned = preprocess_parallel(texts, stop_words, executor, args.chunk_size)
+            del texts
+
+        x_train, x_test, y_train, y_test = train_test_split(cleaned, labels, test_size=args.test_size, random_state=0)
+        del cleaned
+
+        if args.vectorizer == "tfidf":
+            with stage("vocabulary", timings):
+                vectorizer = fit_tfidf_vocabulary(x_train, executor, ngram_range, args.min_df, args.chunk_size)
+                logger.info("%d features", len(vectorizer.vocabulary_))
+
+    if args.vectorizer == "tfidf":
+        with stage("vectorize", timings):
+            train_features = transform_parallel(vectorizer, x_train, workers, args.chunk_size)
+            test_features = transform_parallel(vectorizer, x_test, workers, args.chunk_size)
+    else:
+        hashing = HashingVectorizer(n_features=2 ** args.hash_bits, alternate_sign=False, norm=None, ngram_range=ngram_range)
+        with stage("vectorize", timings):
+            train_counts = transform_parallel(hashing, x_train, workers, args.chunk_size)
+            test_counts = transform_parallel(hashing, x_test, workers, args.chunk_size)
+            tfidf = TfidfTransformer().fit(train_counts)
+            train_features = tfidf.transform(train_counts)
+            test_features = tfidf.transform(test_counts)
+            vectorizer = make_pipeline(hashing, tfidf)
+
+    with stage("fit", timings):
+        model = LogisticRegression(solver=args.solver, C=args.C, max_iter=args.max_iter, n_jobs=args.n_jobs)
+        model.fit(train_features, y_train)
+
+    with stage("evaluate", timings):
+        accuracy = accuracy_score(y_test, model.predict(test_features))
+        logger.info("test accuracy %.4f", accuracy)
+
+    with stage("save", timings):
+        save_pickle(model, args.model)
+        save_pickle(vectorizer, args.vectorizer_path)
+        if args.artifact_dir and args.vectorizer == "tfidf":
+            version = artifact.export_artifact(model, vectorizer, args.artifact_dir,
+                                               {"model": args.model, "vectorizer": args.vectorizer_path})
+            logger.info("exported artifact version %s", version)
+
+    timings["total"] = sum(timings.values())
+    logger.info("total %.2fs", timings["total"])
+    return {"accuracy": accuracy, "timings": timings}
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the TF-IDF + LogisticRegression sentiment model on all cores.")
+    parser.add_argument("--csv", default=dataset_cache.DATASET_CSV, help="Path to the training CSV")
+    parser.add_argument("--model", default=inference.MODEL_PATH, help="Where to write model.pkl")
+    parser.add_argument("--vectorizer-path", default=inference.VECTORIZER_PATH, help="Where to write vectorizer.pkl")
+    parser.add_argument("--artifact-dir", default=artifact.ARTIFACT_DIR, help="Also export a memory-mapped artifact here ('' to skip)")
+    parser.add_argument("--vectorizer", choices=["tfidf", "hashing"], default="tfidf", help="Feature extraction")
+    parser.add_argument("--hash-bits", type=int, default=DEFAULT_HASH_BITS, help="log2 of the hashing vectorizer's feature count")
+    parser.add_argument("--ngram-max", type=int, default=1, help="Largest n-gram size")
+    parser.add_argument("--min-df", type=int, default=1, help="Minimum document frequency for the TF-IDF vocabulary")
+    parser.add_argument("--solver", default="lbfgs", help="LogisticRegression solver")
+    parser.add_argument("--C", type=float, default=1.0, help="Inverse regularization strength")
+    parser.add_argument("--max-iter", type=int, default=100, help="Solver iterations")
+    parser.add_argument("--n-jobs", type=int, default=None, help="n_jobs passed to LogisticRegression")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Tweets per parallel task")
+    parser.add_argument("--test-size", type=float, default=0.2, help="Fraction held out for evaluation")
+    parser.add_argument("--limit", type=int, default=None, help="Train on a random subset of this many tweets")
+    parser.add_argument("--timings-out", help="Write accuracy and per-stage wall times to this JSON file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    result = train(args)
+    if args.timings_out:
+        with open(args.timings_out, 'w') as timings_file:
+            json.dump(result, timings_file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import time
+
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+
+import dataset_cache
+import inference
+import preprocessing
+from train import save_pickle
+
+# Streaming / out-of-core training mode.
+#
+# A stateless HashingVectorizer and an SGD logistic-regression classifier are
+# fed chunk by chunk with partial_fit, so peak memory depends on the chunk
+# size, never on the corpus size. The model is checkpointed periodically and
+# can later be updated with newly labelled tweets without reprocessing history.
+
+logger = logging.getLogger("train_incremental")
+
+DEFAULT_CHUNK_SIZE = 20000
+DEFAULT_HASH_BITS = 20
+DEFAULT_STRIPES = 16
+CLASSES = np.array([0, 1])
+
+# Sentiment140 targets: 0 = negative, 4 = positive; other values (2 = neutral) are skipped
+TARGET_CLASSES = {'0': 0, '4': 1}
+
+def make_vectorizer(hash_bits=DEFAULT_HASH_BITS):
+    return HashingVectorizer(n_features=2 ** hash_bits, alternate_sign=False, norm='l2')
+
+def make_classifier(alpha):
+    return SGDClassifier(loss='log_loss', alpha=alpha, random_state=0)
+
+def _stripe_lines(path, start, end):
+    with open(path, 'rb') as csv_file:
+        if start:
+            # The line running across start belongs to the previous stripe
+            csv_file.seek(start - 1)
+            csv_file.readline()
+        while csv_file.tell() < end:
+            line = csv_file.readline()
+            if not line:
+                break
+            yield line.decode('ISO-8859-1')
+
+def iter_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, stripes=DEFAULT_STRIPES):
+    """Yield (texts, labels) chunks from a Sentiment140-format CSV.
+
+    The training CSV is sorted by label, so reading it front to back would feed
+    SGD hundreds of thousands of negatives before the first positive. The file
+    is split into byte-range stripes that are read round-robin instead, which
+    mixes labels while holding only one chunk in memory. Rows must not contain
+    embedded newlines, which holds for the Sentiment140 files.
+    """
+    size = os.path.getsize(path)
+    stripes = max(1, min(stripes, size // 4096))
+    bounds = [size * i // stripes for i in range(stripes + 1)]
+    readers = [csv.reader(_stripe_lines(path, bounds[i], bounds[i + 1])) for i in range(stripes)]
+
+    texts = []
+    labels = []
+    while readers:
+        for reader in list(readers):
+            row = next(reader, None)
+            if row is None:
+                readers.remove(reader)
+                continue
+            label = TARGET_CLASSES.get(row[0]) if row else None
+            if label is None or len(row) < 6:
+                continue
+            texts.append(row[5])
+            labels.append(label)
+            if len(texts) == chunk_size:
+                yield texts, np.array(labels, dtype=np.int8)
+                texts = []
+                labels = []
+    if texts:
+        yield texts, np.array(labels, dtype=np.int8)
+
+def state_path(model_path):
+    return model_path + '.state.json'
+
+def save_checkpoint(model, vectorizer, state, model_path, vectorizer_path):
+    save_pickle(model, model_path)
+    save_pickle(vectorizer, vectorizer_path)
+    with open(state_path(model_path) + '.tmp', 'w') as state_file:
+        json.dump(state, state_file, indent=2)
+    os.replace(state_path(model_path) + '.tmp', state_path(model_path))
+    logger.info("checkpoint after %d rows", state["rows"])
+
+def load_checkpoint(model_path, vectorizer_path):
+    model, vectorizer = inference.load_pickles(model_path, vectorizer_path)
+    if not hasattr(model, 'partial_fit') or not isinstance(vectorizer, HashingVectorizer):
+        raise ValueError(f"{model_path} was not written by incremental training; retrain from scratch without --resume")
+    try:
+        with open(state_path(model_path)) as state_file:
+            state = json.load(state_file)
+    except OSError:
+        state = {"rows": 0, "chunks": 0, "sources": []}
+    return model, vectorizer, state
+
+def train_stream(paths, model, vectorizer, stop_words, state, args):
+    """Run partial_fit over every chunk of every path, with progressive validation.
+
+    Each chunk is scored before it is learned from, which gives an unbiased
+    running accuracy without holding out data.
+    """
+    correct = 0
+    evaluated = 0
+    start = time.perf_counter()
+    for path in paths:
+        for texts, labels in iter_chunks(path, args.chunk_size, args.stripes):
+            features = vectorizer.transform(preprocessing.clean_texts(texts, stop_words))
+            if state["rows"]:
+                correct += int((model.predict(features) == labels).sum())
+                evaluated += len(labels)
+            model.partial_fit(features, labels, classes=CLASSES)
+            state["rows"] += len(labels)
+            state["chunks"] += 1
+            if state["chunks"] % args.log_every == 0:
+                logger.info("%d rows, %.0f rows/s, progressive accuracy %.4f",
+                            state["rows"], state["rows"] / (time.perf_counter() - start),
+                            correct / evaluated if evaluated else float('nan'))
+            if args.checkpoint_every and state["chunks"] % args.checkpoint_every == 0:
+                save_checkpoint(model, vectorizer, state, args.model, args.vectorizer_path)
+        state["sources"].append(os.path.abspath(path))
+    state["progressive_accuracy"] = correct / evaluated if evaluated else None
+    return model
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or update the sentiment model out of core with partial_fit.")
+    parser.add_argument("paths", nargs="*", default=[dataset_cache.DATASET_CSV],
+                        help="Sentiment140-format CSV files to learn from")
+    parser.add_argument("--model", default=inference.MODEL_PATH, help="Where to write model.pkl")
+    parser.add_argument("--vectorizer-path", default=inference.VECTORIZER_PATH, help="Where to write vectorizer.pkl")
+    parser.add_argument("--resume", action="store_true", help="Update the existing incremental model instead of starting over")
+    parser.add_argument("--epochs", type=int, default=1, help="Passes over the input files")
+    parser.add_argument("--hash-bits", type=int, default=DEFAULT_HASH_BITS, help="log2 of the hashed feature count")
+    parser.add_argument("--alpha", type=float, default=1e-6, help="SGD regularization strength")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per partial_fit call")
+    parser.add_argument("--stripes", type=int, default=DEFAULT_STRIPES, help="Byte ranges read round-robin to mix labels")
+    parser.add_argument("--checkpoint-every", type=int, default=10, help="Chunks between checkpoints (0 disables)")
+    parser.add_argument("--log-every", type=int, default=5, help="Chunks between progress lines")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    stop_words = preprocessing.load_stopwords()
+    if args.resume:
+        model, vectorizer, state = load_checkpoint(args.model, args.vectorizer_path)
+        logger.info("resuming from %d rows", state["rows"])
+    else:
+        model, vectorizer = make_classifier(args.alpha), make_vectorizer(args.hash_bits)
+        state = {"rows": 0, "chunks": 0, "sources": []}
+
+    for epoch in range(args.epochs):
+        logger.info("epoch %d", epoch + 1)
+        train_stream(args.paths, model, vectorizer, stop_words, state, args)
+    save_checkpoint(model, vectorizer, state, args.model, args.vectorizer_path)
+    if state.get("progressive_accuracy") is not None:
+        logger.info("progressive accuracy %.4f", state["progressive_accuracy"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import math
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+import scipy.sparse as sp
+
+import dataset_cache
+import inference
+import preprocessing
+import train
+
+# Cross-validated hyperparameter search for the sentiment model.
+#
+# Every stage is cached on disk under --cache-dir, keyed by the dataset and the
+# split settings, so re-runs and new grids only pay for what changed:
+#   corpus.arrow                 cleaned (stemmed) tweets and labels, shuffled once
+#   features/<vectorizer>/<fold> fitted TF-IDF matrices per vectorizer config and
+#                                CV fold, plus "all" (full train split vs holdout)
+# Model configs are then screened with successive halving: every config is
+# cross-validated on a small training subset, the best 1/eta advance to eta
+# times more rows, and so on up to the full folds. Fits run in a process pool.
+# The top configs are refit on the whole train split and measured on the
+# holdout: accuracy, model size and single-tweet scoring latency. The
+# leaderboard marks the fastest model within --accuracy-budget of the best.
+#
+#   python tune.py --ngram-max 1,2 --min-df 1,3 --C 0.3,1,3 --models logreg,sgd
+
+logger = logging.getLogger("tune")
+
+DEFAULT_CACHE_DIR = "tune_cache"
+DEFAULT_FOLDS = 3
+DEFAULT_ETA = 3
+DEFAULT_MIN_RESOURCES = 20000
+DEFAULT_FINALISTS = 8
+DEFAULT_ACCURACY_BUDGET = 0.005
+LATENCY_SAMPLES = 500
+SEED = 0
+
+# Linear models the runner knows, with the hyperparameter each one is searched over
+MODEL_PARAMS = {"logreg": "C", "sgd": "alpha"}
+
+def parse_list(text, kind=float):
+    return [kind(value) for value in text.split(',') if value.strip()]
+
+def vectorizer_key(config):
+    return f"ng{config['ngram_max']}_df{config['min_df']}_sub{int(config['sublinear_tf'])}"
+
+def config_name(config):
+    param = MODEL_PARAMS[config["model"]]
+    return f"{vectorizer_key(config)}_{config['model']}_{param}{config[param]:g}"
+
+def build_configs(args):
+    configs = []
+    for ngram_max, min_df, sublinear_tf in itertools.product(args.ngram_max, args.min_df, args.sublinear_tf):
+        vectorizer = {"ngram_max": ngram_max, "min_df": min_df, "sublinear_tf": bool(sublinear_tf)}
+        for model in args.models:
+            param = MODEL_PARAMS[model]
+            for value in getattr(args, param):
+                configs.append(dict(vectorizer, model=model, **{param: value}))
+    return configs
+
+def make_vectorizer(config):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    return TfidfVectorizer(ngram_range=(1, config["ngram_max"]), min_df=config["min_df"], sublinear_tf=config["sublinear_tf"])
+
+def make_model(config, max_iter):
+    if config["model"] == "logreg":
+        from sklearn.linear_model import LogisticRegression
+        return LogisticRegression(C=config["C"], max_iter=max_iter)
+    from sklearn.linear_model import SGDClassifier
+    return SGDClassifier(loss="log_loss", alpha=config["alpha"], max_iter=max_iter, random_state=SEED)
+
+# Directory of the cached corpus and features for one dataset and split setting
+def cache_root(args):
+    settings = {
+        "source": dataset_cache.source_fingerprint(args.csv) if os.path.exists(args.csv) else dataset_cache.cached_fingerprint(),
+        "limit": args.limit, "test_size": args.test_size, "folds": args.folds, "seed": SEED,
+    }
+    digest = hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+    return os.path.join(args.cache_dir, digest)
+
+def build_corpus(root, args, executor):
+    """Write the cleaned, shuffled corpus once; returns its metadata."""
+    meta_path = os.path.join(root, "corpus.json")
+    if os.path.exists(meta_path):
+        with open(meta_path) as meta_file:
+            return json.load(meta_file)
+    os.makedirs(root, exist_ok=True)
+    start = time.perf_counter()
+    texts, labels = train.load_training_data(args.csv, args.limit)
+    cleaned = train.preprocess_parallel(texts, preprocessing.load_stopwords(), executor)
+    # The CSV is sorted by label, so shuffle before splitting into folds and holdout
+    order = np.random.default_rng(SEED).permutation(len(cleaned))
+    table = pa.table({"text": pa.array([cleaned[i] for i in order], pa.string()), "label": pa.array(labels[order])})
+    with pa.OSFile(os.path.join(root, "corpus.arrow.tmp"), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(os.path.join(root, "corpus.arrow.tmp"), os.path.join(root, "corpus.arrow"))
+    meta = {"rows": len(cleaned), "train_rows": len(cleaned) - int(len(cleaned) * args.test_size), "folds": args.folds}
+    with open(meta_path, 'w') as meta_file:
+        json.dump(meta, meta_file)
+    logger.info("Cleaned %d tweets in %.1fs", len(cleaned), time.perf_counter() - start)
+    return meta
+
+# Row ranges (train, test) of a CV fold, or of the full train split vs the holdout for fold "all"
+def fold_rows(meta, fold):
+    train_rows = meta["train_rows"]
+    if fold == "all":
+        return np.arange(train_rows), np.arange(train_rows, meta["rows"])
+    bounds = np.linspace(0, train_rows, meta["folds"] + 1).astype(np.int64)
+    test = np.arange(bounds[fold], bounds[fold + 1])
+    return np.concatenate([np.arange(bounds[fold]), np.arange(bounds[fold + 1], train_rows)]), test
+
+# Worker state: the cache root and the corpus, read on first use
+_root = None
+_meta = None
+_texts = None
+_labels = None
+
+def init_worker(root, meta):
+    global _root, _meta
+    _root = root
+    _meta = meta
+    # One BLAS thread per process; the pool already uses every core
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(1)
+
+def _corpus(with_texts=False):
+    global _texts, _labels
+    if _labels is None or (with_texts and _texts is None):
+        with pa.memory_map(os.path.join(_root, "corpus.arrow"), 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+        _labels = table.column("label").to_numpy()
+        if with_texts:
+            _texts = table.column("text").to_pylist()
+    return _texts, _labels
+
+def _feature_dir(config, fold):
+    return os.path.join(_root, "features", vectorizer_key(config), str(fold))
+
+def build_features(config, fold):
+    """Fit the config's vectorizer on a fold's train rows and cache both matrices."""
+    directory = _feature_dir(config, fold)
+    if os.path.exists(os.path.join(directory, "done")):
+        return 0.0
+    start = time.perf_counter()
+    texts, _ = _corpus(with_texts=True)
+    train_rows, test_rows = fold_rows(_meta, fold)
+    vectorizer = make_vectorizer(config)
+    train_features = vectorizer.fit_transform([texts[i] for i in train_rows])
+    test_features = vectorizer.transform([texts[i] for i in test_rows])
+    os.makedirs(directory, exist_ok=True)
+    sp.save_npz(os.path.join(directory, "train.npz"), train_features, compressed=False)
+    sp.save_npz(os.path.join(directory, "test.npz"), test_features, compressed=False)
+    if fold == "all":
+        train.save_pickle(vectorizer, os.path.join(directory, "vectorizer.pkl"))
+    # Marks the directory complete; an interrupted build is redone
+    open(os.path.join(directory, "done"), 'w').close()
+    return time.perf_counter() - start
+
+def _fit(config, fold, rows, max_iter):
+    _, labels = _corpus()
+    train_rows, test_rows = fold_rows(_meta, fold)
+    directory = _feature_dir(config, fold)
+    train_features = sp.load_npz(os.path.join(directory, "train.npz"))
+    if rows is not None:
+        train_features, train_rows = train_features[:rows], train_rows[:rows]
+    model = make_model(config, max_iter).fit(train_features, labels[train_rows])
+    test_features = sp.load_npz(os.path.join(directory, "test.npz"))
+    accuracy = float(np.mean(model.predict(test_features) == labels[test_rows]))
+    return model, accuracy
+
+def evaluate(config, fold, rows, max_iter):
+    """Accuracy on a CV fold of the config trained on the fold's first rows training tweets."""
+    return _fit(config, fold, rows, max_iter)[1]
+
+def finalize(config, max_iter):
+    """Refit on the whole train split; returns (model, holdout accuracy, fit seconds)."""
+    start = time.perf_counter()
+    model, accuracy = _fit(config, "all", None, max_iter)
+    return model, accuracy, time.perf_counter() - start
+
+def load_vectorizer(root, config):
+    with open(os.path.join(root, "features", vectorizer_key(config), "all", "vectorizer.pkl"), 'rb') as vectorizer_file:
+        return pickle.load(vectorizer_file)
+
+def holdout_sample(root, meta, size=LATENCY_SAMPLES):
+    with pa.memory_map(os.path.join(root, "corpus.arrow"), 'r') as source:
+        texts = pa.ipc.open_file(source).read_all().column("text")
+    return texts.slice(meta["train_rows"], size).to_pylist()
+
+# Size and single-tweet scoring latency the app would see, measured in this process one model at a time
+def measure(model, vectorizer, sample):
+    inference.predict_cleaned(sample[:1], model, vectorizer)
+    latencies = []
+    for text in sample:
+        start = time.perf_counter()
+        inference.predict_cleaned([text], model, vectorizer)
+        latencies.append(time.perf_counter() - start)
+    size = len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)) + len(pickle.dumps(vectorizer, protocol=pickle.HIGHEST_PROTOCOL))
+    return {"features": len(vectorizer.vocabulary_), "size_mb": size / 1e6, "p50_us": float(np.median(latencies) * 1e6)}
+
+def successive_halving(configs, meta, executor, args):
+    """Screen configs on growing training subsets; returns {name: {"rows", "cv_accuracy"}} of each config's last rung."""
+    fold_train_rows = len(fold_rows(meta, 0)[0])
+    rows = min(args.min_resources, fold_train_rows) if args.min_resources > 0 else fold_train_rows
+    candidates = list(configs)
+    results = {}
+    rung = 0
+    while True:
+        futures = {
+            (config_name(config), fold): executor.submit(evaluate, config, fold, rows, args.max_iter)
+            for config in candidates for fold in range(meta["folds"])
+        }
+        for config in candidates:
+            name = config_name(config)
+            accuracies = [futures[name, fold].result() for fold in range(meta["folds"])]
+            results[name] = {"rung": rung, "rows": rows, "cv_accuracy": float(np.mean(accuracies)),
+                             "cv_std": float(np.std(accuracies))}
+        logger.info("Rung %d: %d configs on %d rows, best CV accuracy %.4f", rung, len(candidates), rows,
+                    max(results[config_name(config)]["cv_accuracy"] for config in candidates))
+        if rows >= fold_train_rows or len(candidates) <= 1:
+            return results
+        candidates.sort(key=lambda config: results[config_name(config)]["cv_accuracy"], reverse=True)
+        candidates = candidates[:max(1, math.ceil(len(candidates) / args.eta))]
+        rows = min(rows * args.eta, fold_train_rows)
+        rung += 1
+
+def tune(args):
+    configs = build_configs(args)
+    if not configs:
+        raise ValueError("The grid is empty")
+    root = cache_root(args)
+    workers = args.workers or os.cpu_count()
+    timings = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        with train.stage("corpus", timings):
+            meta = build_corpus(root, args, executor)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(root, meta)) as executor:
+        vectorizer_configs = list({vectorizer_key(config): config for config in configs}.values())
+        with train.stage("features", timings):
+            list(executor.map(build_features, *zip(*[
+                (config, fold) for config in vectorizer_configs for fold in list(range(meta["folds"])) + ["all"]
+            ])))
+        with train.stage("halving", timings):
+            screened = successive_halving(configs, meta, executor, args)
+        ranked = sorted(configs, key=lambda config: (screened[config_name(config)]["rung"],
+                                                     screened[config_name(config)]["cv_accuracy"]), reverse=True)
+        finalists = ranked[:args.finalists]
+        with train.stage("finalists", timings):
+            fitted = list(executor.map(finalize, finalists, [args.max_iter] * len(finalists)))
+    leaderboard = []
+    models = {}
+    with train.stage("measure", timings):
+        sample = holdout_sample(root, meta)
+        for config, (model, accuracy, fit_seconds) in zip(finalists, fitted):
+            name = config_name(config)
+            models[name] = model
+            leaderboard.append(dict(config, name=name, **screened[name], accuracy=accuracy, fit_s=fit_seconds,
+                                    **measure(model, load_vectorizer(root, config), sample)))
+    leaderboard.sort(key=lambda entry: entry["accuracy"], reverse=True)
+    best = leaderboard[0]["accuracy"]
+    within_budget = [entry for entry in leaderboard if entry["accuracy"] >= best - args.accuracy_budget]
+    recommended = min(within_budget, key=lambda entry: entry["p50_us"])
+    for entry in leaderboard:
+        entry["recommended"] = entry is recommended
+    result = {"configs": len(configs), "rows": meta["rows"], "leaderboard": leaderboard,
+              "screened": screened, "timings": timings, "accuracy_budget": args.accuracy_budget}
+    return result, models[recommended["name"]], load_vectorizer(root, recommended)
+
+def format_leaderboard(leaderboard):
+    lines = [f"{'':2}{'config':<40} {'holdout':>8} {'cv':>8} {'features':>9} {'size MB':>8} {'p50 us':>8} {'fit s':>7}"]
+    for entry in leaderboard:
+        lines.append(f"{'*' if entry['recommended'] else '':2}{entry['name']:<40} {entry['accuracy']:>8.4f} "
+                     f"{entry['cv_accuracy']:>8.4f} {entry['features']:>9} {entry['size_mb']:>8.2f} "
+                     f"{entry['p50_us']:>8.1f} {entry['fit_s']:>7.2f}")
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Search vectorizer and linear model settings with cached features and successive halving.")
+    parser.add_argument("--csv", default=dataset_cache.DATASET_CSV, help="Path to the training CSV")
+    parser.add_argument("--limit", type=int, default=None, help="Tune on a random subset of this many tweets")
+    parser.add_argument("--test-size", type=float, default=0.2, help="Fraction held out for the leaderboard")
+    parser.add_argument("--folds", type=int, default=DEFAULT_FOLDS, help="Cross-validation folds on the train split")
+    parser.add_argument("--ngram-max", type=lambda text: parse_list(text, int), default=[1], help="Largest n-gram sizes, e.g. 1,2")
+    parser.add_argument("--min-df", type=lambda text: parse_list(text, int), default=[1], help="Minimum document frequencies, e.g. 1,3,5")
+    parser.add_argument("--sublinear-tf", type=lambda text: parse_list(text, int), default=[0], help="0,1 to try both tf scalings")
+    parser.add_argument("--models", type=lambda text: [model for model in text.split(',') if model], default=["logreg"],
+                        help=f"Comma separated models: {', '.join(MODEL_PARAMS)}")
+    parser.add_argument("--C", type=parse_list, default=[1.0], help="logreg inverse regularization values")
+    parser.add_argument("--alpha", type=parse_list, default=[1e-5], help="sgd regularization values")
+    parser.add_argument("--max-iter", type=int, default=200, help="Solver iterations")
+    parser.add_argument("--eta", type=int, default=DEFAULT_ETA, help="Keep 1/eta of the configs per rung and grow the rows eta times")
+    parser.add_argument("--min-resources", type=int, default=DEFAULT_MIN_RESOURCES, help="Training rows in the first rung (0: no halving)")
+    parser.add_argument("--finalists", type=int, default=DEFAULT_FINALISTS, help="Configs refit and measured for the leaderboard")
+    parser.add_argument("--accuracy-budget", type=float, default=DEFAULT_ACCURACY_BUDGET, help="Recommend the fastest model this close to the best accuracy")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Where the cleaned corpus and feature matrices are kept")
+    parser.add_argument("--output", default="tune_results.json", help="Write the leaderboard JSON here")
+    parser.add_argument("--save", action="store_true", help="Write the recommended model to --model and --vectorizer-path")
+    parser.add_argument("--model", default=inference.MODEL_PATH, help="Where --save writes model.pkl")
+    parser.add_argument("--vectorizer-path", default=inference.VECTORIZER_PATH, help="Where --save writes vectorizer.pkl")
+    args = parser.parse_args()
+    unknown = set(args.models) - set(MODEL_PARAMS)
+    if unknown:
+        parser.error(f"unknown models: {', '.join(sorted(unknown))}")
+    if args.eta < 2:
+        parser.error("--eta must be at least 2")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    result, model, vectorizer = tune(args)
+    print(format_leaderboard(result["leaderboard"]))
+    with open(args.output, 'w') as output_file:
+        json.dump(result, output_file, indent=2)
+    print(f"wrote {args.output}")
+    if args.save:
+        train.save_pickle(model, args.model)
+        train.save_pickle(vectorizer, args.vectorizer_path)
+        print(f"saved the recommended model to {args.model} and {args.vectorizer_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import dataset_cache
+import metrics
+from search_index import (
+    INDEX_DIR,
+    build_postings,
+    find_key,
+    intersect_all,
+    load_arrays,
+    save_arrays,
+)
+
+# Per-user index for the "Get tweets from user" view.
+#
+# Rows are grouped by lowercased user name once:
+#   keys      - sorted unique lowercased user names (fixed-width bytes)
+#   offsets   - rows[offsets[i]:offsets[i + 1]] are the rows of keys[i]
+#   rows      - dataset row ids ordered by user
+#   positives - number of positive tweets per user
+# Partial names are matched with a trigram index over the keys, and names
+# shorter than a trigram by scanning the keys, so neither kind of lookup
+# scans the user column.
+
+NGRAM = 3
+
+USER_ARRAYS = ("keys", "offsets", "rows", "positives", "gram_vocab", "gram_offsets", "gram_postings")
+
+def _ngrams(key):
+    return list({key[i:i + NGRAM] for i in range(len(key) - NGRAM + 1)})
+
+class UserIndex:
+    def __init__(self, keys, offsets, rows, positives, gram_vocab, gram_offsets, gram_postings):
+        self.keys = keys
+        self.offsets = offsets
+        self.rows = rows
+        self.positives = positives
+        self.gram_vocab = gram_vocab
+        self.gram_offsets = gram_offsets
+        self.gram_postings = gram_postings
+
+    @classmethod
+    def build(cls, users, targets=None):
+        codes, uniques = pd.factorize(users.astype(object).str.lower(), sort=True)
+        rows = np.argsort(codes, kind='stable').astype(np.uint32)
+        offsets = np.zeros(len(uniques) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=len(uniques)), out=offsets[1:])
+        if targets is not None:
+            is_positive = (targets.astype(object) == "Positive").to_numpy(dtype=bool)
+            positives = np.bincount(codes, weights=is_positive, minlength=len(uniques)).astype(np.uint32)
+        else:
+            positives = np.zeros(len(uniques), dtype=np.uint32)
+
+        keys = np.array([user.encode('utf-8') for user in uniques], dtype=bytes)
+        grams = pd.Series([_ngrams(user) for user in uniques], dtype=object)
+        gram_vocab, gram_offsets, gram_postings = build_postings([(0, grams)])
+        return cls(keys, offsets, rows, positives, gram_vocab, gram_offsets, gram_postings)
+
+    def save(self, directory, fingerprint):
+        save_arrays(directory, "users", {name: getattr(self, name) for name in USER_ARRAYS}, fingerprint)
+
+    @classmethod
+    def load(cls, directory, fingerprint):
+        arrays = load_arrays(directory, "users", USER_ARRAYS, fingerprint)
+        if arrays is None:
+            return None
+        return cls(**arrays)
+
+    def __len__(self):
+        return len(self.keys)
+
+    # Key id of an exact (case-insensitive) user name, -1 if unknown
+    def find_user(self, username):
+        return find_key(self.keys, username.lower().encode('utf-8'))
+
+    # Key ids of users whose name contains the given text
+    def find_partial(self, text):
+        needle = text.lower().encode('utf-8')
+        if len(needle) < NGRAM:
+            # Too short for the trigram postings; scan the distinct names, far fewer than the rows
+            return np.flatnonzero(np.char.find(self.keys, needle) >= 0)
+        gram_lists = []
+        for gram in _ngrams(needle.decode('utf-8')):
+            position = find_key(self.gram_vocab, gram.encode('utf-8'))
+            if position < 0:
+                return np.empty(0, dtype=np.int64)
+            gram_lists.append(self.gram_postings[self.gram_offsets[position]:self.gram_offsets[position + 1]])
+        candidates = intersect_all(gram_lists)
+        return np.array([key_id for key_id in candidates if needle in self.keys[key_id]], dtype=np.int64)
+
+    # Exact match first, then users whose name contains username
+    @metrics.timed("user_lookup")
+    def match(self, username):
+        key_id = self.find_user(username)
+        if key_id >= 0:
+            return np.array([key_id], dtype=np.int64)
+        return self.find_partial(username)
+
+    # Dataset row ids of the given users
+    def rows_for(self, key_ids):
+        if len(key_ids) == 1:
+            key_id = key_ids[0]
+            return self.rows[self.offsets[key_id]:self.offsets[key_id + 1]]
+        return np.sort(np.concatenate([self.rows[self.offsets[k]:self.offsets[k + 1]] for k in key_ids]))
+
+    # Tweet count and sentiment ratio across the given users
+    def stats(self, key_ids):
+        key_ids = np.asarray(key_ids, dtype=np.int64)
+        tweets = int((self.offsets[key_ids + 1] - self.offsets[key_ids]).sum())
+        positive = int(self.positives[key_ids].sum())
+        return {
+            "users": len(key_ids),
+            "tweets": tweets,
+            "positive": positive,
+            "negative": tweets - positive,
+            "positive_ratio": positive / tweets if tweets else 0.0,
+        }
+
+# Load the persisted user index for the current dataset cache, rebuilding it if stale
+@metrics.timed("user_index_load")
+def load_or_build(directory=INDEX_DIR, csv_path=dataset_cache.DATASET_CSV, cache_path=dataset_cache.CACHE_FILE):
+    if dataset_cache.is_stale(csv_path, cache_path):
+        dataset_cache.build_cache(csv_path, cache_path)
+    fingerprint = dataset_cache.cached_fingerprint(cache_path)
+    index = UserIndex.load(directory, fingerprint)
+    if index is None:
+        dataset = dataset_cache.load_dataset(['user', 'target'], csv_path, cache_path)
+        UserIndex.build(dataset['user'], dataset['target']).save(directory, fingerprint)
+        index = UserIndex.load(directory, fingerprint)
+    return index
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the per-user index for the dataset user lookup.")
+    parser.add_argument("--csv", default=dataset_cache.DATASET_CSV, help="Path to the source CSV")
+    parser.add_argument("--dir", default=INDEX_DIR, help="Directory to write the index to")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = load_or_build(args.dir, args.csv)
+    print(f"User index with {len(index)} users ready in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import argparse
+import gc
+import logging
+import os
+import signal
+import sys
+import time
+
+# Multi-process serving that shares read-only memory between workers.
+#
+# The parent imports everything, loads the model (from the memory-mapped
+# artifact), the dataset cache and the search index, runs one warm-up
+# prediction and then forks the workers. The mapped arrays live in the page
+# cache once for the whole host, and the parent's heap (imported modules,
+# stopwords, small model objects) is shared copy-on-write; gc.freeze() keeps
+# the collector from writing to those pages. Each worker builds only its own
+# batcher and prediction cache and listens on the same port with
+# SO_REUSEPORT, so the kernel spreads connections across them.
+#
+#   python workers.py serve --workers 4 --dataset
+#   python workers.py report <pid> [<pid> ...]
+#
+# The report reads /proc/<pid>/smaps_rollup. RSS counts shared pages in every
+# process; PSS splits them between the processes that map them, so the PSS
+# total is the real memory cost and a worker's private MB is what adding one
+# more costs. A running parent logs the report on SIGUSR1.
+# /metrics and /health describe the worker that answered.
+
+logger = logging.getLogger("workers")
+
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+# Workers that exit sooner than this after starting are restarted with a delay
+MIN_WORKER_LIFETIME = 1.0
+
+# The parent blocks these and takes them with sigwaitinfo(), so stopping, reporting
+# and restarting all run in the wait loop instead of in signal handlers
+WAITED_SIGNALS = {signal.SIGCHLD, signal.SIGINT, signal.SIGTERM, signal.SIGUSR1, signal.SIGALRM}
+
+def memory_usage(pid):
+    """Memory of one process from /proc/<pid>/smaps_rollup, in MB."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as smaps:
+        for line in smaps:
+            name, _, rest = line.partition(':')
+            if name in SMAPS_FIELDS:
+                values[name] = int(rest.split()[0]) / 1024
+    return {
+        "rss_mb": values.get("Rss", 0.0),
+        "pss_mb": values.get("Pss", 0.0),
+        "shared_mb": values.get("Shared_Clean", 0.0) + values.get("Shared_Dirty", 0.0),
+        "private_mb": values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0),
+    }
+
+def memory_report(processes):
+    """Table of memory per process; processes maps pid to a role name."""
+    lines = [f"{'pid':>8} {'role':<10} {'rss MB':>9} {'pss MB':>9} {'shared MB':>10} {'private MB':>11}"]
+    total_rss = total_pss = 0.0
+    for pid, role in processes.items():
+        try:
+            usage = memory_usage(pid)
+        except OSError:
+            lines.append(f"{pid:>8} {role:<10} {'gone':>9}")
+            continue
+        total_rss += usage["rss_mb"]
+        total_pss += usage["pss_mb"]
+        lines.append(f"{pid:>8} {role:<10} {usage['rss_mb']:>9.1f} {usage['pss_mb']:>9.1f} "
+                     f"{usage['shared_mb']:>10.1f} {usage['private_mb']:>11.1f}")
+    lines.append(f"{'total':>8} {'':<10} {total_rss:>9.1f} {total_pss:>9.1f}")
+    return '\n'.join(lines)
+
+# Load and touch everything the workers share before the first fork
+def preload(args):
+    import fast_path
+    import inference
+    import serve
+
+    # Artifact scorers then look terms up in the mapped vocabulary, not a per-worker dict
+    fast_path.SHARED_VOCABULARY = True
+    resources = serve.load_resources(args)
+    loaded = resources["handle"].get()
+    # Imports the stemmer and compiles the fast path here rather than in every worker
+    inference.predict_sentiment("warm up the workers", loaded.model, loaded.vectorizer, resources["stop_words"])
+    if loaded.version.startswith("pkl-"):
+        logger.warning("Serving unpickled models; export an artifact so workers map the model arrays instead")
+    return resources
+
+# Runs in the forked child and never returns
+def _run_worker(args, resources):
+    from aiohttp import web
+
+    import serve
+
+    for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGUSR1, signal.SIGALRM):
+        signal.signal(signum, signal.SIG_DFL)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, WAITED_SIGNALS)
+    status = 0
+    try:
+        app = serve.build_app(args, resources)
+        serve.start_reporters(args)
+        web.run_app(app, host=args.host, port=args.port, reuse_port=True, access_log=serve.access_log(args), print=None)
+    except Exception:
+        logger.exception("Worker %d failed", os.getpid())
+        status = 1
+    finally:
+        logging.shutdown()
+        os._exit(status)
+
+def run_workers(args, resources):
+    workers = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(args, resources)
+        workers[pid] = time.monotonic()
+
+    def log_report():
+        processes = {os.getpid(): "parent"}
+        processes.update((pid, "worker") for pid in workers)
+        logger.info("Memory per process:\n%s", memory_report(processes))
+
+    def stop():
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    # SIGCHLD signals merge, so collect every worker that has exited
+    def reap():
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started = workers.pop(pid, None)
+            if started is None or stopping:
+                continue
+            logger.warning("Worker %d exited with status %d, starting a new one", pid, os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                time.sleep(MIN_WORKER_LIFETIME)
+            spawn()
+
+    # Freeze the preloaded objects so garbage collection in the workers leaves their pages shared
+    gc.collect()
+    gc.freeze()
+    # Blocked before the first fork, so no signal arrives while nothing waits for it
+    signal.pthread_sigmask(signal.SIG_BLOCK, WAITED_SIGNALS)
+    for _ in range(args.workers):
+        spawn()
+    logger.info("%d workers serving on %s:%d", args.workers, args.host, args.port)
+    if args.report_after > 0:
+        signal.alarm(args.report_after)
+
+    while workers:
+        signum = signal.sigwaitinfo(WAITED_SIGNALS).si_signo
+        if signum in (signal.SIGINT, signal.SIGTERM):
+            stop()
+        elif signum in (signal.SIGUSR1, signal.SIGALRM):
+            log_report()
+        reap()
+
+def main():
+    import serve
+
+    parser = argparse.ArgumentParser(description="Run the HTTP service as several processes sharing read-only memory.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Preload, then fork workers that share one port")
+    serve.add_arguments(serve_parser)
+    serve_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: all cores)")
+    serve_parser.add_argument("--report-after", type=int, default=30, help="Log the memory report this many seconds after start (0 disables)")
+    report_parser = subparsers.add_parser("report", help="Print RSS/PSS of running processes, e.g. workers or Streamlit servers")
+    report_parser.add_argument("pids", type=int, nargs='+')
+    args = parser.parse_args()
+
+    if args.command == "report":
+        print(memory_report({pid: "process" for pid in args.pids}))
+        return
+    if not sys.platform.startswith("linux"):
+        sys.exit("error: workers.py needs fork and SO_REUSEPORT (Linux)")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(process)d %(name)s %(levelname)s %(message)s")
+    run_workers(args, preload(args))
+
+if __name__ == "__main__":
+    main()